@@ -0,0 +1,81 @@
+"""
+Per-call cost of PromptBuilder before/after the in-memory template store.
+
+    python -m benchmarks.prompt_builder_bench [iterations]
+
+"before" replays the old path (os.path.exists + five file reads per call);
+"after" is the current builder. The language is passed explicitly so
+language detection does not hide the template cost.
+"""
+import os
+import sys
+import time
+import statistics
+from server.services.prompt_builder import PromptBuilder
+from server.services.template_store import PROMPT_DIR
+
+COMBINATIONS = [
+    ("es", "twitter", "20-25", "Spanish (Argentina)"),
+    ("en", "linkedin", "26-85", "English (United Kingdom)"),
+    ("fr", "instagram", "16-19", "French (France)"),
+    ("es", "linkedin", "08-11", "English (Canada)"),
+]
+
+
+def _read(path: str) -> str:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read()
+    except Exception:
+        return ""
+
+
+def build_prompt_from_disk(builder: PromptBuilder, platform: str, age_range: str, region: str, language: str) -> str:
+    """Previous implementation: every call hits the filesystem"""
+    normalized_region = builder.normalize_region(region)
+    adapt = normalized_region.split("_")[0] == language
+    paths = {
+        "base": os.path.join(PROMPT_DIR, "base.txt"),
+        "language": os.path.join(PROMPT_DIR, "languages", f"{language}.txt"),
+        "platform": os.path.join(PROMPT_DIR, "platforms", f"{platform}.txt"),
+        "age": os.path.join(PROMPT_DIR, "age_groups", f"{age_range}.txt"),
+        "dialect": os.path.join(PROMPT_DIR, "dialects", f"{normalized_region}.txt" if adapt else "default.txt"),
+    }
+    if not os.path.exists(paths["language"]):
+        paths["language"] = os.path.join(PROMPT_DIR, "languages", "en.txt")
+    components = {key: _read(path) for key, path in paths.items()}
+    return "\n\n".join(components[key] for key in ("base", "language", "dialect", "platform", "age"))
+
+
+def _measure(fn, iterations: int) -> list:
+    samples = []
+    for i in range(iterations):
+        language, platform, age_range, region = COMBINATIONS[i % len(COMBINATIONS)]
+        start = time.perf_counter()
+        fn(platform, age_range, region, language)
+        samples.append((time.perf_counter() - start) * 1e6)
+    return samples
+
+
+def _report(name: str, samples: list):
+    samples = sorted(samples)
+    p99 = samples[int(len(samples) * 0.99) - 1]
+    print(f"{name:<8} mean {statistics.mean(samples):8.1f} us   median {statistics.median(samples):8.1f} us   p99 {p99:8.1f} us")
+
+
+def main(iterations: int = 5000):
+    from loguru import logger
+    logger.remove()  # build_prompt logs on every call
+
+    builder = PromptBuilder()
+    before = _measure(lambda p, a, r, l: build_prompt_from_disk(builder, p, a, r, l), iterations)
+    after = _measure(lambda p, a, r, l: builder.build_prompt("", p, a, r, l), iterations)
+
+    print(f"PromptBuilder.build_prompt, {iterations} calls over {len(COMBINATIONS)} combinations")
+    _report("before", before)
+    _report("after", after)
+    print(f"speedup  x{statistics.mean(before) / statistics.mean(after):.1f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000)
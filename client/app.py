@@ -6,6 +6,8 @@ import base64
 import os
 
 BASE_URL = os.getenv("BACKEND_URL", "http://backend:8000")
+# Chat traffic goes ahead of batch jobs in the backend rate-limit queue
+HEADERS = {"X-Request-Priority": "interactive"}
 
 
 API_ENDPOINTS = {
@@ -33,7 +35,7 @@ def chat_wrapper(message, history, model, audience, platform, region, llm_model_
         payload["detail_level"] = "simple"  # Puedes cambiar a "advanced" si lo prefieres
 
     try:
-        response = requests.post(API_ENDPOINTS[model], json=payload)
+        response = requests.post(API_ENDPOINTS[model], json=payload, headers=HEADERS)
         response.raise_for_status()
         json_response = response.json()
 
@@ -318,7 +320,7 @@ img {
     def generate_image_ui(prompt):
         print(f"[DEBUG] Prompt received: {prompt}")
         try:
-            response = requests.post("http://127.0.0.1:8000/images/generate", json={"prompt": prompt})
+            response = requests.post("http://127.0.0.1:8000/images/generate", json={"prompt": prompt}, headers=HEADERS)
             response.raise_for_status()
 
             # Convertir bytes directamente a imagen PIL
@@ -1,16 +1,21 @@
-from typing import Dict, Any, List
+from typing import Dict, Any, List, AsyncIterator, Callable, Tuple
 from server.tools.yahoo_data import YahooFetcher
-from server.services.lm_engine import LMEngine
+from server.services.lm_engine import get_engine
+from server.services.model_router import model_router
+from server.services.output_budget import limits_for
+from server.services.rate_limiter import RateLimitExceeded
+from server.services.token_budget import PromptSection
 from server.database.chroma_db import query_chroma_db
+from server.utils.executors import run_in
 from loguru import logger
 from datetime import datetime
 import json
 import re
+import textwrap
 
 class FinanceAgent:
     def __init__(self, model_name: str = "llama-3.1-8b-instant"):
         self.yahoo = YahooFetcher()
-        self.lm = LMEngine(model_name)
         self.current_model = model_name
         self.bias_log: List[Dict] = []
 
@@ -64,7 +69,41 @@ class FinanceAgent:
             r"michael kremer"
         ]
     async def run(self, request) -> Dict[str, Any]:
-        context = {
+        context = self._build_context(request)
+
+        try:
+            full_prompt = await self._prepare_prompt(request.prompt, context)
+            # The user-picked model is kept unless it misses its deadline
+            completion = await model_router.complete(
+                full_prompt,
+                preferred=self.current_model,
+                latency_budget_ms=getattr(request, "latency_budget_ms", None),
+                cache_scope="agent",
+                limits=limits_for(request.platform, request.audience)
+            )
+            return self._build_result(completion.text, context, completion.model, completion.truncated)
+
+        except RateLimitExceeded:
+            raise
+        except Exception as e:
+            logger.error(f"Processing failed: {str(e)}")
+            return await self._fallback_response(request.prompt, context)
+
+    async def run_stream(self, request) -> Tuple[AsyncIterator[str], Callable[[str], Dict[str, Any]]]:
+        """
+        Streaming variant of run: returns the token stream plus a finalizer
+        that applies the output bias scan once the full text is available.
+        """
+        context = self._build_context(request)
+        full_prompt = await self._prepare_prompt(request.prompt, context)
+        model = model_router.select(self.current_model, getattr(request, "latency_budget_ms", None))
+        stream = get_engine(model).astream(
+            model_router.fit(full_prompt, model), cache_scope="agent", limits=limits_for(request.platform, request.audience)
+        )
+        return stream, lambda output: self._build_result(output, context, model.value, stream.truncated)
+
+    def _build_context(self, request) -> Dict:
+        return {
             "platform": request.platform,
             "audience": request.audience,
             "region": self._neutralize_region(request.region),
@@ -72,25 +111,25 @@ class FinanceAgent:
             "disclosures": []
         }
 
-        try:
-            self._detect_input_bias(request.prompt)
-            strategy = await self._determine_strategy(request.prompt)
-            logger.info(f"Model: {self.current_model} | Strategy: {strategy}")
-            result = await self._execute_strategy(strategy, request.prompt, context)
-            processed_output = self._scan_output_bias(result, context)
-
-            return {
-                "output": processed_output,
-                "sources": context["sources"],
-                "disclosures": context["disclosures"],
-                "model_used": self.current_model
-            }
+    async def _prepare_prompt(self, prompt: str, context: Dict) -> List[PromptSection]:
+        self._detect_input_bias(prompt)
+        strategy = await self._determine_strategy(prompt)
+        logger.info(f"Model: {self.current_model} | Strategy: {strategy}")
+        return await self._execute_strategy(strategy, prompt, context)
 
-        except Exception as e:
-            logger.error(f"Processing failed: {str(e)}")
-            return await self._fallback_response(request.prompt, context)
+    def _build_result(self, output: str, context: Dict, model_used: str, truncated: bool = False) -> Dict[str, Any]:
+        if model_used != self.current_model:
+            context["disclosures"].append(f"Answered by {model_used} after {self.current_model} was too slow or unavailable")
+        return {
+            "output": self._scan_output_bias(output, context),
+            "sources": context["sources"],
+            "disclosures": context["disclosures"],
+            "model_used": model_used,
+            "truncated": truncated
+        }
 
-    async def _execute_strategy(self, strategy: str, prompt: str, context: Dict) -> str:
+    async def _execute_strategy(self, strategy: str, prompt: str, context: Dict) -> List[PromptSection]:
+        """Runs the data gathering of a strategy and returns the sections of the final LLM prompt"""
         strategies = {
             "yahoo": self._yahoo_strategy,
             "simple_rag": self._simple_rag_strategy,
@@ -99,32 +138,31 @@ class FinanceAgent:
         }
         return await strategies[strategy](prompt, context)
 
-    async def _yahoo_strategy(self, prompt: str, context: Dict) -> str:
-        data = self.yahoo.fetch(prompt)
+    async def _yahoo_strategy(self, prompt: str, context: Dict) -> List[PromptSection]:
+        data = await run_in("io", self.yahoo.fetch, prompt)
         context["sources"].append("Yahoo Finance")
 
         if not self._validate_source(data, "western"):
             context["disclosures"].append("Market data may be Western-focused")
 
-        return await self._debiased_query(
-            f"Market Data: {data}\nQuestion: {prompt}", context
-        )
+        return self._debiased_prompt(prompt, context, [
+            PromptSection("market_data", f"Market Data: {data}", priority=2, trimmable=True)
+        ])
 
-    async def _simple_rag_strategy(self, prompt: str, context: Dict) -> str:
-        docs = query_chroma_db(prompt)
+    async def _simple_rag_strategy(self, prompt: str, context: Dict) -> List[PromptSection]:
+        docs = await run_in("io", query_chroma_db, prompt)
         context["sources"].extend([doc.metadata.get("source", "Chroma") for doc in docs])
 
         if len(docs) < 3:
             context["disclosures"].append("Limited document sources available")
 
-        return await self._debiased_query(
-            f"Documents: {' | '.join(doc.page_content[:200] for doc in docs)}\nQuestion: {prompt}",
-            context
-        )
+        return self._debiased_prompt(prompt, context, [
+            PromptSection("documents", f"Documents: {' | '.join(doc.page_content[:200] for doc in docs)}", priority=1, trimmable=True)
+        ])
 
-    async def _combined_strategy(self, prompt: str, context: Dict) -> str:
-        yahoo_data = self.yahoo.fetch(prompt)
-        docs = query_chroma_db(prompt)
+    async def _combined_strategy(self, prompt: str, context: Dict) -> List[PromptSection]:
+        yahoo_data = await run_in("io", self.yahoo.fetch, prompt)
+        docs = await run_in("io", query_chroma_db, prompt)
 
         context["sources"].extend([
             "Yahoo Finance",
@@ -134,34 +172,34 @@ class FinanceAgent:
         if len(docs) < 2:
             context["disclosures"].append("Limited supporting documents")
 
-        return await self._debiased_query(
-            f"Market Data: {yahoo_data}\nDocuments: {' | '.join(doc.page_content[:200] for doc in docs)}\nQuestion: {prompt}",
-            context
-        )
+        return self._debiased_prompt(prompt, context, [
+            PromptSection("market_data", f"Market Data: {yahoo_data}", priority=2, trimmable=True),
+            PromptSection("documents", f"Documents: {' | '.join(doc.page_content[:200] for doc in docs)}", priority=1, trimmable=True)
+        ])
 
-    async def _direct_strategy(self, prompt: str, context: Dict) -> str:
+    async def _direct_strategy(self, prompt: str, context: Dict) -> List[PromptSection]:
         context["disclosures"].append("No external data sources used")
-        return await self._debiased_query(prompt, context)
-
-    async def _debiased_query(self, prompt: str, context: Dict) -> str:
-        context_str = json.dumps(context, indent=2)
-
-        full_prompt = f"""
-        {self.debiasing_prompt}
-
-        Context:
-        {context_str}
-
-        Additional Data:
-        {prompt}
-
-        Required Format:
-        1. Balanced perspective
-        2. Source disclosures
-        3. Regional neutrality
-        4. Multiple viewpoints if possible
-        """
-        return await self.lm.ask(full_prompt)
+        return self._debiased_prompt(prompt, context)
+
+    def _debiased_prompt(self, question: str, context: Dict, data: List[PromptSection] = ()) -> List[PromptSection]:
+        """Assembles the agent prompt; the router fits it to the token budget of the model it runs on"""
+        # Compact JSON: the indented dump cost tokens without helping the model
+        context_str = json.dumps(context, ensure_ascii=False, separators=(",", ":"))
+
+        sections = [
+            PromptSection("rules", textwrap.dedent(self.debiasing_prompt).strip()),
+            PromptSection("context", f"Context: {context_str}", priority=2),
+            *data,
+            PromptSection("question", f"Question: {question}"),
+            PromptSection("format", (
+                "Required Format:\n"
+                "1. Balanced perspective\n"
+                "2. Source disclosures\n"
+                "3. Regional neutrality\n"
+                "4. Multiple viewpoints if possible"
+            )),
+        ]
+        return sections
 
     def _scan_output_bias(self, response: str, context: Dict) -> str:
         for category, terms in self.bias_keywords.items():
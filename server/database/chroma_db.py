@@ -1,11 +1,20 @@
 import os
-from typing import List
+import time
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from pydantic import PrivateAttr
+from typing import Dict, List, Optional
 from langchain_community.document_loaders import PyPDFLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain.docstore.document import Document
 from langchain_community.embeddings import OllamaEmbeddings
 from langchain_community.vectorstores import Chroma
 from loguru import logger
+from server.utils.singleflight import get_flight
+from server.services.embedding_cache import CachedEmbeddings
+from server.database.ingestion_manifest import IngestionManifest, file_hash, ingestion_manifest
 
 # Absolute path to current directory (where this script lives)
 BASE_DIR = os.path.dirname(__file__)
@@ -21,111 +30,424 @@ COLLECTION_NAME = "financial_documents"
 
 # Embedding model served by Ollama
 OLLAMA_EMBEDDING_MODEL = "nomic-embed-text"
+# What the manifest and the embedding cache record: /api/embed returns
+# L2-normalized vectors, not comparable with the raw /api/embeddings ones
+# stored under the bare model name, so those sources are re-indexed
+EMBEDDING_SPACE = f"{OLLAMA_EMBEDDING_MODEL}/normalized"
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+# Keep-alive connections to Ollama shared by all embedding calls
+OLLAMA_POOL_SIZE = int(os.getenv("OLLAMA_POOL_SIZE", "8"))
+OLLAMA_TIMEOUT_S = float(os.getenv("OLLAMA_TIMEOUT_S", "60"))
 
+# Seconds a store handle is trusted before the collection is checked again
+VECTOR_STORE_HEALTH_INTERVAL_S = float(os.getenv("VECTOR_STORE_HEALTH_INTERVAL_S", "30"))
+# Reconnect backoff after a failed connection: doubles up to the max
+VECTOR_STORE_RECONNECT_BASE_S = float(os.getenv("VECTOR_STORE_RECONNECT_BASE_S", "1"))
+VECTOR_STORE_RECONNECT_MAX_S = float(os.getenv("VECTOR_STORE_RECONNECT_MAX_S", "30"))
 
-def get_embedding_function():
+# Identical concurrent retrievals share one embedding + search
+retrieval_flight = get_flight("query_chroma_db")
+
+# One ingestion run at a time per PDF directory
+_ingestion_locks: Dict[str, threading.RLock] = {}
+_ingestion_locks_guard = threading.Lock()
+
+
+def ingestion_lock(pdf_directory: str) -> threading.RLock:
     """
-    Initializes and returns the Ollama embedding function.
+    Held by create_or_update_vector_db; callers that delete PDFs from the
+    directory afterwards (query_engine) hold it too, so no run is parsing a
+    file being removed. Reentrant, so they can call create_or_update_vector_db.
     """
-    return OllamaEmbeddings(model=OLLAMA_EMBEDDING_MODEL)
+    key = os.path.realpath(pdf_directory)
+    with _ingestion_locks_guard:
+        return _ingestion_locks.setdefault(key, threading.RLock())
 
 
-def load_documents(pdf_directory: str) -> List[Document]:
+class PooledOllamaEmbeddings(OllamaEmbeddings):
     """
-    Loads all PDF files from the specified directory.
-    Returns a list of LangChain Document objects.
+    OllamaEmbeddings over one keep-alive requests.Session (the base class
+    opens a new connection per text) with retries on transient errors.
+    A list of texts is embedded in one /api/embed request (the base class
+    sends one /api/embeddings request per text).
     """
-    all_documents = []
-    print(f"Loading PDFs from: {pdf_directory}")
-    for filename in os.listdir(pdf_directory):
-        if filename.endswith(".pdf"):
-            filepath = os.path.join(pdf_directory, filename)
-            print(f"  - Loading {filepath}...")
-            loader = PyPDFLoader(filepath)
-            docs = loader.load()
-            all_documents.extend(docs)
-    logger.info(f"Total PDF pages loaded: {len(all_documents)}.")
-    return all_documents
+    _session: Optional[requests.Session] = PrivateAttr(default=None)
+
+    def session(self) -> requests.Session:
+        if self._session is None:
+            session = requests.Session()
+            retries = Retry(
+                total=2, backoff_factor=0.2, status_forcelist=(502, 503, 504),
+                allowed_methods=frozenset({"GET", "POST"})  # Embedding a text is idempotent
+            )
+            session.mount("http://", HTTPAdapter(pool_maxsize=OLLAMA_POOL_SIZE, max_retries=retries))
+            session.mount("https://", HTTPAdapter(pool_maxsize=OLLAMA_POOL_SIZE, max_retries=retries))
+            self._session = session
+        return self._session
+
+    def _embed(self, input: List[str]) -> List[List[float]]:
+        if not input:
+            return []
+        headers = {"Content-Type": "application/json", **(self.headers or {})}
+        try:
+            res = self.session().post(
+                f"{self.base_url}/api/embed",
+                headers=headers,
+                json={**self._default_params, "input": input},
+                timeout=OLLAMA_TIMEOUT_S
+            )
+        except requests.exceptions.RequestException as e:
+            raise ValueError(f"Error raised by inference endpoint: {e}")
+
+        if res.status_code != 200:
+            raise ValueError(f"Error raised by inference API HTTP code: {res.status_code}, {res.text}")
+        try:
+            embeddings = res.json()["embeddings"]
+        except (requests.exceptions.JSONDecodeError, KeyError) as e:
+            raise ValueError(f"Error raised by inference API: {e}.\nResponse: {res.text}")
+        if len(embeddings) != len(input):
+            raise ValueError(f"Ollama returned {len(embeddings)} embeddings for {len(input)} texts")
+        return embeddings
+
+    def ping(self) -> bool:
+        """Ollama is reachable"""
+        try:
+            return self.session().get(f"{self.base_url}/api/tags", timeout=2).status_code == 200
+        except requests.exceptions.RequestException:
+            return False
+
+    def close(self):
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+
+class VectorStoreHandle:
+    """
+    Long-lived Chroma store over chroma_data with one pooled Ollama
+    embeddings client, shared by retrieval and indexing. The handle is
+    re-checked (collection count) every VECTOR_STORE_HEALTH_INTERVAL_S and
+    after a failed operation; a broken one is dropped and reconnected with
+    exponential backoff. Writes are serialized.
+    """
+
+    def __init__(self, persist_directory: str = CHROMA_PERSIST_DIRECTORY, collection_name: str = COLLECTION_NAME):
+        self.persist_directory = persist_directory
+        self.collection_name = collection_name
+        self.embeddings = PooledOllamaEmbeddings(model=OLLAMA_EMBEDDING_MODEL, base_url=OLLAMA_BASE_URL)
+        # What Chroma calls: repeated queries and re-ingested chunks are not re-embedded
+        self.embedding_function = CachedEmbeddings(self.embeddings, f"ollama/{EMBEDDING_SPACE}")
+        self._db: Optional[Chroma] = None
+        self._checked_at = 0.0
+        self._failures = 0
+        self._retry_at = 0.0
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self.counters = {"connects": 0, "connect_errors": 0, "health_checks": 0, "health_failures": 0, "queries": 0, "writes": 0}
+
+    def _healthy(self, db: Chroma) -> bool:
+        self.counters["health_checks"] += 1
+        try:
+            db._collection.count()
+            return True
+        except Exception as e:
+            self.counters["health_failures"] += 1
+            logger.warning(f"Vector store health check failed, reconnecting: {e}")
+            return False
+
+    def get(self) -> Chroma:
+        """The shared store, (re)connected when needed; raises while in reconnect backoff"""
+        db = self._db
+        if db is not None and time.monotonic() - self._checked_at < VECTOR_STORE_HEALTH_INTERVAL_S:
+            return db
+        with self._lock:
+            now = time.monotonic()
+            if self._db is not None and now - self._checked_at >= VECTOR_STORE_HEALTH_INTERVAL_S:
+                if self._healthy(self._db):
+                    self._checked_at = now
+                else:
+                    self._db = None
+            if self._db is None:
+                if now < self._retry_at:
+                    raise ConnectionError(f"Vector store unavailable, next reconnect in {self._retry_at - now:.1f}s")
+                try:
+                    self._db = Chroma(
+                        persist_directory=self.persist_directory,
+                        embedding_function=self.embedding_function,
+                        collection_name=self.collection_name
+                    )
+                except Exception:
+                    self._failures += 1
+                    self.counters["connect_errors"] += 1
+                    self._retry_at = now + min(VECTOR_STORE_RECONNECT_MAX_S, VECTOR_STORE_RECONNECT_BASE_S * 2 ** (self._failures - 1))
+                    raise
+                self._failures = 0
+                self._checked_at = now
+                self.counters["connects"] += 1
+                logger.info(f"Vector store connected: {self.collection_name} in {self.persist_directory}")
+            return self._db
+
+    def _failed(self, db: Chroma):
+        """After an error: drop the handle if the store itself is broken (embedding errors keep it)"""
+        with self._lock:
+            if self._db is db and not self._healthy(db):
+                self._db = None
+
+    def similarity_search(self, query_text: str, k: int) -> List[Document]:
+        db = self.get()
+        self.counters["queries"] += 1
+        try:
+            return db.similarity_search(query_text, k=k)
+        except Exception:
+            self._failed(db)
+            raise
+
+    def ids_for_source(self, source: str) -> List[str]:
+        """Chunk IDs of one source (metadata filter, no full scan)"""
+        return self.get().get(where={"source": source}, include=[])["ids"]
+
+    def get_all(self) -> Dict:
+        """ids and metadatas of every stored chunk"""
+        return self.get().get(include=["metadatas"])
+
+    def add_documents(self, documents: List[Document], ids: Optional[List[str]] = None):
+        db = self.get()
+        with self._write_lock:
+            try:
+                db.add_documents(documents, ids=ids)
+            except Exception:
+                self._failed(db)
+                raise
+            self.counters["writes"] += 1
+
+    def upsert(self, documents: List[Document], ids: List[str], embeddings: List[List[float]]):
+        """Stores chunks embedded beforehand (the ingestion pipeline embeds in its own stage)"""
+        db = self.get()
+        with self._write_lock:
+            try:
+                db._collection.upsert(
+                    ids=ids,
+                    embeddings=embeddings,
+                    documents=[doc.page_content for doc in documents],
+                    metadatas=[doc.metadata for doc in documents]
+                )
+            except Exception:
+                self._failed(db)
+                raise
+            self.counters["writes"] += 1
+
+    def delete(self, ids: List[str]):
+        db = self.get()
+        with self._write_lock:
+            db.delete(ids=ids)
+            self.counters["writes"] += 1
+
+    def persist(self):
+        # Chroma >= 0.4 persists on write; older clients need the explicit call
+        with self._write_lock:
+            persist = getattr(self.get(), "persist", None)
+            if persist:
+                persist()
+
+    def health(self) -> Dict:
+        """Store and Ollama reachability (blocking: makes an HTTP call)"""
+        try:
+            store = self._healthy(self.get())
+        except Exception:
+            store = False
+        return {"store": store, "ollama": self.embeddings.ping()}
+
+    def stats(self) -> Dict:
+        return {
+            **self.counters,
+            "connected": self._db is not None,
+            "consecutive_failures": self._failures,
+            "collection": self.collection_name,
+            "embedding_model": OLLAMA_EMBEDDING_MODEL,
+            "ollama_pool_size": OLLAMA_POOL_SIZE
+        }
+
+    def close(self):
+        with self._lock:
+            self._db = None
+        self.embeddings.close()
+
+
+# Shared by the agent, /query/rag and indexing
+vector_store = VectorStoreHandle()
+
+
+def get_embedding_function() -> CachedEmbeddings:
+    """
+    Returns the shared Ollama embedding function (pooled client behind the embedding cache).
+    """
+    return vector_store.embedding_function
+
+
+def load_pdf(filepath: str) -> List[Document]:
+    """
+    Parses one PDF (pure-Python and CPU bound, runs in the cpu process pool).
+    """
+    return PyPDFLoader(filepath).load()
+
+
+def list_pdfs(pdf_directory: str) -> List[str]:
+    return [
+        os.path.join(pdf_directory, filename)
+        for filename in sorted(os.listdir(pdf_directory))
+        if filename.endswith(".pdf")
+    ]
+
+
+text_splitter = RecursiveCharacterTextSplitter(
+    chunk_size=3000,
+    chunk_overlap=100,
+    length_function=len,
+    is_separator_regex=False,
+)
 
 
 def split_documents_into_chunks(documents: List[Document]) -> List[Document]:
     """
     Splits full documents into smaller chunks to optimize embedding.
     """
-    splitter = RecursiveCharacterTextSplitter(
-        chunk_size=3000,
-        chunk_overlap=100,
-        length_function=len,
-        is_separator_regex=False,
-    )
     logger.info(f"Splitting {len(documents)} documents into chunks...")
-    chunks = splitter.split_documents(documents)
+    chunks = text_splitter.split_documents(documents)
     logger.success(f"Total chunks created: {len(chunks)}.")
     return chunks
 
 
-def add_documents_to_chroma(chunks: List[Document], embedding_function):
-    db = Chroma(
-        persist_directory=CHROMA_PERSIST_DIRECTORY,
-        embedding_function=embedding_function,
-        collection_name=COLLECTION_NAME
-    )
+def chunk_ids(content_hash: str, count: int) -> List[str]:
+    """Deterministic IDs: the same bytes always give the same chunk IDs"""
+    return [f"{content_hash[:16]}-{i}" for i in range(count)]
 
-    existing = db.get()
-    existing_sources = {meta.get("source") for meta in existing["metadatas"]}
-    new_chunks = [doc for doc in chunks if doc.metadata.get("source") not in existing_sources]
 
-    logger.info(f"Detected {len(existing_sources)} existing sources.")
-    logger.info(f"Preparing to insert {len(new_chunks)} new chunks.")
+def plan_ingestion(
+    filepaths: List[str],
+    manifest: IngestionManifest = ingestion_manifest,
+    store: VectorStoreHandle = vector_store
+) -> Dict[str, List]:
+    """
+    Sorts the PDFs by what the manifest says about them (one lookup each):
+    unchanged ones are skipped without touching the collection, new and
+    changed ones (other bytes or embedding model) are indexed.
+    """
+    plan = {"new": [], "changed": [], "unchanged": []}
+    for filepath in filepaths:
+        content_hash = file_hash(filepath)
+        entry = manifest.get(filepath)
+        if entry is None:
+            # Indexed before the manifest existed (through /api/embeddings, another
+            # vector space): re-indexed now, replacing the chunks already stored
+            existing = store.ids_for_source(filepath)
+            plan["changed" if existing else "new"].append((filepath, content_hash, existing))
+        elif entry.content_hash != content_hash or entry.embedding_model != EMBEDDING_SPACE:
+            plan["changed"].append((filepath, content_hash, entry.chunk_ids))
+        else:
+            plan["unchanged"].append(filepath)
+    return plan
 
-    if not new_chunks:
-        logger.warning("No new documents to insert.")
-        return
 
-    batch_size = 64
-    total = len(new_chunks)
-    for i in range(0, total, batch_size):
-        batch = new_chunks[i : i + batch_size]
-        start, end = i + 1, i + len(batch)
-        logger.info(f"Inserting chunks {start}–{end} of {total}...")
-        db.add_documents(batch)
+def _stale_ids(source: str, manifest: IngestionManifest, store: "VectorStoreHandle") -> List[str]:
+    """Stored chunks of a source embedded outside EMBEDDING_SPACE (none if it is current)"""
+    entry = manifest.get(source)
+    if entry is not None and entry.embedding_model == EMBEDDING_SPACE:
+        return []
+    return store.ids_for_source(source)
+
+
+def reconcile_embedding_space(
+    manifest: IngestionManifest = ingestion_manifest,
+    store: VectorStoreHandle = vector_store
+) -> Dict[str, int]:
+    """
+    Startup check that every stored chunk was embedded in EMBEDDING_SPACE,
+    the space queries are embedded in. Sources indexed under another model
+    or before the manifest existed are re-indexed if their PDF is still on
+    disk, and removed from the collection otherwise. Each directory is
+    handled under its ingestion lock, so a run in progress is not mistaken
+    for stale chunks.
+    """
+    by_directory: Dict[str, List[str]] = {}
+    for metadata in store.get_all()["metadatas"]:
+        source = (metadata or {}).get("source")
+        if source:
+            by_directory.setdefault(os.path.dirname(source), []).append(source)
+
+    summary = {"reindexed": 0, "removed": 0}
+    for directory, sources in by_directory.items():
+        with ingestion_lock(directory):
+            pending = []
+            for source in dict.fromkeys(sources):
+                stale = _stale_ids(source, manifest, store)
+                if not stale:
+                    continue
+                if os.path.exists(source):
+                    pending.append((source, file_hash(source), stale))
+                else:
+                    store.delete(stale)
+                    manifest.forget(source)
+                    summary["removed"] += 1
+            if pending:
+                from server.database.ingestion_pipeline import IngestionPipeline
+                IngestionPipeline(store, manifest).run(pending)
+                summary["reindexed"] += len(pending)
 
-    db.persist()
-    logger.success("✅ ChromaDB updated with all batches.")
+    if any(summary.values()):
+        logger.warning(f"Chunks outside the {EMBEDDING_SPACE} vector space at startup: {summary}")
+    return summary
 
-def create_or_update_vector_db(pdf_directory: str):
+
+def create_or_update_vector_db(pdf_directory: str) -> Dict:
     """
-    Main pipeline: loads, chunks, embeds, and stores documents in ChromaDB.
+    Main pipeline: indexes the new and changed PDFs of the directory
+    (streaming parse -> split -> embed -> upsert, see ingestion_pipeline.py)
+    and skips the unchanged ones. Runs on the same directory are serialized.
     """
-    embedding_function = get_embedding_function()
-    documents = load_documents(pdf_directory)
+    with ingestion_lock(pdf_directory):
+        return _create_or_update_vector_db(pdf_directory)
+
 
-    if not documents:
+def _create_or_update_vector_db(pdf_directory: str) -> Dict:
+    filepaths = list_pdfs(pdf_directory)
+    if not filepaths:
         logger.error("No PDFs found. Place some files in the folder before running.")
-        return
+        return {}
 
-    chunks = split_documents_into_chunks(documents)
-    add_documents_to_chroma(chunks, embedding_function)
+    plan = plan_ingestion(filepaths)
+    summary = {name: len(items) for name, items in plan.items()}
+    logger.info(f"Ingestion plan for {pdf_directory}: {summary}")
+
+    pending = plan["new"] + plan["changed"]
+    if not pending:
+        logger.warning("No new documents to insert.")
+        return summary
+
+    from server.database.ingestion_pipeline import IngestionPipeline
+    progress = IngestionPipeline().run(pending)
+    logger.success(
+        f"✅ ChromaDB updated: {progress['sources_done']} sources, {progress['chunks_upserted']} chunks "
+        f"({progress['pages_per_s']} pages/s, {progress['chunks_per_s']} chunks/s)"
+    )
+    return {**summary, "progress": progress}
 
 
 def query_chroma_db(query_text: str, k: int = 5) -> List[Document]:
     """
     Queries ChromaDB to retrieve the most relevant chunks to the input query.
     """
-    embedding_function = get_embedding_function()
+    return retrieval_flight.do_sync((query_text, k), lambda: _query_chroma_db(query_text, k))
+
 
+def _query_chroma_db(query_text: str, k: int) -> List[Document]:
     try:
-        db = Chroma(
-            persist_directory=CHROMA_PERSIST_DIRECTORY,
-            embedding_function=embedding_function,
-            collection_name=COLLECTION_NAME
-        )
+        vector_store.get()
     except Exception as e:
         logger.error(f"Failed to connect to ChromaDB: {e}")
         return []
 
     logger.info(f"Searching ChromaDB for: '{query_text}'")
-    results = db.similarity_search(query_text, k=k)
+    results = vector_store.similarity_search(query_text, k=k)
     logger.info(f"Found {len(results)} relevant chunks.")
     return results
 
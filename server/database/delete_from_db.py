@@ -1,25 +1,11 @@
-import os
-from langchain_community.embeddings import OllamaEmbeddings
-from langchain_community.vectorstores import Chroma
-
-# Same config as chroma_db.py
-BASE_DIR = os.path.dirname(__file__)
-CHROMA_PERSIST_DIRECTORY = os.path.join(BASE_DIR, "chroma_data")
-COLLECTION_NAME = "financial_documents"
-OLLAMA_EMBEDDING_MODEL = "nomic-embed-text"
+from server.database.chroma_db import vector_store
+from server.database.ingestion_manifest import ingestion_manifest
 
 def delete_documents_by_source(pdf_name: str):
     """
     Deletes all chunks associated with a specific PDF file.
     """
-    embedding = OllamaEmbeddings(model=OLLAMA_EMBEDDING_MODEL)
-    db = Chroma(
-        persist_directory=CHROMA_PERSIST_DIRECTORY,
-        embedding_function=embedding,
-        collection_name=COLLECTION_NAME
-    )
-
-    all_docs = db.get()
+    all_docs = vector_store.get_all()
     metadatas = all_docs["metadatas"]
     ids_to_delete = [
         all_docs["ids"][i]
@@ -32,7 +18,9 @@ def delete_documents_by_source(pdf_name: str):
         return
 
     print(f"Deleting {len(ids_to_delete)} chunks associated with '{pdf_name}'...")
-    db.delete(ids=ids_to_delete)
+    vector_store.delete(ids_to_delete)
+    for source in {meta.get("source") for meta in metadatas if pdf_name in meta.get("source", "")}:
+        ingestion_manifest.forget(source)
     print("✅ Deletion complete.")
 
 if __name__ == "__main__":
@@ -0,0 +1,98 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Dict, List, NamedTuple, Optional
+from loguru import logger
+
+BASE_DIR = os.path.dirname(__file__)
+INGESTION_MANIFEST_PATH = os.getenv("INGESTION_MANIFEST_PATH", os.path.join(BASE_DIR, "ingestion_manifest.sqlite3"))
+
+
+class ManifestEntry(NamedTuple):
+    source: str
+    content_hash: str
+    chunk_ids: List[str]
+    embedding_model: str
+    indexed_at: float
+
+
+def file_hash(path: str) -> str:
+    """sha256 of the file bytes, read in blocks"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class IngestionManifest:
+    """
+    What is indexed in the Chroma collection, per source PDF: content hash,
+    chunk IDs and embedding model. Checking a source is one primary-key
+    lookup instead of a scan of the collection; a changed hash or model
+    means the source has to be re-indexed, and its old chunk IDs say what to
+    delete.
+    """
+
+    def __init__(self, path: str = INGESTION_MANIFEST_PATH):
+        self.path = path
+        self._db = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS manifest ("
+                "source TEXT PRIMARY KEY, content_hash TEXT, chunk_ids TEXT, embedding_model TEXT, indexed_at REAL)"
+            )
+            self._db.commit()
+        return self._db
+
+    def get(self, source: str) -> Optional[ManifestEntry]:
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT source, content_hash, chunk_ids, embedding_model, indexed_at FROM manifest WHERE source = ?",
+                (source,)
+            ).fetchone()
+        if row is None:
+            return None
+        return ManifestEntry(row[0], row[1], json.loads(row[2]), row[3], row[4])
+
+    def record(self, source: str, content_hash: str, chunk_ids: List[str], embedding_model: str):
+        with self._lock:
+            db = self._connect()
+            db.execute(
+                "INSERT OR REPLACE INTO manifest (source, content_hash, chunk_ids, embedding_model, indexed_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (source, content_hash, json.dumps(chunk_ids), embedding_model, time.time())
+            )
+            db.commit()
+
+    def forget(self, source: str):
+        with self._lock:
+            db = self._connect()
+            db.execute("DELETE FROM manifest WHERE source = ?", (source,))
+            db.commit()
+
+    def sources(self) -> List[str]:
+        with self._lock:
+            return [row[0] for row in self._connect().execute("SELECT source FROM manifest")]
+
+    def stats(self) -> Dict:
+        try:
+            with self._lock:
+                sources, chunks = self._connect().execute(
+                    "SELECT COUNT(*), COALESCE(SUM(json_array_length(chunk_ids)), 0) FROM manifest"
+                ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"Ingestion manifest read failed: {e}")
+            sources = chunks = None
+        return {"sources": sources, "chunks": chunks, "path": self.path}
+
+
+ingestion_manifest = IngestionManifest()
@@ -0,0 +1,284 @@
+import os
+import time
+import queue
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, wait
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+from langchain.docstore.document import Document
+from loguru import logger
+from server.database.chroma_db import (
+    EMBEDDING_SPACE, VectorStoreHandle, chunk_ids, load_pdf, text_splitter, vector_store
+)
+from server.database.ingestion_manifest import IngestionManifest, ingestion_manifest
+from server.utils.executors import get_executor
+
+# Chunks per embedding request (one /api/embed call) / concurrent embedding requests to Ollama
+INGEST_EMBED_BATCH = int(os.getenv("INGEST_EMBED_BATCH", "64"))
+INGEST_EMBED_WORKERS = int(os.getenv("INGEST_EMBED_WORKERS", "4"))
+# Items buffered between two stages: what bounds the memory of a run
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "8"))
+# Finished runs kept for /metrics/ingestion
+INGEST_RUNS_KEPT = int(os.getenv("INGEST_RUNS_KEPT", "5"))
+
+STAGES = ("parse", "split", "embed", "upsert")
+_DONE = object()  # End of stream marker
+
+
+@dataclass
+class SourceState:
+    """One PDF going through the pipeline"""
+    filepath: str
+    content_hash: str
+    old_ids: List[str]
+    ids: List[str] = field(default_factory=list)
+    batches: int = 0  # Known once the split stage is done with the source
+    upserted: int = 0
+    failed: bool = False
+
+
+@dataclass
+class Batch:
+    source: SourceState
+    chunks: List[Document]
+    ids: List[str]
+    embeddings: Optional[List[List[float]]] = None
+
+
+class IngestionProgress:
+    """Counters of one run, readable from /metrics/ingestion while it goes"""
+
+    def __init__(self, sources: int = 0):
+        self._lock = threading.Lock()
+        self.started_at = time.perf_counter()
+        self.finished_at = None
+        self.counters = {
+            "sources": sources, "sources_done": 0, "sources_failed": 0,
+            "pages": 0, "chunks_split": 0, "chunks_embedded": 0, "chunks_upserted": 0
+        }
+        self.stage_ms = {stage: 0.0 for stage in STAGES}
+
+    def add(self, stage: str, elapsed_ms: float, **counts: int):
+        with self._lock:
+            self.stage_ms[stage] += elapsed_ms
+            for name, count in counts.items():
+                self.counters[name] += count
+
+    def finish(self):
+        self.finished_at = time.perf_counter()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            elapsed = (self.finished_at or time.perf_counter()) - self.started_at
+            return {
+                **self.counters,
+                "running": self.finished_at is None,
+                "elapsed_s": round(elapsed, 2),
+                "pages_per_s": round(self.counters["pages"] / elapsed, 2) if elapsed else None,
+                "chunks_per_s": round(self.counters["chunks_upserted"] / elapsed, 2) if elapsed else None,
+                # Busy time per stage (summed over its workers): the largest one is the bottleneck
+                "stage_ms": {stage: round(ms, 1) for stage, ms in self.stage_ms.items()}
+            }
+
+
+class IngestionRuns:
+    """Progress of every run: each one gets its own counters, so overlapping runs do not mix"""
+
+    def __init__(self, kept: int = INGEST_RUNS_KEPT):
+        self._runs: "deque[IngestionProgress]" = deque(maxlen=kept)
+        self._running: List[IngestionProgress] = []
+        self._lock = threading.Lock()
+
+    def start(self, sources: int) -> IngestionProgress:
+        progress = IngestionProgress(sources)
+        with self._lock:
+            self._running.append(progress)
+        return progress
+
+    def finish(self, progress: IngestionProgress):
+        progress.finish()
+        with self._lock:
+            self._running.remove(progress)
+            self._runs.append(progress)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            running, finished = list(self._running), list(self._runs)
+        return {
+            "running": [progress.stats() for progress in running],
+            # Most recent first
+            "finished": [progress.stats() for progress in reversed(finished)]
+        }
+
+
+ingestion_runs = IngestionRuns()
+
+
+class IngestionPipeline:
+    """
+    Streaming ingestion of new / changed PDFs in four stages linked by
+    bounded queues, so only a few PDFs and batches are in memory at a time:
+
+        parse (cpu process pool) -> split -> embed (concurrent batched
+        requests) -> upsert (single writer)
+
+    A source is recorded in the manifest, and its old chunks deleted, once
+    all its batches are stored. A failure only drops the source it belongs
+    to, which is redone on the next run. One pipeline per run (see
+    create_or_update_vector_db, which serializes runs per directory).
+    """
+
+    def __init__(
+        self,
+        store: VectorStoreHandle = vector_store,
+        manifest: IngestionManifest = ingestion_manifest,
+        runs: IngestionRuns = ingestion_runs
+    ):
+        self.store = store
+        self.manifest = manifest
+        self.runs = runs
+        self.progress = IngestionProgress()
+        self._parsed: "queue.Queue" = queue.Queue(INGEST_QUEUE_SIZE)
+        self._to_embed: "queue.Queue" = queue.Queue(INGEST_QUEUE_SIZE)
+        self._to_upsert: "queue.Queue" = queue.Queue(INGEST_QUEUE_SIZE)
+
+    def _fail(self, source: SourceState, stage: str, error: Exception):
+        if not source.failed:
+            source.failed = True
+            self.progress.add(stage, 0.0, sources_failed=1)
+            logger.error(f"Ingestion of {source.filepath} failed at {stage}: {error}")
+
+    def _parse(self, sources: List[SourceState]):
+        """Keeps the cpu pool busy with at most 2 PDFs per worker in flight"""
+        pool = get_executor("cpu")
+        window = 2 * pool.max_workers
+        pending, in_flight = list(sources), {}
+        try:
+            while pending or in_flight:
+                while pending and len(in_flight) < window:
+                    source = pending.pop(0)
+                    in_flight[pool.submit(load_pdf, source.filepath)] = (source, time.perf_counter())
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    source, submitted = in_flight.pop(future)
+                    try:
+                        pages = future.result()
+                    except Exception as e:
+                        self._fail(source, "parse", e)
+                        continue
+                    # Submit to result: includes the wait for a free worker
+                    self.progress.add("parse", (time.perf_counter() - submitted) * 1000, pages=len(pages))
+                    self._parsed.put((source, pages))
+        except Exception as e:  # The pool itself is broken: fail what is left
+            for source in [*pending, *(source for source, _ in in_flight.values())]:
+                self._fail(source, "parse", e)
+        finally:
+            self._parsed.put(_DONE)
+
+    def _split(self):
+        try:
+            self._split_all()
+        finally:
+            for _ in range(INGEST_EMBED_WORKERS):
+                self._to_embed.put(_DONE)
+
+    def _split_all(self):
+        while (item := self._parsed.get()) is not _DONE:
+            source, pages = item
+            start = time.perf_counter()
+            try:
+                chunks = text_splitter.split_documents(pages)
+            except Exception as e:
+                self._fail(source, "split", e)
+                continue
+            source.ids = chunk_ids(source.content_hash, len(chunks))
+            batches = [
+                Batch(source, chunks[i:i + INGEST_EMBED_BATCH], source.ids[i:i + INGEST_EMBED_BATCH])
+                for i in range(0, len(chunks), INGEST_EMBED_BATCH)
+            ]
+            source.batches = len(batches)
+            self.progress.add("split", (time.perf_counter() - start) * 1000, chunks_split=len(chunks))
+            if not batches:  # Nothing to embed (e.g. a scanned PDF without text)
+                self._to_upsert.put(Batch(source, [], []))
+            for batch in batches:
+                self._to_embed.put(batch)
+
+    def _embed(self):
+        # Cached embeddings: chunks already embedded once (same model and text) are read from disk
+        embedding_function = self.store.embedding_function
+        try:
+            while (batch := self._to_embed.get()) is not _DONE:
+                if batch.source.failed:
+                    continue
+                start = time.perf_counter()
+                try:
+                    batch.embeddings = embedding_function.embed_documents([chunk.page_content for chunk in batch.chunks])
+                except Exception as e:
+                    self._fail(batch.source, "embed", e)
+                    continue
+                self.progress.add("embed", (time.perf_counter() - start) * 1000, chunks_embedded=len(batch.chunks))
+                self._to_upsert.put(batch)
+        finally:
+            self._to_upsert.put(_DONE)
+
+    def _finish_source(self, source: SourceState):
+        """All batches stored: drop the chunks of the previous version and record the source"""
+        new_ids = set(source.ids)
+        stale = [chunk_id for chunk_id in source.old_ids if chunk_id not in new_ids]
+        try:
+            if stale:
+                self.store.delete(stale)
+            self.manifest.record(source.filepath, source.content_hash, source.ids, EMBEDDING_SPACE)
+        except Exception as e:
+            self._fail(source, "upsert", e)
+            return
+        self.progress.add("upsert", 0.0, sources_done=1)
+        stats = self.progress.stats()
+        logger.info(
+            f"Indexed {source.filepath} ({len(source.ids)} chunks) - "
+            f"{stats['sources_done']}/{stats['sources']} sources, {stats['chunks_per_s']} chunks/s"
+        )
+
+    def _upsert(self):
+        """Single writer, run by the calling thread"""
+        finished_embedders = 0
+        while finished_embedders < INGEST_EMBED_WORKERS:
+            batch = self._to_upsert.get()
+            if batch is _DONE:
+                finished_embedders += 1
+                continue
+            source = batch.source
+            if source.failed:
+                continue
+            if batch.chunks:
+                start = time.perf_counter()
+                try:
+                    self.store.upsert(batch.chunks, batch.ids, batch.embeddings)
+                except Exception as e:
+                    self._fail(source, "upsert", e)
+                    continue
+                source.upserted += 1
+                self.progress.add("upsert", (time.perf_counter() - start) * 1000, chunks_upserted=len(batch.chunks))
+            if source.upserted == source.batches:
+                self._finish_source(source)
+
+    def run(self, sources: List[Tuple[str, str, List[str]]]) -> Dict:
+        """(filepath, content_hash, old chunk IDs) of the sources to index -> progress stats"""
+        states = [SourceState(filepath, content_hash, list(old_ids)) for filepath, content_hash, old_ids in sources]
+        self.progress = self.runs.start(len(states))
+        threads = [
+            threading.Thread(target=self._parse, args=(states,), name="ingest-parse", daemon=True),
+            threading.Thread(target=self._split, name="ingest-split", daemon=True),
+            *(threading.Thread(target=self._embed, name=f"ingest-embed-{i}", daemon=True) for i in range(INGEST_EMBED_WORKERS))
+        ]
+        for thread in threads:
+            thread.start()
+        try:
+            self._upsert()
+        finally:
+            for thread in threads:
+                thread.join()
+            self.runs.finish(self.progress)
+        self.store.persist()
+        return self.progress.stats()
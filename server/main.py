@@ -1,18 +1,65 @@
-from fastapi import FastAPI
-from server.routes import basic_content, agent,image, yahoo, simple_rag_chroma
+import asyncio
+import contextlib
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from server.routes import basic_content, agent,image, yahoo, simple_rag_chroma, metrics, multi_platform
+from server.services.lm_engine import engine_registry
+from server.services.market_prefetcher import MARKET_PREFETCH, market_prefetcher
+from server.services.resources import RESOURCES_WARM_UP, resources
+from server.database.chroma_db import vector_store
+from server.utils.executors import shutdown_executors
+from server.services.template_store import TEMPLATE_HOT_RELOAD, template_registry
+from server.utils.request_context import bind_context, context_from_headers, current_context, reset_context
 from loguru import logger
 from server.routes.query_rag import router as query_router
 
 
-app = FastAPI(title="LLM API", version="1.0.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Pick up prompt template edits without a restart
+    watcher = asyncio.create_task(template_registry.watch()) if TEMPLATE_HOT_RELOAD else None
+    # Load NLP models, embeddings and the Chroma client once, in the background (see /ready)
+    warm_up = asyncio.create_task(resources.warm_up()) if RESOURCES_WARM_UP else None
+    # Keep watchlist quotes, fundamentals and indicators warm
+    prefetcher = asyncio.create_task(market_prefetcher.run()) if MARKET_PREFETCH else None
+    yield
+    for task in (watcher, prefetcher, warm_up):
+        if task:
+            task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+    # Close the pooled Groq connections
+    await engine_registry.aclose()
+    # Release the pooled Ollama connections of the vector store
+    vector_store.close()
+    # Stop the named worker pools (io, nlp, market, cpu)
+    shutdown_executors()
+
+
+app = FastAPI(title="LLM API", version="1.0.0", lifespan=lifespan)
+
+@app.middleware("http")
+async def request_context_middleware(request: Request, call_next):
+    # Request-scoped state (cache bypass...) readable from any service
+    token = bind_context(context_from_headers(request.headers))
+    try:
+        response = await call_next(request)
+        # Ties the answer (and any cached copy of it) to a prompt template version
+        response.headers["X-Template-Version"] = current_context().template_version or template_registry.current.version
+        return response
+    finally:
+        reset_context(token)
 
 # These are all in server/routes folder
 app.include_router(basic_content.router)
 app.include_router(agent.router)
 app.include_router(query_router)            # This is the RAG so it goes to arxiv search and retrieve info for chorma database
-app.include_router(image.router) 
-app.include_router(yahoo.router) 
+app.include_router(image.router)
+app.include_router(yahoo.router)
 app.include_router(simple_rag_chroma.router) # This is the simple rag that goes to the already existent info in chroma database
+app.include_router(multi_platform.router)  # Same topic rendered for several platforms in one call
+app.include_router(metrics.router)
 
 @app.get("/")
 async def root():
@@ -20,8 +67,12 @@ async def root():
     return {"message": "LLM API is running!"}
 
 
-from server.routes.yahoo import router as yahoo_router
-app.include_router(yahoo_router)
-
+@app.get("/ready")
+async def ready():
+    """503 until the required shared models and clients are loaded (the knowledge base is optional)"""
+    stats = resources.stats()
+    return JSONResponse(stats, status_code=200 if stats["ready"] else 503)
 
 
+from server.routes.yahoo import router as yahoo_router
+app.include_router(yahoo_router)
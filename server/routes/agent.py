@@ -1,6 +1,9 @@
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
+from typing import Optional
 from server.agents.finance_agent import FinanceAgent
+from server.services.model_router import model_router
+from server.utils.sse import sse_response, stream_tokens
 from loguru import logger
 
 router = APIRouter(prefix="/agent", tags=["Financial Analysis Agent"])
@@ -27,6 +30,8 @@ class AgentRequest(BaseModel):
     audience: str = "26-85"
     region: str = "Spanish (Argentina)"
     model: str = "llama-3.1-8b-instant"  # Default model
+    stream: bool = False  # Stream tokens as Server-Sent Events
+    latency_budget_ms: Optional[int] = None  # Deadline before failing over to a faster model
 
 class AgentResponse(BaseModel):
     output: str
@@ -34,6 +39,20 @@ class AgentResponse(BaseModel):
     bias_disclosures: list[str]
     model_used: str
     processing_time_ms: float = None
+    truncated: bool = False  # Output hit the platform length cap
+
+def _build_agent_response(result: dict) -> AgentResponse:
+    # Handle empty responses
+    if "I don't know" in result["output"]:
+        result["output"] = "I couldn't find sufficient diverse sources to provide a balanced answer."
+
+    return AgentResponse(
+        output=result["output"],
+        sources_used=result["sources"],
+        bias_disclosures=result["disclosures"],
+        model_used=result["model_used"],
+        truncated=result.get("truncated", False)
+    )
 
 @router.post(
     "/finance_complete",
@@ -64,20 +83,18 @@ async def run_finance_agent(request: AgentRequest):
             
         # Initialize agent with selected model
         agent = FinanceAgent(model_name=request.model)
-        
+
+        # Stream tokens, sources and disclosures arrive in the final event
+        if request.stream:
+            tokens, finalize = await agent.run_stream(request)
+            return sse_response(stream_tokens(
+                tokens,
+                lambda output: _build_agent_response(finalize(output)).model_dump()
+            ))
+
         # Process request
         result = await agent.run(request)
-        
-        # Handle empty responses
-        if "I don't know" in result["output"]:
-            result["output"] = "I couldn't find sufficient diverse sources to provide a balanced answer."
-            
-        return AgentResponse(
-            output=result["output"],
-            sources_used=result["sources"],
-            bias_disclosures=result["disclosures"],
-            model_used=result["model_used"]
-        )
+        return _build_agent_response(result)
         
     except HTTPException:
         raise
@@ -90,8 +107,9 @@ async def run_finance_agent(request: AgentRequest):
 
 @router.get("/available_models")
 async def list_models():
-    """List available LLM models with descriptions"""
+    """List available LLM models with descriptions and live latency/error stats"""
     return {
         "available_models": AVAILABLE_MODELS,
-        "default": "llama-3.1-8b-instant"
+        "default": "llama-3.1-8b-instant",
+        "live_stats": model_router.stats()
     }
\ No newline at end of file
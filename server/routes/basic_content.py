@@ -1,7 +1,14 @@
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
+from typing import Optional
 from server.services.prompt_builder import PromptBuilder
-from server.services.lm_engine import LMEngine, GroqModel
+from server.services.lm_engine import get_engine, GroqModel, FAILED_RESPONSE
+from server.services.semantic_cache import semantic_cache
+from server.services.template_store import template_registry
+from server.services.model_router import model_router
+from server.services.output_budget import limits_for
+from server.utils.query_depth import is_deep_query
+from server.utils.sse import iter_text, sse_response, stream_tokens
 from loguru import logger
 
 router = APIRouter(prefix="/generate", tags=["General Knowledge Agent"])
@@ -11,13 +18,16 @@ class ContentRequest(BaseModel):
     audience: str = "08-11"
     platform: str = "twitter"
     region: str = "Spanish (Argentina)"
+    stream: bool = False  # Stream tokens as Server-Sent Events
+    latency_budget_ms: Optional[int] = None  # Lets the router pick a faster model
 
 class ContentResponse(BaseModel):
     output: str
+    truncated: bool = False  # Output hit the platform length cap
 
 # Start connections
 prompt_builder = PromptBuilder()
-lm_engine = LMEngine(model_name= GroqModel.GEMMA_9B)
+DEFAULT_MODEL = GroqModel.GEMMA_9B
 
 @router.post(
     "/basic/",
@@ -28,19 +38,52 @@ async def generate_content(request: ContentRequest):
     try:
         logger.info(f"Received content request: {request}")
 
+        # 0) Paraphrases of an already answered prompt come from the semantic cache
+        # (only answers built from the active template version)
+        partition = ("basic", request.platform, request.audience, request.region, template_registry.current.version)
+        embedding = await semantic_cache.embed(request.prompt)
+        cached = semantic_cache.lookup(embedding, partition)
+        if cached is not None:
+            response = ContentResponse(**cached)
+            if request.stream:
+                return sse_response(stream_tokens(iter_text(response.output), lambda output: response.model_dump()))
+            return response
+
+        def remember(output: str, truncated: bool = False) -> ContentResponse:
+            response = ContentResponse(output=output, truncated=truncated)
+            if output != FAILED_RESPONSE:
+                semantic_cache.store(request.prompt, embedding, partition, response.model_dump(), scope="basic")
+            return response
+
         # 1)
-        enriched_prompt = prompt_builder.build_prompt(
+        base_prompt = prompt_builder.build_prompt(
             user_input=request.prompt,
             platform=request.platform,
             age_range=request.audience,
             region=request.region
         )
+        enriched_prompt = f"{base_prompt}\n\n--- User Request ---\n{request.prompt}"
 
         # 2) 
-        output = await lm_engine.ask(enriched_prompt)
+        route = dict(
+            preferred=DEFAULT_MODEL,
+            latency_budget_ms=request.latency_budget_ms,
+            deep=is_deep_query(request.prompt)
+        )
+        limits = limits_for(request.platform, request.audience)
+        if request.stream:
+            stream = get_engine(model_router.select(**route)).astream(enriched_prompt, cache_scope="basic", limits=limits)
+            return sse_response(stream_tokens(
+                stream,
+                lambda output: remember(output, stream.truncated).model_dump()
+            ))
+
+        completion = await model_router.answer(enriched_prompt, cache_scope="basic", limits=limits, **route)
 
-        return ContentResponse(output=output)
+        return remember(completion.text, completion.truncated)
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error generating content: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Generation failed")
\ No newline at end of file
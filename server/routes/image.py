@@ -1,6 +1,7 @@
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 from server.tools.generate_image import generate_image
+from server.utils.executors import run_in
 from loguru import logger
 import base64
 from io import BytesIO
@@ -17,8 +18,8 @@ async def create_image(request: ImageRequest):
     try:
         logger.info(f"Generating image for prompt: {request.prompt}")
         
-        # Generate the image (returns base64 string)
-        image_data = generate_image(request.prompt)
+        # Generate the image (returns base64 string); the Stability call blocks, keep it off the loop
+        image_data = await run_in("io", generate_image, request.prompt)
         
         # Decode the base64 image
         image_bytes = base64.b64decode(image_data)
@@ -0,0 +1,98 @@
+from fastapi import APIRouter
+from server.database.chroma_db import vector_store
+from server.database.ingestion_manifest import ingestion_manifest
+from server.database.ingestion_pipeline import ingestion_runs
+from server.services.embedding_cache import embedding_cache
+from server.services.language_detector import language_detector
+from server.services.lm_engine import engine_registry
+from server.services.market_cache import market_cache
+from server.services.market_prefetcher import market_prefetcher
+from server.services.model_router import model_router
+from server.services.price_store import price_store
+from server.services.rate_limiter import rate_limit_stats
+from server.services.response_cache import response_cache
+from server.services.semantic_cache import semantic_cache
+from server.services.template_store import template_registry
+from server.services.token_budget import token_budgeter
+from server.tools.ticker_index import ticker_index
+from server.tools.indicators import indicator_engine
+from server.utils.executors import executor_stats, run_in
+from server.utils.singleflight import singleflight_stats
+
+router = APIRouter(prefix="/metrics", tags=["Service Metrics"])
+
+@router.get("/lm_pool", summary="Per-model Groq connection pool and usage stats")
+async def lm_pool_stats():
+    return engine_registry.stats()
+
+@router.get("/response_cache", summary="Exact-match LLM response cache hit/miss counters")
+async def response_cache_stats():
+    return response_cache.stats()
+
+@router.get("/semantic_cache", summary="Semantic (near-duplicate) response cache stats")
+async def semantic_cache_stats():
+    return semantic_cache.stats()
+
+@router.get("/singleflight", summary="Calls collapsed by request coalescing, per group")
+async def singleflight_metrics():
+    return singleflight_stats()
+
+@router.get("/model_router", summary="Routing decisions and live per-model latency/error estimates")
+async def model_router_stats():
+    return model_router.stats()
+
+@router.get("/rate_limits", summary="Groq requests/tokens per minute buckets and priority queue depth, per model")
+async def rate_limits():
+    return rate_limit_stats()
+
+@router.get("/prompt_budget", summary="Prompt tokens counted and saved by the token budgeter")
+async def prompt_budget_stats():
+    return token_budgeter.stats()
+
+@router.get("/prompt_templates", summary="Active template version, reloads and memoized prompt prefixes")
+async def prompt_templates_stats():
+    return template_registry.stats()
+
+@router.get("/language", summary="Language detections, memo hits and per-request reuse")
+async def language_stats():
+    return language_detector.stats()
+
+@router.get("/market_cache", summary="Quote/fundamentals cache hits, stale serves and background refreshes")
+async def market_cache_stats():
+    return market_cache.stats()
+
+@router.get("/executors", summary="Queue depth, saturation and wait/run times of the io, nlp, market and cpu pools")
+async def executors_stats():
+    return executor_stats()
+
+@router.get("/ticker_index", summary="Ticker detection automaton size, load time and lookups")
+async def ticker_index_stats():
+    return ticker_index.stats()
+
+@router.get("/price_store", summary="Memory-mapped OHLC history: symbols, bars, incremental updates")
+async def price_store_stats():
+    return price_store.stats()
+
+@router.get("/indicators", summary="Technical indicator batches and memo hits")
+async def indicators_stats():
+    return indicator_engine.stats()
+
+@router.get("/prefetcher", summary="Watchlist prefetch cycles, refresh lag and upstream call budget")
+async def prefetcher_stats():
+    return market_prefetcher.stats()
+
+@router.get("/vector_store", summary="Shared Chroma handle: connects, health checks, Ollama reachability")
+async def vector_store_stats():
+    return {
+        **vector_store.stats(),
+        "health": await run_in("io", vector_store.health),
+        "manifest": await run_in("io", ingestion_manifest.stats)
+    }
+
+@router.get("/embedding_cache", summary="Query (memory) and chunk (disk, float16) embedding cache hits and time saved")
+async def embedding_cache_stats():
+    return embedding_cache.stats()
+
+@router.get("/ingestion", summary="PDF ingestion progress per run (running and last finished), pages/s, chunks/s and busy time per stage")
+async def ingestion_stats():
+    return ingestion_runs.stats()
@@ -0,0 +1,106 @@
+import time
+import asyncio
+from fastapi import APIRouter, HTTPException
+from pydantic import BaseModel, Field
+from typing import List, Optional
+from loguru import logger
+from server.services.multi_platform import MultiPlatformEngine, MULTI_PLATFORM_MAX_CONCURRENCY
+from server.utils.sse import format_sse, sse_response
+from server.utils.executors import run_in
+
+router = APIRouter(prefix="/generate", tags=["Multi-platform Fan-out"])
+engine = MultiPlatformEngine()
+
+class PlatformTarget(BaseModel):
+    platform: str
+    audience: str = "26-85"
+
+class MultiPlatformRequest(BaseModel):
+    prompt: str
+    region: str = "Spanish (Argentina)"
+    targets: List[PlatformTarget] = Field(default_factory=lambda: [
+        PlatformTarget(platform="twitter", audience="20-25"),
+        PlatformTarget(platform="linkedin", audience="26-85"),
+        PlatformTarget(platform="instagram", audience="20-25"),
+    ])
+    use_knowledge_base: bool = True
+    use_market_data: bool = True
+    max_concurrency: int = 3
+    stream: bool = True  # Stream each variant as soon as it is ready
+
+class Variant(BaseModel):
+    platform: str
+    audience: str
+    output: str
+    failed: bool = False
+    truncated: bool = False  # Output hit the platform length cap
+
+class MultiPlatformResponse(BaseModel):
+    variants: List[Variant]
+    language: str
+    sources: List[str]
+    ticker: Optional[str] = None
+    yahoo_link: Optional[str] = None
+
+@router.post(
+    "/multi_platform",
+    summary="Render one topic for several platforms and audiences at once",
+    description="Runs language detection, retrieval and market data once, then generates every platform variant concurrently."
+)
+async def generate_multi_platform(request: MultiPlatformRequest):
+    if not request.targets:
+        raise HTTPException(400, detail="At least one target is required")
+
+    try:
+        # 1. Shared stages (blocking, on the io pool)
+        shared = await run_in(
+            "io",
+            engine.prepare_shared,
+            request.prompt,
+            request.region,
+            request.use_knowledge_base,
+            request.use_market_data
+        )
+
+        # 2. Per-target generations with bounded concurrency
+        semaphore = asyncio.Semaphore(max(1, min(request.max_concurrency, MULTI_PLATFORM_MAX_CONCURRENCY)))
+        tasks = [
+            asyncio.create_task(engine.generate_variant(shared, target.platform, target.audience, semaphore))
+            for target in request.targets
+        ]
+        summary = {
+            "language": shared.language,
+            "sources": shared.sources,
+            "ticker": shared.ticker,
+            "yahoo_link": shared.yahoo_link
+        }
+
+        if request.stream:
+            return sse_response(_stream_variants(tasks, summary))
+
+        variants = await asyncio.gather(*tasks)
+        return MultiPlatformResponse(variants=[Variant(**variant) for variant in variants], **summary)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Multi-platform generation failed: {e}")
+        raise HTTPException(500, detail="Multi-platform generation failed")
+
+async def _stream_variants(tasks: List[asyncio.Task], summary: dict):
+    """Emits one `variant` event per finished target, then a `done` event"""
+    start = time.perf_counter()
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            variant = await next_done
+            variant["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 1)
+            yield format_sse("variant", variant)
+        yield format_sse("done", {
+            **summary,
+            "variants": len(tasks),
+            "total_time_ms": round((time.perf_counter() - start) * 1000, 1)
+        })
+    finally:
+        # Client went away: do not keep generating unseen variants
+        for task in tasks:
+            task.cancel()
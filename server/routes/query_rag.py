@@ -2,6 +2,10 @@ from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel, Field
 from server.services.query_engine import ContentQueryEngine
 from server.utils.query_depth import is_deep_query
+from server.services.lm_engine import FAILED_RESPONSE
+from server.services.semantic_cache import semantic_cache
+from server.services.template_store import template_registry
+from server.utils.sse import iter_text, sse_response, stream_tokens
 from loguru import logger
 
 router = APIRouter()
@@ -12,6 +16,7 @@ class QueryRequest(BaseModel):
     platform: str = "linkedin"
     audience: str = "26-85"
     region: str = "Spanish (Argentina)"
+    stream: bool = False  # Stream tokens as Server-Sent Events
 
 @router.post("/query/rag", tags=["Academic Research Agent (PDF/arXiv-focused)"], summary="(Knowledge Retrieval Agent) Retrieves scholarly data from arXiv and embeds it using ChromaDB.", description="Detects depth, enriches context via academic sources, and generates educational content for social platforms.")
 async def ask_query(request: QueryRequest):
@@ -34,10 +39,31 @@ async def ask_query(request: QueryRequest):
             f"Prompt: {user_query}"
         )
 
+        # Paraphrases of an already answered query skip arXiv and the LLM
+        partition = ("query_rag", request.platform, request.audience, request.region, template_registry.current.version)
+        embedding = await semantic_cache.embed(user_query)
+        cached = semantic_cache.lookup(embedding, partition)
+        if cached is not None:
+            if request.stream:
+                return sse_response(stream_tokens(iter_text(cached["response"]), lambda output: dict(cached)))
+            return dict(cached)
+
+        def remember(output: str, truncated: bool = False) -> dict:
+            payload = {"response": output, "truncated": truncated}
+            if output != FAILED_RESPONSE:
+                semantic_cache.store(user_query, embedding, partition, payload, scope="query_rag")
+            return payload
+
         # Send to your content engine
-        response = await engine.run_query(request)
-        return {"response": response}
+        if request.stream:
+            stream = await engine.stream_query(request)
+            return sse_response(stream_tokens(stream, lambda output: remember(output, stream.truncated)))
+
+        completion = await engine.run_query(request)
+        return remember(completion.text, completion.truncated)
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Query failed: {e}")
         raise HTTPException(status_code=500, detail="Failed to process query.")
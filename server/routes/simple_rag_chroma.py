@@ -1,11 +1,20 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
-from typing import List
+from typing import List, Optional
 from datetime import datetime
 from loguru import logger
 from server.tools.query_chroma import ChromaQuery
-from server.services.lm_engine import LMEngine, GroqModel
+from server.services.lm_engine import get_engine, GroqModel, FAILED_RESPONSE
+from server.services.semantic_cache import semantic_cache
+from server.services.template_store import template_registry
+from server.services.model_router import model_router
+from server.services.output_budget import GenerationLimits, limits_for
+from server.services.token_budget import PromptSection
+from server.utils.query_depth import is_deep_query
 from server.services.prompt_builder import PromptBuilder
+from server.utils.sse import iter_text, sse_response, stream_tokens
+from server.utils.executors import run_in
+from server.services.resources import resources
 
 router = APIRouter(
     prefix="/generate",
@@ -13,6 +22,8 @@ router = APIRouter(
     responses={404: {"description": "Collection not found"}},
 )
 
+DEFAULT_MODEL = GroqModel.GEMMA_9B
+
 class ChromaRequest(BaseModel):
     prompt: str
     audience: str = "26-85"
@@ -20,6 +31,8 @@ class ChromaRequest(BaseModel):
     region: str = "Spanish (Argentina)"
     n_results: int = 3
     similarity_threshold: float = 0.5
+    stream: bool = False  # Stream tokens as Server-Sent Events
+    latency_budget_ms: Optional[int] = None  # Lets the router pick a faster model
 
 class ChromaResponse(BaseModel):
     output: str
@@ -27,9 +40,11 @@ class ChromaResponse(BaseModel):
     confidence: float
     language: str
     processed_at: str
+    truncated: bool = False  # Output hit the platform length cap
 
-def get_chroma():
-    return ChromaQuery()
+def get_chroma() -> ChromaQuery:
+    # Shared instance, warmed at startup (waits for the build if it is still loading)
+    return resources.get("chroma_query")
 
 def get_prompt_builder():
     return PromptBuilder()
@@ -42,8 +57,28 @@ async def chroma_rag_endpoint(
 ):
     """Endpoint robusto con manejo de errores y respuestas claras"""
     try:
+        # 0. Paráfrasis de prompts ya respondidos salen de la caché semántica
+        partition = (
+            "chroma_rag", request.platform, request.audience, request.region,
+            request.n_results, request.similarity_threshold, template_registry.current.version
+        )
+        embedding = await semantic_cache.embed(request.prompt)
+        cached = semantic_cache.lookup(embedding, partition)
+        if cached is not None:
+            response = ChromaResponse(**{**cached, "processed_at": datetime.now().isoformat()})
+            if request.stream:
+                return sse_response(stream_tokens(iter_text(response.output), lambda output: response.model_dump()))
+            return response
+
+        def remember(response: ChromaResponse) -> ChromaResponse:
+            if not response.output.startswith(FAILED_RESPONSE):
+                semantic_cache.store(request.prompt, embedding, partition, response.model_dump(), scope="chroma_rag")
+            return response
+
         # 1. Búsqueda en ChromaDB
-        search_results = chroma.search(
+        search_results = await run_in(
+            "nlp",
+            chroma.search,
             query=request.prompt,
             n_results=request.n_results,
             similarity_threshold=request.similarity_threshold
@@ -53,18 +88,49 @@ async def chroma_rag_endpoint(
         
         # 2. Manejar caso sin resultados
         if search_results["status"] != "success":
-            return _build_no_results_response(request.prompt, lang)
-        
+            no_results = _build_no_results_response(request.prompt, lang)
+            if request.stream:
+                return sse_response(stream_tokens(
+                    iter_text(no_results.output), lambda output: no_results.model_dump()
+                ))
+            return no_results
+
         # 3. Construir respuesta con contexto
-        return await _build_response_with_context(
+        route = dict(
+            preferred=DEFAULT_MODEL,
+            latency_budget_ms=request.latency_budget_ms,
+            deep=is_deep_query(request.prompt)
+        )
+        limits = limits_for(request.platform, request.audience, lang)
+        if request.stream:
+            sections = _build_augmented_prompt(
+                prompt=request.prompt,
+                platform=request.platform,
+                audience=request.audience,
+                region=request.region,
+                search_results=search_results,
+                prompt_builder=prompt_builder
+            )
+            model = model_router.select(**route)
+            stream = get_engine(model).astream(model_router.fit(sections, model), cache_scope="chroma_rag", limits=limits)
+            return sse_response(stream_tokens(
+                stream,
+                lambda output: remember(_finalize_response(output, search_results, stream.truncated)).model_dump()
+            ))
+
+        return remember(await _build_response_with_context(
             prompt=request.prompt,
             platform=request.platform,
             audience=request.audience,
             region=request.region,
             search_results=search_results,
-            prompt_builder=prompt_builder
-        )
-        
+            prompt_builder=prompt_builder,
+            route=route,
+            limits=limits
+        ))
+
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Endpoint error: {str(e)}")
         return _build_error_response(request.prompt)
@@ -75,9 +141,33 @@ async def _build_response_with_context(
     audience: str,
     region: str,
     search_results: dict,
-    prompt_builder: PromptBuilder
+    prompt_builder: PromptBuilder,
+    route: dict,
+    limits: GenerationLimits
 ) -> ChromaResponse:
     """Construye respuesta con contexto de ChromaDB"""
+    sections = _build_augmented_prompt(
+        prompt=prompt,
+        platform=platform,
+        audience=audience,
+        region=region,
+        search_results=search_results,
+        prompt_builder=prompt_builder
+    )
+
+    # 3. Generar respuesta
+    completion = await model_router.answer(sections, cache_scope="chroma_rag", limits=limits, **route)
+    return _finalize_response(completion.text, search_results, completion.truncated)
+
+def _build_augmented_prompt(
+    prompt: str,
+    platform: str,
+    audience: str,
+    region: str,
+    search_results: dict,
+    prompt_builder: PromptBuilder
+) -> List[PromptSection]:
+    """Construye el prompt aumentado con el contexto de ChromaDB (el router lo recorta al modelo elegido)"""
     # 1. Construir contexto
     context = "\n".join(
         f"📚 Source: {source} (Relevance: {score:.0%})\n"
@@ -89,26 +179,29 @@ async def _build_response_with_context(
         )
     )
     
-    # 2. Construir prompt aumentado
-    base_prompt = prompt_builder.build_prompt(
+    # 2. Construir prompt aumentado, por secciones con prioridad
+    sections = prompt_builder.build_sections(
         user_input=prompt,
         platform=platform,
         age_range=audience,
         region=region
     )
-    
-    augmented_prompt = (
-        f"{base_prompt}\n\n"
-        f"CONTEXT FROM KNOWLEDGE BASE:\n{context}\n\n"
-        f"INSTRUCTIONS:\n"
-        f"- Answer using this context as primary source\n"
-        f"- Cite sources when possible\n"
-        f"- If context is irrelevant, say so politely"
-    )
-    
-    # 3. Generar respuesta
+    sections += [
+        # Las instrucciones van dentro de la sección: si el contexto se descarta, se descartan con él
+        PromptSection("knowledge", (
+            f"INSTRUCTIONS:\n"
+            f"- Answer using the context below as primary source\n"
+            f"- Cite sources when possible\n"
+            f"- If context is irrelevant, say so politely\n\n"
+            f"CONTEXT FROM KNOWLEDGE BASE:\n{context}"
+        ), priority=1, trimmable=True),
+        PromptSection("request", f"USER REQUEST:\n{prompt}"),
+    ]
+    return sections
+
+def _finalize_response(output: str, search_results: dict, truncated: bool = False) -> ChromaResponse:
+    """Añade la nota de confianza y arma la respuesta final"""
     confidence = sum(search_results["scores"]) / len(search_results["scores"])
-    output = await LMEngine(model_name=GroqModel.GEMMA_9B).ask(augmented_prompt)
 
     if confidence < 0.75:
         output += "\n⚠️ Note: Retrieved information may be loosely related. Please interpret with caution."
@@ -119,7 +212,8 @@ async def _build_response_with_context(
         sources=search_results["sources"],
         confidence=sum(search_results["scores"])/len(search_results["scores"]),
         language=search_results["language"],
-        processed_at=datetime.now().isoformat()
+        processed_at=datetime.now().isoformat(),
+        truncated=truncated
     )
 
 def _build_no_results_response(query: str, lang: str) -> ChromaResponse:
@@ -1,16 +1,21 @@
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 from server.tools.yahoo_data import YahooFetcher
+from server.tools.indicators import EMPTY_INDICATORS
 from server.services.prompt_builder import PromptBuilder
-from server.services.lm_engine import LMEngine, GroqModel
-from typing import Dict
+from server.services.lm_engine import get_engine, GroqModel
+from server.services.model_router import model_router
+from server.services.output_budget import limits_for
+from typing import Dict, List, Optional, Tuple
 from loguru import logger
-from langdetect import detect
+from server.services.language_detector import detect_language
+from server.utils.sse import sse_response, stream_tokens
+from server.utils.executors import run_in
 
 router = APIRouter(prefix="/yahoo", tags=["Market Data Tickers from Yahoo"])
 yahoo_service = YahooFetcher()
 prompt_builder = PromptBuilder()
-lm_engine = LMEngine(model_name=GroqModel.LLAMA3_70B)
+DEFAULT_MODEL = GroqModel.LLAMA3_70B
 
 class StoryRequest(BaseModel):
     prompt: str
@@ -18,11 +23,16 @@ class StoryRequest(BaseModel):
     platform: str = "instagram"
     region: str = "Spanish (Argentina)"
     detail_level: str = "simple"
+    stream: bool = False  # Stream tokens as Server-Sent Events
+    latency_budget_ms: Optional[int] = None  # Lets the router pick a faster model
+    comparative: bool = False  # Compare every detected ticker instead of only the first one
 
 class StoryResponse(BaseModel):
     story: str
     ticker: str
+    tickers: List[str] = []  # Every ticker included in the story
     yahoo_link: str
+    truncated: bool = False  # Story hit the platform length cap
 
 @router.post("/financial-story", response_model=StoryResponse)
 async def generate_story(request: StoryRequest):
@@ -31,69 +41,33 @@ async def generate_story(request: StoryRequest):
         if not request.prompt or len(request.prompt.strip()) < 2:
             raise HTTPException(400, detail="Prompt is too short")
 
-        # 2. Detección de tickers con manejo de errores
-        try:
-            tickers = yahoo_service.detect_tickers(request.prompt)
-            if not tickers:
-                raise HTTPException(400, detail="No financial instruments identified in query")
-        except Exception as e:
-            logger.warning(f"Ticker detection warning: {str(e)}")
-            tickers = []  # Continuamos para dar una respuesta útil
-
-        # 3. Obtener datos con estructura garantizada
-        financial_data = {}
-        if tickers:
-            financial_data = {ticker: yahoo_service.get_financial_data(ticker) for ticker in tickers}
-            main_ticker = tickers[0]
-        else:
-            # Modo de fallback para cuando no se detectan tickers
-            main_ticker = "AAPL"  # Ticker de ejemplo
-            financial_data = {main_ticker: yahoo_service.get_financial_data(main_ticker)}
-
-        ticker_data = financial_data[main_ticker]
-
-        # 4. Preparación robusta del contexto
-        try:
-            input_language = detect(request.prompt)
-        except:
-            input_language = "en"  # Default si falla la detección
-
-        context = {
-                "symbol":         ticker_data["symbol"],
-                "name":           ticker_data["name"],
-                "country":        ticker_data.get("country", "—"),
-                "current_price":  ticker_data["current_price"],
-                "currency":       ticker_data["currency"],
-                "change_pct":     ticker_data["change_pct"],
-                "sector":         ticker_data["sector"],
-                "summary":        ticker_data["summary"],
-                # Aplanamos las key_metrics
-                "pe_ratio":           ticker_data["key_metrics"]["pe_ratio"],
-                "market_cap":         ticker_data["key_metrics"]["market_cap"],
-                "fifty_two_week_high": ticker_data["key_metrics"]["fifty_two_week_high"],
-                "style":           "technical" if request.detail_level == "advanced" else "simple",
-                "detail_level":    request.detail_level,
-                "input_language":   input_language,
-                "url":              ticker_data["url"]
-            }
-
-        # 5. Generación del prompt
-        try:
-            base_prompt = prompt_builder.build_prompt(
-                user_input=request.prompt,
-                platform=request.platform,
-                age_range=request.audience,
-                region=request.region
-            )
-            yahoo_prompt = yahoo_service.load_yahoo_prompt().format(**context)
-            full_prompt = f"{base_prompt}\n\n{yahoo_prompt}"
-        except Exception as e:
-            logger.error(f"Prompt construction failed: {str(e)}")
-            raise HTTPException(500, "Content generation error")
+        # Blocking Yahoo calls run on the io pool, off the event loop. Identical
+        # concurrent fetches are coalesced by the market cache / price store singleflights
+        full_prompt, tickers, ticker_data = await run_in("io", _prepare_story, request)
+        main_ticker = tickers[0]
 
         # 6. Generación de la historia
+        route = dict(preferred=DEFAULT_MODEL, latency_budget_ms=request.latency_budget_ms)
+        limits = limits_for(request.platform, request.audience)
+        if request.stream:
+            stream = get_engine(model_router.select(**route)).astream(full_prompt, cache_scope="yahoo", limits=limits)
+            return sse_response(stream_tokens(
+                stream,
+                lambda story: StoryResponse(
+                    story=story,
+                    ticker=main_ticker,
+                    tickers=tickers,
+                    yahoo_link=ticker_data["url"],
+                    truncated=stream.truncated
+                ).model_dump()
+            ))
+
+        truncated = False
         try:
-            story = await lm_engine.ask(full_prompt)
+            completion = await model_router.answer(full_prompt, cache_scope="yahoo", limits=limits, **route)
+            story, truncated = completion.text, completion.truncated
+        except HTTPException:
+            raise
         except Exception as e:
             logger.error(f"LLM generation failed: {str(e)}")
             story = f"Could not generate analysis for {main_ticker}. Please visit {ticker_data['url']} for direct data."
@@ -101,11 +75,79 @@ async def generate_story(request: StoryRequest):
         return StoryResponse(
             story=story,
             ticker=main_ticker,
-            yahoo_link=ticker_data["url"]
+            tickers=tickers,
+            yahoo_link=ticker_data["url"],
+            truncated=truncated
         )
 
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"Unexpected error: {str(e)}")
-        raise HTTPException(500, "Financial story generation service is currently unavailable")
\ No newline at end of file
+        raise HTTPException(500, "Financial story generation service is currently unavailable")
+
+def _prepare_story(request: StoryRequest) -> Tuple[str, List[str], Dict]:
+    """Detects tickers, fetches market data and builds the story prompt"""
+    # 2. Detección de tickers con manejo de errores
+    try:
+        tickers = yahoo_service.detect_tickers(request.prompt)
+        if not tickers:
+            raise HTTPException(400, detail="No financial instruments identified in query")
+    except Exception as e:
+        logger.warning(f"Ticker detection warning: {str(e)}")
+        tickers = []  # Continuamos para dar una respuesta útil
+
+    # 3. Obtener solo los datos que van al prompt (todos en lote si es comparativo)
+    if not tickers:
+        # Modo de fallback para cuando no se detectan tickers
+        tickers = ["AAPL"]  # Ticker de ejemplo
+    if not request.comparative:
+        tickers = tickers[:1]
+    financial_data = yahoo_service.get_financial_data_many(tickers)
+
+    main_ticker = tickers[0]
+    ticker_data = financial_data[main_ticker]
+
+    # 4. Preparación robusta del contexto
+    input_language = detect_language(request.prompt)
+
+    context = {
+            "symbol":         ticker_data["symbol"],
+            "name":           ticker_data["name"],
+            "country":        ticker_data.get("country", "—"),
+            "current_price":  ticker_data["current_price"],
+            "currency":       ticker_data["currency"],
+            "change_pct":     ticker_data["change_pct"],
+            "sector":         ticker_data["sector"],
+            "summary":        ticker_data["summary"],
+            # Aplanamos las key_metrics
+            "pe_ratio":           ticker_data["key_metrics"]["pe_ratio"],
+            "market_cap":         ticker_data["key_metrics"]["market_cap"],
+            "fifty_two_week_high": ticker_data["key_metrics"]["fifty_two_week_high"],
+            # Indicadores técnicos (server/tools/indicators.py)
+            **{field: ticker_data.get(field, "N/A") for field in EMPTY_INDICATORS},
+            "style":           "technical" if request.detail_level == "advanced" else "simple",
+            "detail_level":    request.detail_level,
+            "input_language":   input_language,
+            "url":              ticker_data["url"]
+        }
+
+    # 5. Generación del prompt
+    try:
+        base_prompt = prompt_builder.build_prompt(
+            user_input=request.prompt,
+            platform=request.platform,
+            age_range=request.audience,
+            region=request.region
+        )
+        yahoo_prompt = yahoo_service.load_yahoo_prompt().format(**context)
+        if len(tickers) > 1:
+            comparison_data = "\n".join(f"  • {yahoo_service.summarize(financial_data[t])}" for t in tickers[1:])
+            comparison = yahoo_service.load_yahoo_prompt("prompt_yahoo_comparison.txt")
+            yahoo_prompt += "\n\n" + comparison.format(symbol=main_ticker, comparison_data=comparison_data)
+        full_prompt = f"{base_prompt}\n\n{yahoo_prompt}\n\n--- User Request ---\n{request.prompt}"
+    except Exception as e:
+        logger.error(f"Prompt construction failed: {str(e)}")
+        raise HTTPException(500, "Content generation error")
+
+    return full_prompt, tickers, ticker_data
\ No newline at end of file
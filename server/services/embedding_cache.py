@@ -0,0 +1,195 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from langchain_core.embeddings import Embeddings
+from loguru import logger
+from server.services.response_cache import CACHE_DIR
+
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", os.path.join(CACHE_DIR, "embeddings.sqlite3"))
+EMBEDDING_CACHE_MEMORY_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MEMORY_ENTRIES", "4096"))
+# SQLite caps the number of bound parameters per statement
+_SQL_BATCH = 500
+
+
+def text_hash(text: str) -> bytes:
+    return hashlib.sha256(text.encode("utf-8")).digest()
+
+
+class EmbeddingCache:
+    """
+    Embeddings keyed by (model, sha256(text)) with two tiers:
+    - In-memory LRU (float32) for queries, which repeat
+    - SQLite on disk (float16 blobs) for document chunks, so re-ingesting a
+      PDF does not re-embed it
+    Every lookup checks both tiers; `persist` decides where misses are
+    stored. The time spent embedding misses gives the time saved by hits.
+    """
+
+    def __init__(self, memory_entries: int = EMBEDDING_CACHE_MEMORY_ENTRIES, path: Optional[str] = EMBEDDING_CACHE_PATH):
+        self.memory_entries = memory_entries
+        self.path = path
+        self._memory: "OrderedDict[Tuple[str, bytes], np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self.counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "embed_ms": 0.0, "saved_ms": 0.0}
+        # Average embedding time per text and model, to value hits
+        self._ms_per_text: Dict[str, float] = {}
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "model TEXT, hash BLOB, vector BLOB, PRIMARY KEY (model, hash))"
+            )
+            self._db.commit()
+        return self._db
+
+    def _from_disk(self, model: str, hashes: List[bytes]) -> Dict[bytes, np.ndarray]:
+        if self.path is None or not hashes:
+            return {}
+        found = {}
+        try:
+            with self._lock:
+                db = self._connect()
+                for i in range(0, len(hashes), _SQL_BATCH):
+                    batch = hashes[i:i + _SQL_BATCH]
+                    rows = db.execute(
+                        f"SELECT hash, vector FROM embeddings WHERE model = ? AND hash IN ({','.join('?' * len(batch))})",
+                        (model, *batch)
+                    ).fetchall()
+                    for digest, vector in rows:
+                        found[digest] = np.frombuffer(vector, dtype=np.float16).astype(np.float32)
+        except sqlite3.Error as e:
+            logger.warning(f"Embedding cache read failed: {e}")
+        return found
+
+    def _to_disk(self, model: str, vectors: Dict[bytes, np.ndarray]):
+        if self.path is None or not vectors:
+            return
+        try:
+            with self._lock:
+                db = self._connect()
+                db.executemany(
+                    "INSERT OR REPLACE INTO embeddings (model, hash, vector) VALUES (?, ?, ?)",
+                    [(model, digest, vector.astype(np.float16).tobytes()) for digest, vector in vectors.items()]
+                )
+                db.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"Embedding cache write failed: {e}")
+
+    def _remember(self, model: str, vectors: Dict[bytes, np.ndarray]):
+        with self._lock:
+            for digest, vector in vectors.items():
+                self._memory[(model, digest)] = vector
+                self._memory.move_to_end((model, digest))
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def embed_many(
+        self,
+        model: str,
+        texts: Sequence[str],
+        embed: Callable[[List[str]], Sequence[Sequence[float]]],
+        persist: bool = False
+    ) -> List[np.ndarray]:
+        """
+        Embeddings of the texts in order; only the texts found in neither tier
+        go to `embed`, in one call. Misses are kept on disk when `persist`
+        (document chunks) and in memory otherwise (queries).
+        """
+        digests = [text_hash(text) for text in texts]
+        vectors: Dict[bytes, np.ndarray] = {}
+        with self._lock:
+            for digest in digests:
+                vector = self._memory.get((model, digest))
+                if vector is not None:
+                    self._memory.move_to_end((model, digest))
+                    vectors[digest] = vector
+        memory_hits = len(vectors)
+
+        pending = list(dict.fromkeys(digest for digest in digests if digest not in vectors))
+        vectors.update(self._from_disk(model, pending))
+        disk_hits = len(vectors) - memory_hits
+
+        missing = {digest: text for digest, text in zip(digests, texts) if digest not in vectors}
+        if missing:
+            start = time.perf_counter()
+            fresh = embed(list(missing.values()))
+            elapsed = (time.perf_counter() - start) * 1000
+            computed = {digest: np.asarray(vector, dtype=np.float32) for digest, vector in zip(missing, fresh)}
+            vectors.update(computed)
+            self.counters["embed_ms"] += elapsed
+            self._ms_per_text[model] = elapsed / len(missing)
+            if persist:
+                self._to_disk(model, computed)
+            else:
+                self._remember(model, computed)
+
+        hits = memory_hits + disk_hits
+        self.counters["memory_hits"] += memory_hits
+        self.counters["disk_hits"] += disk_hits
+        self.counters["misses"] += len(missing)
+        self.counters["saved_ms"] += hits * self._ms_per_text.get(model, 0.0)
+        return [vectors[digest] for digest in digests]
+
+    def stats(self) -> Dict:
+        hits = self.counters["memory_hits"] + self.counters["disk_hits"]
+        lookups = hits + self.counters["misses"]
+        disk_entries = None
+        if self.path is not None and self._db is not None:
+            with self._lock:
+                disk_entries = self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        return {
+            **{k: round(v, 1) if isinstance(v, float) else v for k, v in self.counters.items()},
+            "hit_rate": round(hits / lookups, 3) if lookups else None,
+            "memory_entries": len(self._memory),
+            "disk_entries": disk_entries,
+            "ms_per_text": {model: round(ms, 2) for model, ms in self._ms_per_text.items()}
+        }
+
+
+embedding_cache = EmbeddingCache()
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    LangChain embeddings (Ollama for the vector store) through the embedding
+    cache: document chunks go to the disk tier, queries to the memory tier.
+    Kept apart by kind, since the model prefixes each differently.
+    """
+
+    def __init__(self, inner: Embeddings, model: str, cache: EmbeddingCache = embedding_cache):
+        self.inner = inner
+        self.model = model
+        self.cache = cache
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors = self.cache.embed_many(f"{self.model}/document", texts, self.inner.embed_documents, persist=True)
+        return [vector.tolist() for vector in vectors]
+
+    def embed_query(self, text: str) -> List[float]:
+        vector, = self.cache.embed_many(f"{self.model}/query", [text], lambda texts: [self.inner.embed_query(texts[0])])
+        return vector.tolist()
+
+
+def cached_default_embedding_function():
+    """
+    chromadb's DefaultEmbeddingFunction answering repeated texts from the
+    memory tier (a subclass, so Chroma still sees the "default" function the
+    collection was created with)
+    """
+    from chromadb.utils import embedding_functions
+
+    class CachedDefaultEmbeddingFunction(embedding_functions.DefaultEmbeddingFunction):
+        def __call__(self, input):
+            embed = super().__call__
+            return embedding_cache.embed_many("chroma-default", list(input), embed)
+
+    return CachedDefaultEmbeddingFunction()
@@ -0,0 +1,261 @@
+import os
+import math
+import hashlib
+import threading
+import unicodedata
+from collections import Counter, OrderedDict
+from typing import Dict, List, Optional
+from server.utils.request_context import current_context
+
+# Texts detected per process before the oldest results are forgotten
+LANGUAGE_CACHE_SIZE = int(os.getenv("LANGUAGE_CACHE_SIZE", "4096"))
+DEFAULT_LANGUAGE = "en"
+NGRAM_SIZE = 3
+# Below this many letters (tickers and acronyms left out) only words of the
+# lexicons below count: trigram statistics of a couple of words are noise
+LANGUAGE_MIN_LETTERS = int(os.getenv("LANGUAGE_MIN_LETTERS", "12"))
+# Average per-trigram log-likelihood lead a language needs over the default
+# before the trigram model alone may overrule it
+LANGUAGE_MIN_MARGIN = float(os.getenv("LANGUAGE_MIN_MARGIN", "0.35"))
+
+# Function words (and greetings) by language: the first evidence looked at.
+# Words shared by several languages ("la", "de", "in"...) count for all of them.
+LEXICONS = {
+    "en": {
+        "the", "of", "and", "is", "are", "was", "were", "to", "in", "on", "for", "with", "what", "how",
+        "why", "which", "who", "about", "this", "that", "these", "those", "it", "its", "be", "been",
+        "should", "would", "could", "will", "can", "do", "does", "my", "your", "our", "their", "from",
+        "by", "at", "an", "or", "not", "me", "i", "you", "we", "they", "there", "than", "hello", "thanks",
+    },
+    "es": {
+        "el", "la", "los", "las", "de", "del", "que", "y", "en", "es", "son", "por", "para", "con", "una",
+        "uno", "un", "como", "cómo", "qué", "cuál", "porque", "pero", "más", "muy", "sobre", "mi", "tu",
+        "su", "sus", "este", "esta", "estos", "hoy", "está", "están", "hay", "se", "lo", "al", "también",
+        "hola", "gracias", "buenos", "días", "explícame", "dime",
+    },
+    "fr": {
+        "le", "la", "les", "de", "des", "du", "et", "est", "sont", "que", "qui", "pour", "avec", "dans",
+        "une", "un", "sur", "pas", "ne", "ce", "cette", "ces", "mon", "ma", "mes", "votre", "nous", "vous",
+        "je", "il", "elle", "ils", "au", "aux", "mais", "plus", "très", "comment", "pourquoi", "quoi",
+        "aujourd'hui", "c'est", "qu'est", "bonjour", "merci", "salut", "explique",
+    },
+    "it": {
+        "il", "lo", "la", "gli", "le", "di", "del", "della", "dei", "delle", "e", "è", "che", "per", "con",
+        "una", "uno", "un", "non", "sono", "nel", "nella", "sul", "sulla", "come", "perché", "cosa",
+        "questo", "questa", "oggi", "mi", "ma", "più", "molto", "anche", "ciao", "grazie", "buongiorno",
+        "spiega", "dimmi", "parlami",
+    },
+    "ru": {"и", "в", "не", "на", "что", "как", "это", "с", "по", "для", "привет", "спасибо"},
+}
+# Letters (nearly) exclusive to one of the shipped languages
+MARKERS = {
+    "es": set("ñ¿¡áíóú"),
+    "fr": set("çâêîôûëïœ"),
+    "it": set("ìò"),
+}
+
+# Seed texts of the languages we ship prompts for (server/prompts/languages).
+# Character trigram profiles are built from them at import time, so detection
+# is deterministic and needs no model download.
+SEED_TEXTS = {
+    "en": (
+        "what is the best way to explain inflation to young people and how does the central bank "
+        "decide the interest rate. the market is going up this week because investors expect that "
+        "the company will report strong earnings. should i buy shares of apple or tesla today? "
+        "tell me about the price of bitcoin and the economy of the united states. this is a post "
+        "for linkedin about savings, debt, taxes and the financial crisis. they have been working "
+        "with their money in the stock exchange, which was higher than it would be with bonds. "
+        "please write something simple about why prices rise and how government spending works."
+    ),
+    "es": (
+        "qué es la inflación y cómo se explica a los jóvenes. el banco central decide la tasa de "
+        "interés para controlar los precios. el mercado sube esta semana porque los inversores "
+        "esperan que la empresa publique buenos resultados. debería comprar acciones de apple o de "
+        "tesla hoy? háblame del precio del bitcoin y de la economía de argentina y de españa. "
+        "escribe una publicación para instagram sobre el ahorro, la deuda, los impuestos y la crisis "
+        "financiera. ellos trabajan con su dinero en la bolsa, que fue más alta que con los bonos. "
+        "por favor explica por qué suben los precios y cómo funciona el gasto del gobierno."
+    ),
+    "fr": (
+        "qu'est-ce que l'inflation et comment l'expliquer aux jeunes. la banque centrale décide du "
+        "taux d'intérêt pour contrôler les prix. le marché monte cette semaine parce que les "
+        "investisseurs attendent que l'entreprise publie de bons résultats. est-ce que je dois "
+        "acheter des actions d'apple ou de tesla aujourd'hui? parle-moi du prix du bitcoin et de "
+        "l'économie de la france. écris une publication pour linkedin sur l'épargne, la dette, les "
+        "impôts et la crise financière. ils travaillent avec leur argent à la bourse, qui était plus "
+        "haute qu'avec les obligations. explique pourquoi les prix augmentent et comment fonctionnent "
+        "les dépenses du gouvernement."
+    ),
+    "it": (
+        "che cos'è l'inflazione e come si spiega ai giovani. la banca centrale decide il tasso di "
+        "interesse per controllare i prezzi. il mercato sale questa settimana perché gli investitori "
+        "si aspettano che l'azienda pubblichi buoni risultati. dovrei comprare azioni di apple o di "
+        "tesla oggi? parlami del prezzo del bitcoin e dell'economia dell'italia. scrivi un post per "
+        "instagram sul risparmio, il debito, le tasse e la crisi finanziaria. loro lavorano con i "
+        "loro soldi in borsa, che era più alta che con le obbligazioni. spiega perché i prezzi "
+        "aumentano e come funziona la spesa del governo."
+    ),
+    "ru": (
+        "что такое инфляция и как объяснить её молодым людям. центральный банк решает, какой будет "
+        "процентная ставка, чтобы контролировать цены. рынок растёт на этой неделе, потому что "
+        "инвесторы ожидают, что компания опубликует хорошие результаты. стоит ли покупать акции "
+        "apple или tesla сегодня? расскажи о цене биткоина и об экономике россии. напиши пост для "
+        "linkedin о сбережениях, долге, налогах и финансовом кризисе. они работают со своими "
+        "деньгами на бирже, которая была выше, чем с облигациями. объясни, почему растут цены и "
+        "как работают государственные расходы."
+    ),
+}
+
+
+def _normalize(text: str) -> str:
+    text = unicodedata.normalize("NFC", text.lower())
+    return " ".join("".join(ch if ch.isalpha() or ch == "'" else " " for ch in text).split())
+
+
+def _ngrams(text: str) -> Counter:
+    grams = Counter()
+    for word in _normalize(text).split():
+        padded = f" {word} "
+        for i in range(len(padded) - NGRAM_SIZE + 1):
+            grams[padded[i:i + NGRAM_SIZE]] += 1
+    return grams
+
+
+def _words(text: str) -> List[str]:
+    """Lower-cased words, without tickers, cashtags, acronyms ("NVDA", "GDP", "$TSLA") or numbers"""
+    words = []
+    for token in unicodedata.normalize("NFC", text).split():
+        word = token.strip(".,;:!?¿¡()[]{}\"«»“”")
+        if not word or word.startswith("$") or any(ch.isdigit() for ch in word):
+            continue
+        if len(word) > 1 and word.isupper():
+            continue
+        words.append(word.lower())
+    return words
+
+
+class LanguageDetector:
+    """
+    Deterministic detector restricted to en/es/fr/it/ru. Evidence comes
+    first from function words and language-specific letters; character
+    trigrams (naive Bayes over SEED_TEXTS) only break ties between
+    languages with the same evidence, or decide longer texts without any,
+    and then only with a clear margin. Anything short or ambiguous falls
+    back to DEFAULT_LANGUAGE. Results are memoized by text hash.
+    """
+
+    def __init__(self, seeds: Dict[str, str] = SEED_TEXTS, cache_size: int = LANGUAGE_CACHE_SIZE):
+        self.languages = sorted(seeds)
+        self._profiles = {}
+        vocabulary = set()
+        for language, seed in seeds.items():
+            grams = _ngrams(seed)
+            vocabulary.update(grams)
+            self._profiles[language] = grams
+        size = len(vocabulary) + 1
+        # log P(gram | language) with add-one smoothing; unseen grams share one
+        # floor so text made only of unknown grams falls back to the default
+        largest = max(sum(grams.values()) for grams in self._profiles.values())
+        self._floor = math.log(1 / (largest + size))
+        self._log_probs = {
+            language: {gram: math.log((count + 1) / (sum(grams.values()) + size)) for gram, count in grams.items()}
+            for language, grams in self._profiles.items()
+        }
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[bytes, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.counters = {"detections": 0, "cache_hits": 0, "request_hits": 0}
+
+    @staticmethod
+    def text_key(text: str) -> bytes:
+        return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+    def _trigram_scores(self, text: str) -> Dict[str, float]:
+        """Average log P(gram | language) per trigram"""
+        grams = _ngrams(text)
+        total = sum(grams.values())
+        if not total:
+            return {}
+        return {
+            language: sum(count * self._log_probs[language].get(gram, self._floor) for gram, count in grams.items()) / total
+            for language in self.languages
+        }
+
+    def _classify(self, text: str) -> str:
+        words = _words(text)
+        if not words:
+            return DEFAULT_LANGUAGE
+        cleaned = " ".join(words)
+        # Cyrillic is only shipped for Russian
+        if any("Ѐ" <= ch <= "ӿ" for ch in cleaned):
+            return "ru"
+
+        evidence = {language: sum(word in LEXICONS[language] for word in words) for language in self.languages}
+        for language, letters in MARKERS.items():
+            evidence[language] += 2 * sum(ch in letters for ch in cleaned)
+        top = max(evidence.values())
+
+        if top == 0:
+            # No function word: only a long enough text with a clear trigram lead leaves the default
+            if sum(ch.isalpha() for ch in cleaned) < LANGUAGE_MIN_LETTERS:
+                return DEFAULT_LANGUAGE
+            candidates = self.languages
+        else:
+            candidates = [language for language, score in evidence.items() if score == top]
+            if len(candidates) == 1:
+                return candidates[0]
+            if DEFAULT_LANGUAGE in candidates:  # "in" is English and Italian: keep the default
+                return DEFAULT_LANGUAGE
+
+        scores = self._trigram_scores(cleaned)
+        if not scores:
+            return DEFAULT_LANGUAGE
+        best = max(candidates, key=lambda language: scores[language])
+        if DEFAULT_LANGUAGE in candidates and scores[best] - scores[DEFAULT_LANGUAGE] < LANGUAGE_MIN_MARGIN:
+            return DEFAULT_LANGUAGE
+        return best
+
+    def detect(self, text: str) -> str:
+        """Language code of the text (memoized by hash)"""
+        key = self.text_key(text)
+        with self._lock:
+            language = self._cache.get(key)
+            if language is not None:
+                self._cache.move_to_end(key)
+                self.counters["cache_hits"] += 1
+                return language
+
+        language = self._classify(text)
+        with self._lock:
+            self.counters["detections"] += 1
+            self._cache[key] = language
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return language
+
+    def stats(self) -> Dict:
+        return {**self.counters, "cached_texts": len(self._cache), "languages": self.languages}
+
+
+language_detector = LanguageDetector()
+
+
+def detect_language(text: Optional[str]) -> str:
+    """
+    Language of a text, detected at most once per request: the first
+    detection is stored in the request context and reused by every
+    component that asks about the same text.
+    """
+    if not text or not text.strip():
+        return DEFAULT_LANGUAGE
+    ctx = current_context()
+    key = language_detector.text_key(text)
+    if ctx.language is not None and ctx.language_key == key:
+        with language_detector._lock:
+            language_detector.counters["request_hits"] += 1
+        return ctx.language
+
+    language = language_detector.detect(text)
+    if ctx.language is None:
+        ctx.language, ctx.language_key = language, key
+    return language
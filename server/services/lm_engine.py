@@ -1,51 +1,396 @@
 import os
+import time
+import threading
+import httpx
 from dotenv import load_dotenv
 from langchain_groq import ChatGroq
 from langchain.schema import HumanMessage, SystemMessage
 from loguru import logger
 from enum import Enum
+from dataclasses import dataclass
+from typing import AsyncIterator, Dict, List, Optional, Tuple, Union
+from server.services.output_budget import GenerationLimits
+from server.services.response_cache import response_cache, ttl_for
+from server.services.rate_limiter import Priority, RateLimitExceeded, estimate_tokens, get_rate_limiter
+from server.utils.request_context import current_context
+from server.utils.singleflight import get_flight
 
 load_dotenv()
 
+# Connection pool settings shared by every Groq client of the registry
+GROQ_POOL_SIZE = int(os.getenv("GROQ_POOL_SIZE", "20"))
+GROQ_KEEPALIVE_CONNECTIONS = int(os.getenv("GROQ_KEEPALIVE_CONNECTIONS", str(GROQ_POOL_SIZE)))
+GROQ_KEEPALIVE_EXPIRY = float(os.getenv("GROQ_KEEPALIVE_EXPIRY", "120"))
+GROQ_TIMEOUT = float(os.getenv("GROQ_TIMEOUT", "60"))
+# Smoothing factor of the rolling latency / error-rate averages
+LM_EWMA_ALPHA = float(os.getenv("LM_EWMA_ALPHA", "0.2"))
+
+# Identical prompts in flight at the same time share one Groq call
+llm_flight = get_flight("llm")
+
+FAILED_RESPONSE = "Failed to generate response."
+NO_LIMITS = GenerationLimits()
+
 class GroqModel(str, Enum):
-    """Supported Groq models (no max_tokens)"""
+    """Supported Groq models (output caps come per call, see output_budget)"""
     LLAMA3_8B = "llama-3.1-8b-instant"     # This is faster
     LLAMA3_70B = "llama-3.3-70b-versatile" # This is a large one
     GEMMA_9B = "gemma2-9b-it"              # This is the more basic one
 
+@dataclass
+class Completion:
+    """LLM answer plus generation metadata"""
+    text: str
+    model: str
+    cached: bool = False
+    finish_reason: Optional[str] = None
+
+    @property
+    def truncated(self) -> bool:
+        """The output hit max_tokens before the model finished"""
+        return self.finish_reason == "length"
+
+
+class TokenStream:
+    """
+    Async iterator over the tokens of one streamed generation.
+    finish_reason (and truncated) are known once it is exhausted.
+    """
+
+    def __init__(self, model: str):
+        self.model = model
+        self.finish_reason: Optional[str] = None
+        self.tokens: Optional[AsyncIterator[str]] = None
+
+    def __aiter__(self) -> AsyncIterator[str]:
+        return self.tokens.__aiter__()
+
+    @property
+    def truncated(self) -> bool:
+        return self.finish_reason == "length"
+
 class LMEngine:
-    def __init__(self, model_name: str = "llama-3.1-8b-instant"):
+    def __init__(
+        self,
+        model_name: str = "llama-3.1-8b-instant",
+        http_client: Optional[httpx.Client] = None,
+        http_async_client: Optional[httpx.AsyncClient] = None
+    ):
         """
         Initialize with either:
         - String model name ("llama-3.1-8b-instant")
         - Or GroqModel enum value (GroqModel.LLAMA3_8B)
+
+        Pass http clients to reuse a pooled keep-alive transport
+        (see LMEngineRegistry); otherwise Groq creates its own.
         """
         # Convert enum to string if needed
         if isinstance(model_name, GroqModel):
             model_name = model_name.value
-            
+
         # Validate model name
         valid_models = [m.value for m in GroqModel]
         if model_name not in valid_models:
             raise ValueError(f"Invalid model. Available: {valid_models}")
 
         self.model_name = model_name
+        self.temperature = 0.7
+        self.limiter = get_rate_limiter(model_name)
         self.llm = ChatGroq(
             groq_api_key=os.getenv("GROQ_API_KEY"),
             model_name=model_name,  # Use string directly
-            temperature=0.7
+            temperature=self.temperature,
+            http_client=http_client,
+            http_async_client=http_async_client
         )
+
+        # Usage counters (read by LMEngineRegistry.stats)
+        self.requests = 0
+        self.errors = 0
+        self.truncations = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.total_latency_ms = 0.0
+        self.ewma_latency_ms: Optional[float] = None
+        self.ewma_error_rate = 0.0
+        self.last_failure_at = 0.0
         logger.info(f"LM Engine initialized with model: {model_name}")
 
-    async def ask(self, prompt: str) -> str:
-        """Generate response from LLM"""
+    def _build_messages(self, prompt: str) -> List:
+        return [
+            SystemMessage(content="You are a helpful assistant."),
+            HumanMessage(content=prompt)
+        ]
+
+    def _start_request(self) -> float:
+        self.requests += 1
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        return time.perf_counter()
+
+    def _end_request(self, start: float, outcome: str = "ok"):
+        """
+        outcome: ok, error (provider failure), cancelled (deadline hit)
+        or abandoned (client closed a stream, not the model's fault)
+        """
+        latency_ms = (time.perf_counter() - start) * 1000
+        self.in_flight -= 1
+        self.total_latency_ms += latency_ms
+        if outcome == "abandoned":
+            return
+
+        # Fast failures say nothing about latency, cancellations are a lower bound
+        if outcome != "error":
+            if self.ewma_latency_ms is None:
+                self.ewma_latency_ms = latency_ms
+            else:
+                self.ewma_latency_ms = LM_EWMA_ALPHA * latency_ms + (1 - LM_EWMA_ALPHA) * self.ewma_latency_ms
+        failed = 0.0 if outcome == "ok" else 1.0
+        if failed:
+            self.last_failure_at = time.time()
+        self.ewma_error_rate = LM_EWMA_ALPHA * failed + (1 - LM_EWMA_ALPHA) * self.ewma_error_rate
+
+    async def _acquire(self, prompt: str, limits: GenerationLimits) -> int:
+        """Waits for rate-limit capacity, returns the reserved tokens"""
+        reserved = estimate_tokens(prompt, limits.max_tokens)
+        await self.limiter.acquire(reserved, Priority.from_name(current_context().priority))
+        return reserved
+
+    def _settle(self, reserved: int, message):
+        usage = getattr(message, "usage_metadata", None)
+        if usage and usage.get("total_tokens"):
+            self.limiter.settle(reserved, usage["total_tokens"])
+
+    @staticmethod
+    def _invoke_kwargs(limits: GenerationLimits) -> Dict:
+        kwargs = {}
+        if limits.max_tokens:
+            kwargs["max_tokens"] = limits.max_tokens
+        if limits.stop:
+            kwargs["stop"] = list(limits.stop)
+        return kwargs
+
+    def _cache_key(self, prompt: str, limits: GenerationLimits) -> str:
+        return response_cache.make_key(self.model_name, prompt, self.temperature, limits.max_tokens, limits.stop)
+
+    async def _cached_response(self, key: str) -> Optional[Tuple[str, Optional[str]]]:
+        if current_context().bypass_cache:
+            return None
+        return await response_cache.aget(key)
+
+    async def ask(
+        self,
+        prompt: str,
+        cache_scope: Optional[str] = None,
+        limits: Optional[GenerationLimits] = None
+    ) -> str:
+        """Generate response from LLM (only a full rate-limit queue is raised, as a 429)"""
         try:
-            messages = [
-                SystemMessage(content="You are a helpful assistant."),
-                HumanMessage(content=prompt)
-            ]
-            response = await self.llm.ainvoke(messages)
-            return response.content
+            completion = await self.complete(prompt, cache_scope=cache_scope, limits=limits)
+            return completion.text
+        except RateLimitExceeded:
+            raise
         except Exception as e:
             logger.error(f"LLM generation error: {e}")
-            return "Failed to generate response."
\ No newline at end of file
+            return FAILED_RESPONSE
+
+    async def complete(
+        self,
+        prompt: str,
+        cache_scope: Optional[str] = None,
+        limits: Optional[GenerationLimits] = None
+    ) -> Completion:
+        """
+        Generate response from LLM, raising on provider errors.
+        Answers are served from the response cache when possible; the TTL
+        depends on cache_scope (the calling endpoint). Concurrent identical
+        requests are coalesced into a single provider call.
+        limits caps the output (max_tokens, stop sequences).
+        """
+        limits = limits or NO_LIMITS
+        key = self._cache_key(prompt, limits)
+        cached = await self._cached_response(key)
+        if cached is not None:
+            text, finish_reason = cached
+            return Completion(text=text, model=self.model_name, cached=True, finish_reason=finish_reason)
+
+        return await llm_flight.do(key, lambda: self._generate(prompt, key, cache_scope, limits))
+
+    async def _generate(self, prompt: str, key: str, cache_scope: Optional[str], limits: GenerationLimits) -> Completion:
+        reserved = await self._acquire(prompt, limits)
+        start = self._start_request()
+        outcome = "cancelled"
+        try:
+            response = await self.llm.ainvoke(self._build_messages(prompt), **self._invoke_kwargs(limits))
+            outcome = "ok"
+        except Exception:
+            self.errors += 1
+            outcome = "error"
+            raise
+        finally:
+            self._end_request(start, outcome)
+
+        self._settle(reserved, response)
+        finish_reason = response.response_metadata.get("finish_reason")
+        if finish_reason == "length":
+            self.truncations += 1
+        await response_cache.aset(
+            key, response.content, ttl_for(cache_scope), self.model_name, cache_scope or "default", finish_reason
+        )
+        return Completion(text=response.content, model=self.model_name, finish_reason=finish_reason)
+
+    def astream(
+        self,
+        prompt: str,
+        cache_scope: Optional[str] = None,
+        limits: Optional[GenerationLimits] = None
+    ) -> "TokenStream":
+        """Stream response tokens from LLM as they are generated"""
+        stream = TokenStream(self.model_name)
+        stream.tokens = self._astream(prompt, cache_scope, limits or NO_LIMITS, stream)
+        return stream
+
+    async def _astream(
+        self,
+        prompt: str,
+        cache_scope: Optional[str],
+        limits: GenerationLimits,
+        stream: "TokenStream"
+    ) -> AsyncIterator[str]:
+        key = self._cache_key(prompt, limits)
+        cached = await self._cached_response(key)
+        if cached is not None:
+            text, stream.finish_reason = cached
+            yield text
+            return
+
+        reserved = await self._acquire(prompt, limits)
+        start = self._start_request()
+        outcome = "abandoned"
+        parts = []
+        try:
+            async for chunk in self.llm.astream(self._build_messages(prompt), **self._invoke_kwargs(limits)):
+                self._settle(reserved, chunk)
+                stream.finish_reason = chunk.response_metadata.get("finish_reason") or stream.finish_reason
+                if chunk.content:
+                    parts.append(chunk.content)
+                    yield chunk.content
+            outcome = "ok"
+        except Exception as e:
+            self.errors += 1
+            outcome = "error"
+            logger.error(f"LLM streaming error: {e}")
+            raise
+        finally:
+            self._end_request(start, outcome)
+
+        if stream.truncated:
+            self.truncations += 1
+        await response_cache.aset(
+            key, "".join(parts), ttl_for(cache_scope), self.model_name, cache_scope or "default", stream.finish_reason
+        )
+
+    def stats(self) -> Dict:
+        """Usage counters for this engine"""
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "truncations": self.truncations,
+            "in_flight": self.in_flight,
+            "peak_in_flight": self.peak_in_flight,
+            "avg_latency_ms": round(self.total_latency_ms / self.requests, 1) if self.requests else None,
+            "ewma_latency_ms": round(self.ewma_latency_ms, 1) if self.ewma_latency_ms is not None else None,
+            "ewma_error_rate": round(self.ewma_error_rate, 3)
+        }
+
+
+def _pool_connections(client: httpx.AsyncClient) -> Dict:
+    """Best-effort view of the open connections of an httpx client pool"""
+    pool = getattr(getattr(client, "_transport", None), "_pool", None)
+    connections = list(getattr(pool, "connections", None) or [])
+    idle = sum(1 for conn in connections if conn.is_idle())
+    return {"open": len(connections), "idle": idle, "active": len(connections) - idle}
+
+
+class LMEngineRegistry:
+    """
+    Process-wide registry of long-lived LMEngine instances, one per GroqModel.
+    Every engine owns a pooled keep-alive httpx transport so requests reuse
+    warm TLS connections instead of building a new client each time.
+    """
+
+    def __init__(
+        self,
+        pool_size: int = GROQ_POOL_SIZE,
+        keepalive_connections: int = GROQ_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry: float = GROQ_KEEPALIVE_EXPIRY,
+        timeout: float = GROQ_TIMEOUT
+    ):
+        self.limits = httpx.Limits(
+            max_connections=pool_size,
+            max_keepalive_connections=min(keepalive_connections, pool_size),
+            keepalive_expiry=keepalive_expiry
+        )
+        self.timeout = timeout
+        self._engines: Dict[GroqModel, LMEngine] = {}
+        self._clients: Dict[GroqModel, httpx.AsyncClient] = {}
+        self._sync_clients: Dict[GroqModel, httpx.Client] = {}
+        self._lock = threading.Lock()
+
+    def get(self, model: Union[str, GroqModel]) -> LMEngine:
+        """Returns the shared engine for a model, creating it on first use"""
+        try:
+            model = GroqModel(model)
+        except ValueError:
+            raise ValueError(f"Invalid model. Available: {[m.value for m in GroqModel]}")
+
+        engine = self._engines.get(model)
+        if engine is not None:
+            return engine
+
+        with self._lock:
+            if model not in self._engines:
+                self._clients[model] = httpx.AsyncClient(limits=self.limits, timeout=self.timeout)
+                self._sync_clients[model] = httpx.Client(limits=self.limits, timeout=self.timeout)
+                self._engines[model] = LMEngine(
+                    model_name=model,
+                    http_client=self._sync_clients[model],
+                    http_async_client=self._clients[model]
+                )
+                logger.info(f"Registered pooled LM Engine for {model.value} (pool size {self.limits.max_connections})")
+            return self._engines[model]
+
+    def stats(self) -> Dict:
+        """Per-model pool and usage stats, useful to size GROQ_POOL_SIZE"""
+        return {
+            "pool_limits": {
+                "max_connections": self.limits.max_connections,
+                "max_keepalive_connections": self.limits.max_keepalive_connections,
+                "keepalive_expiry_s": self.limits.keepalive_expiry
+            },
+            "models": {
+                model.value: {
+                    **engine.stats(),
+                    "connections": _pool_connections(self._clients[model])
+                }
+                for model, engine in self._engines.items()
+            }
+        }
+
+    async def aclose(self):
+        """Closes every pooled transport (called on app shutdown)"""
+        with self._lock:
+            for model, client in self._clients.items():
+                await client.aclose()
+                self._sync_clients[model].close()
+            self._engines.clear()
+            self._clients.clear()
+            self._sync_clients.clear()
+        logger.info("LM Engine registry closed")
+
+
+engine_registry = LMEngineRegistry()
+
+def get_engine(model: Union[str, GroqModel] = GroqModel.LLAMA3_8B) -> LMEngine:
+    """Shortcut to the shared engine of a model"""
+    return engine_registry.get(model)
@@ -0,0 +1,158 @@
+import os
+import zlib
+import datetime
+import threading
+import numpy as np
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional
+from server.services.rate_limiter import TokenBucket
+
+# Which backend feeds the market cache and price store: "yfinance" (live) or "offline" (synthetic data)
+MARKET_DATA_BACKEND = os.getenv("MARKET_DATA_BACKEND", "yfinance").lower()
+# Calls per minute to the market data provider, requests and background prefetching together
+MARKET_UPSTREAM_RPM = int(os.getenv("MARKET_UPSTREAM_RPM", "60"))
+
+# Rows of an OHLC block: one contiguous row per column, bars along the second axis.
+# "day" is the bar date as days since 1970-01-01.
+OHLC_COLUMNS = ("day", "open", "high", "low", "close", "volume")
+EPOCH = datetime.date(1970, 1, 1)
+
+
+def to_day(date: datetime.date) -> int:
+    return (date - EPOCH).days
+
+
+def from_day(day: float) -> datetime.date:
+    return EPOCH + datetime.timedelta(days=int(day))
+
+
+class UpstreamBudget:
+    """
+    Global calls/min budget of the market data provider. Calls made for a
+    request only spend it (the bucket goes into debt rather than delaying
+    them); background work waits until the budget has room.
+    """
+
+    def __init__(self, per_minute: int = MARKET_UPSTREAM_RPM):
+        self._bucket = TokenBucket(per_minute)
+        self._lock = threading.Lock()
+        self.calls = 0
+
+    def spend(self, calls: int = 1):
+        with self._lock:
+            self._bucket.take(calls)
+            self.calls += calls
+
+    def wait_time(self, calls: int = 1) -> float:
+        with self._lock:
+            return self._bucket.wait_time(calls)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            self._bucket._refill()
+            return {"calls": self.calls, "available": round(self._bucket.level, 1), "rpm": self._bucket.capacity}
+
+
+class MarketDataBackend(ABC):
+    """Source of raw market data; fields mirror YahooFetcher.get_financial_data"""
+    name = "base"
+
+    @abstractmethod
+    def history(self, tickers: List[str], start: Optional[datetime.date], period: str) -> Dict[str, np.ndarray]:
+        """
+        Daily OHLC bars (a len(OHLC_COLUMNS) x n float64 block per ticker) from
+        `start` on, or for the whole `period` ("5y", "1mo"...) when start is None.
+        Tickers without data are left out.
+        """
+
+    @abstractmethod
+    def fundamentals(self, ticker: str) -> Dict:
+        """Slow-changing fields: name, country, currency, sector, summary, pe_ratio, market_cap, fifty_two_week_high"""
+
+
+def _block_from_frame(frame) -> Optional[np.ndarray]:
+    frame = frame.dropna(subset=["Close"])
+    if not len(frame):
+        return None
+    days = np.array([to_day(ts.date()) for ts in frame.index], dtype=np.float64)
+    return np.vstack([
+        days,
+        *(frame[column].to_numpy(dtype=np.float64) for column in ("Open", "High", "Low", "Close", "Volume"))
+    ])
+
+
+class YFinanceBackend(MarketDataBackend):
+    name = "yfinance"
+
+    def history(self, tickers: List[str], start: Optional[datetime.date], period: str) -> Dict[str, np.ndarray]:
+        """One bulk download for every ticker"""
+        import yfinance as yf
+        window = {"start": start.isoformat()} if start else {"period": period}
+        hist = yf.download(tickers, group_by="ticker", progress=False, threads=True, auto_adjust=False, **window)
+        if hist is None or not len(hist):
+            return {}
+        found = set(hist.columns.get_level_values(0))
+        blocks = {ticker: _block_from_frame(hist[ticker]) for ticker in tickers if ticker in found}
+        return {ticker: block for ticker, block in blocks.items() if block is not None}
+
+    def fundamentals(self, ticker: str) -> Dict:
+        import yfinance as yf
+        info = yf.Ticker(ticker).info
+        return {
+            "name": info.get("longName", ticker),
+            "country": info.get("country", "N/A"),
+            "currency": info.get("currency", "USD"),
+            "sector": info.get("sector", "N/A"),
+            "summary": info.get("longBusinessSummary", "No summary available"),
+            "pe_ratio": info.get("trailingPE", "N/A"),
+            "market_cap": info.get("marketCap"),
+            "fifty_two_week_high": info.get("fiftyTwoWeekHigh", "N/A")
+        }
+
+
+OFFLINE_ANCHOR_DAY = to_day(datetime.date(2020, 1, 1))  # Offline prices are 100 on this day
+PERIOD_DAYS = {"1mo": 31, "3mo": 92, "6mo": 183, "1y": 366, "2y": 731, "5y": 1827, "10y": 3653, "max": 3653}
+
+
+class OfflineMarketBackend(MarketDataBackend):
+    """Deterministic stand-in for yfinance (no network): local runs and tests"""
+    name = "offline"
+
+    def __init__(self, fundamentals: Optional[Dict[str, Dict]] = None, today: Optional[datetime.date] = None):
+        self._fundamentals = fundamentals or {}
+        self.today = today
+        self.calls = {"history": 0, "fundamentals": 0, "bars": 0}
+
+    def _series(self, ticker: str, first: int, last: int) -> np.ndarray:
+        """Seeded random walk over weekdays, identical for the same ticker and day"""
+        days = np.arange(first, last + 1, dtype=np.float64)
+        days = days[(days + 3) % 7 < 5]  # 1970-01-01 was a Thursday
+        seed = zlib.crc32(ticker.encode("utf-8"))
+        walk = np.cumsum(np.random.default_rng(seed).normal(0.0002, 0.015, int(last) + 1))
+        closes = 100 * np.exp(walk - walk[min(int(last), OFFLINE_ANCHOR_DAY)])[days.astype(np.int64)]
+        return np.vstack([days, closes * 0.995, closes * 1.01, closes * 0.99, closes, np.full(len(days), 1e6)])
+
+    def history(self, tickers: List[str], start: Optional[datetime.date], period: str) -> Dict[str, np.ndarray]:
+        self.calls["history"] += 1
+        last = to_day(self.today or datetime.date.today())
+        first = to_day(start) if start else last - PERIOD_DAYS.get(period, 31)
+        blocks = {ticker: self._series(ticker, first, last) for ticker in tickers}
+        self.calls["bars"] += sum(block.shape[1] for block in blocks.values())
+        return {ticker: block for ticker, block in blocks.items() if block.shape[1]}
+
+    def fundamentals(self, ticker: str) -> Dict:
+        self.calls["fundamentals"] += 1
+        return self._fundamentals.get(ticker, {
+            "name": ticker, "country": "N/A", "currency": "USD", "sector": "N/A",
+            "summary": "Offline sample data", "pe_ratio": "N/A", "market_cap": None,
+            "fifty_two_week_high": "N/A"
+        })
+
+
+MARKET_BACKENDS = {"yfinance": YFinanceBackend, "offline": OfflineMarketBackend}
+
+# Shared by the market cache, the price store and the prefetcher
+upstream_budget = UpstreamBudget()
+
+# Shared by the market cache and the price store
+market_backend: MarketDataBackend = MARKET_BACKENDS.get(MARKET_DATA_BACKEND, YFinanceBackend)()
@@ -0,0 +1,257 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+from loguru import logger
+from server.services.response_cache import CACHE_DIR
+from server.services.market_backends import MarketDataBackend, market_backend, upstream_budget
+from server.services.price_store import PriceStore, price_store
+from server.utils.singleflight import get_flight
+from server.utils.executors import get_executor
+
+MARKET_CACHE_PATH = os.getenv("MARKET_CACHE_PATH", os.path.join(CACHE_DIR, "market_data.sqlite3"))
+
+# Freshness per kind of data, override with MARKET_TTL_<KIND> / MARKET_MAX_STALE_<KIND>.
+# Within ttl an entry is served as is; between ttl and max_stale it is served
+# immediately while a background refresh runs; past max_stale callers wait.
+MARKET_TTLS = {
+    "quote":        {"ttl": 60,        "max_stale": 24 * 3600},      # current_price, change_pct (from the price store)
+    "fundamentals": {"ttl": 24 * 3600, "max_stale": 30 * 24 * 3600}  # name, sector, summary, market cap...
+}
+
+# Concurrent misses on the same (kind, ticker) share one backend call
+market_data_flight = get_flight("market_data")
+
+
+def _ttl(kind: str, field: str) -> int:
+    return int(os.getenv(f"MARKET_{field.upper()}_{kind.upper()}", MARKET_TTLS[kind][field]))
+
+
+class MarketDataCache:
+    """
+    Quote / fundamentals cache in front of the price store and a
+    MarketDataBackend with
+    stale-while-revalidate: expired entries are returned right away and
+    refreshed in the background. Entries are mirrored to SQLite, so after a
+    restart the first requests are served from disk instead of all hitting
+    Yahoo at once.
+    """
+
+    def __init__(
+        self,
+        backend: MarketDataBackend = market_backend,
+        prices: PriceStore = price_store,
+        path: Optional[str] = MARKET_CACHE_PATH
+    ):
+        self.backend = backend
+        self.prices = prices
+        self.path = path
+        self._entries: Dict[Tuple[str, str], Tuple[float, Dict]] = {}
+        self._refreshing: Set[Tuple[str, str]] = set()
+        self._lock = threading.Lock()
+        self._db = None
+        self._loaded = False
+        # Refreshes and batch lookups share the "market" pool (EXECUTOR_MARKET_WORKERS)
+        self._pool = get_executor("market")
+        self.counters = {
+            "fresh_hits": 0, "stale_hits": 0, "misses": 0, "refreshes": 0, "refresh_errors": 0, "batch_fetches": 0
+        }
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS market_data ("
+                "kind TEXT, ticker TEXT, data TEXT, fetched_at REAL, PRIMARY KEY (kind, ticker))"
+            )
+            self._db.commit()
+        return self._db
+
+    def _load(self):
+        """Warms the memory tier from disk once (entries past max_stale are skipped)"""
+        if self._loaded or self.path is None:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            self._loaded = True
+            try:
+                rows = self._connect().execute("SELECT kind, ticker, data, fetched_at FROM market_data").fetchall()
+            except sqlite3.Error as e:
+                logger.warning(f"Market cache read failed: {e}")
+                return
+            now = time.time()
+            for kind, ticker, data, fetched_at in rows:
+                if kind in MARKET_TTLS and now - fetched_at <= _ttl(kind, "max_stale"):
+                    self._entries[(kind, ticker)] = (fetched_at, json.loads(data))
+            logger.info(f"Market cache: restored {len(self._entries)} entries from {self.path}")
+
+    def _store(self, key: Tuple[str, str], data: Dict):
+        fetched_at = time.time()
+        with self._lock:
+            self._entries[key] = (fetched_at, data)
+            if self.path is None:
+                return
+            try:
+                db = self._connect()
+                db.execute(
+                    "INSERT OR REPLACE INTO market_data (kind, ticker, data, fetched_at) VALUES (?, ?, ?, ?)",
+                    (*key, json.dumps(data), fetched_at)
+                )
+                db.commit()
+            except (sqlite3.Error, TypeError, ValueError) as e:
+                logger.warning(f"Market cache write failed: {e}")
+
+    def _fetch_quotes(self, tickers: List[str]) -> Dict[str, Dict]:
+        """Quotes come from the local price history, topped up incrementally"""
+        return self.prices.quotes(tickers)
+
+    def _fetch(self, key: Tuple[str, str]) -> Dict:
+        kind, ticker = key
+        if kind == "quote":
+            fetch: Callable[[], Dict] = lambda: self._fetch_quotes([ticker])[ticker]
+        else:
+            fetch = lambda: self._fetch_fundamentals(ticker)
+        data = market_data_flight.do_sync(key, fetch)
+        self._store(key, data)
+        return data
+
+    def _fetch_fundamentals(self, ticker: str) -> Dict:
+        upstream_budget.spend()
+        return self.backend.fundamentals(ticker)
+
+    def age(self, kind: str, ticker: str) -> Optional[float]:
+        """Seconds since the entry was fetched, None when not cached"""
+        self._load()
+        entry = self._entries.get((kind, ticker))
+        return None if entry is None else time.time() - entry[0]
+
+    def refresh_many(self, kind: str, tickers: Iterable[str]) -> List[str]:
+        """
+        Fetches and stores the tickers whatever their age (background
+        prefetching); returns the ones refreshed. Quotes share one bulk
+        price history update.
+        """
+        tickers = list(dict.fromkeys(tickers))
+        if kind == "quote":
+            fetched = self._fetch_quotes(tickers)
+        else:
+            fetched = {}
+            for ticker in tickers:
+                try:
+                    fetched[ticker] = self._fetch_fundamentals(ticker)
+                except Exception as e:
+                    logger.warning(f"Refreshing fundamentals for {ticker} failed: {e}")
+        for ticker, data in fetched.items():
+            self._store((kind, ticker), data)
+        self.counters["refreshes"] += len(fetched)
+        return list(fetched)
+
+    def _refresh(self, key: Tuple[str, str]):
+        try:
+            self._fetch(key)
+            self.counters["refreshes"] += 1
+        except Exception as e:
+            self.counters["refresh_errors"] += 1
+            logger.warning(f"Background refresh of {key[0]} for {key[1]} failed, keeping stale data: {e}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def _cached(self, key: Tuple[str, str]) -> Optional[Dict]:
+        """Usable cached data (scheduling a refresh when stale), None on a miss"""
+        self._load()
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        kind = key[0]
+        age = time.time() - entry[0]
+        if age <= _ttl(kind, "ttl"):
+            self.counters["fresh_hits"] += 1
+            return entry[1]
+        if age <= _ttl(kind, "max_stale"):
+            self.counters["stale_hits"] += 1
+            with self._lock:
+                schedule = key not in self._refreshing
+                self._refreshing.add(key)
+            if schedule:
+                self._pool.submit(self._refresh, key)
+            return entry[1]
+        return None
+
+    def get(self, kind: str, ticker: str) -> Dict:
+        """Cached data of a ticker; raises only when nothing usable is cached and the backend fails"""
+        key = (kind, ticker)
+        cached = self._cached(key)
+        if cached is not None:
+            return cached
+
+        entry = self._entries.get(key)
+        self.counters["misses"] += 1
+        try:
+            return self._fetch(key)
+        except Exception:
+            if entry is not None:  # Too old, but better than nothing
+                logger.warning(f"Serving expired {kind} for {ticker}, backend unavailable")
+                return entry[1]
+            raise
+
+    def get_many(self, kind: str, tickers: Iterable[str]) -> Dict[str, Dict]:
+        """
+        Cached data of several tickers, fetching all the misses together:
+        quotes through one bulk price history update, fundamentals concurrently on a
+        market pool. Tickers the backend could not serve are left out.
+        """
+        tickers = list(dict.fromkeys(tickers))
+        found = {}
+        for ticker in tickers:
+            cached = self._cached((kind, ticker))
+            if cached is not None:
+                found[ticker] = cached
+        missing = [ticker for ticker in tickers if ticker not in found]
+
+        if len(missing) > 1:
+            self.counters["batch_fetches"] += 1
+            if kind == "quote":
+                self.counters["misses"] += len(missing)
+                try:
+                    fetched = market_data_flight.do_sync(("quotes", tuple(missing)), lambda: self._fetch_quotes(missing))
+                except Exception as e:
+                    logger.warning(f"Bulk quote download failed for {missing}: {e}")
+                    fetched = {}
+                for ticker, data in fetched.items():
+                    self._store((kind, ticker), data)
+                    found[ticker] = data
+            else:
+                futures = {ticker: self._pool.submit(self.get, kind, ticker) for ticker in missing}
+                for ticker, future in futures.items():
+                    try:
+                        found[ticker] = future.result()
+                    except Exception as e:
+                        logger.warning(f"Fetching {kind} for {ticker} failed: {e}")
+        elif missing:
+            try:
+                found[missing[0]] = self.get(kind, missing[0])
+            except Exception as e:
+                logger.warning(f"Fetching {kind} for {missing[0]} failed: {e}")
+
+        # Keep the order the tickers were asked in
+        return {ticker: found[ticker] for ticker in tickers if ticker in found}
+
+    def stats(self) -> Dict:
+        hits = self.counters["fresh_hits"] + self.counters["stale_hits"]
+        lookups = hits + self.counters["misses"]
+        return {
+            **self.counters,
+            "hit_rate": round(hits / lookups, 3) if lookups else None,
+            "entries": len(self._entries),
+            "refreshing": len(self._refreshing),
+            "backend": self.backend.name,
+            "ttls": {kind: {"ttl": _ttl(kind, "ttl"), "max_stale": _ttl(kind, "max_stale")} for kind in MARKET_TTLS}
+        }
+
+
+market_cache = MarketDataCache()
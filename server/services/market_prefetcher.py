@@ -0,0 +1,159 @@
+import os
+import time
+import asyncio
+import datetime
+from zoneinfo import ZoneInfo
+from typing import Dict, List, Optional
+from loguru import logger
+from server.services.market_backends import upstream_budget
+from server.services.market_cache import MarketDataCache, _ttl, market_cache
+from server.services.price_store import PriceStore, price_store
+from server.tools.indicators import IndicatorEngine, indicator_engine
+from server.utils.executors import run_in
+
+MARKET_PREFETCH = os.getenv("MARKET_PREFETCH", "true").lower() in {"1", "true", "yes", "on"}
+# Symbols kept warm: mega-caps, main indices and the large cryptos (comma separated override)
+DEFAULT_WATCHLIST = "AAPL,MSFT,AMZN,GOOGL,META,NVDA,TSLA,^GSPC,^DJI,^IXIC,BTC-USD,ETH-USD"
+MARKET_WATCHLIST = [s.strip() for s in os.getenv("MARKET_WATCHLIST", DEFAULT_WATCHLIST).split(",") if s.strip()]
+# Seconds between refreshes while the market trades / while it is closed. The open
+# interval stays under the quote TTL and the closed one under PRICE_STORE_REFRESH_S,
+# so requests for watchlist symbols always find fresh data
+MARKET_PREFETCH_OPEN_S = int(os.getenv("MARKET_PREFETCH_OPEN_S", "45"))
+MARKET_PREFETCH_CLOSED_S = int(os.getenv("MARKET_PREFETCH_CLOSED_S", "600"))
+# Fundamentals are refreshed once this fraction of their TTL has gone by
+FUNDAMENTALS_REFRESH_AT = 0.8
+
+# NYSE / Nasdaq regular session (exchange holidays count as open days)
+EXCHANGE_TZ = ZoneInfo("America/New_York")
+SESSION_OPEN, SESSION_CLOSE = datetime.time(9, 30), datetime.time(16, 0)
+
+
+def market_open(now: Optional[datetime.datetime] = None) -> bool:
+    local = (now or datetime.datetime.now(datetime.timezone.utc)).astimezone(EXCHANGE_TZ)
+    return local.weekday() < 5 and SESSION_OPEN <= local.time() < SESSION_CLOSE
+
+
+def trades_around_the_clock(symbol: str) -> bool:
+    """Crypto pairs (BTC-USD...) have no session"""
+    return symbol.endswith("-USD")
+
+
+class MarketPrefetcher:
+    """
+    Background scheduler (started from the app lifespan) that keeps price
+    history, quotes, fundamentals and indicators of the watchlist warm, so
+    story requests for those symbols never wait on the network. Refreshes
+    are spaced by market hours and only go out when the shared upstream
+    budget has room, leaving request traffic the priority.
+    """
+
+    def __init__(
+        self,
+        symbols: List[str] = MARKET_WATCHLIST,
+        cache: MarketDataCache = market_cache,
+        prices: PriceStore = price_store,
+        indicators: IndicatorEngine = indicator_engine
+    ):
+        self.symbols = list(dict.fromkeys(symbols))
+        self.cache = cache
+        self.prices = prices
+        self.indicators = indicators
+        self._refreshed: Dict[str, float] = {}
+        self.counters = {"cycles": 0, "symbols_refreshed": 0, "fundamentals_refreshed": 0, "errors": 0, "budget_wait_ms": 0.0}
+        self.last_cycle_ms = None
+        self.running = False
+
+    def interval(self, symbol: str, now: Optional[datetime.datetime] = None) -> int:
+        if trades_around_the_clock(symbol) or market_open(now):
+            return MARKET_PREFETCH_OPEN_S
+        return MARKET_PREFETCH_CLOSED_S
+
+    def due(self) -> List[str]:
+        now = time.time()
+        return [symbol for symbol in self.symbols if now - self._refreshed.get(symbol, 0) >= self.interval(symbol)]
+
+    async def _wait_for_budget(self):
+        start = time.perf_counter()
+        while (wait := upstream_budget.wait_time()) > 0:
+            await asyncio.sleep(wait)
+        self.counters["budget_wait_ms"] += (time.perf_counter() - start) * 1000
+
+    def _refresh_prices(self, symbols: List[str]) -> List[str]:
+        """One bulk history update, then the quotes and indicators built on it"""
+        refreshed = self.prices.update(symbols, force=True)
+        self.cache.refresh_many("quote", refreshed)
+        self.indicators.compute_many(refreshed)
+        now = time.time()
+        for symbol in refreshed:
+            self._refreshed[symbol] = now
+        return refreshed
+
+    async def cycle(self):
+        start = time.perf_counter()
+        due = self.due()
+        if due:
+            await self._wait_for_budget()
+            refreshed = await run_in("market", self._refresh_prices, due)
+            self.counters["symbols_refreshed"] += len(refreshed)
+
+        max_age = _ttl("fundamentals", "ttl") * FUNDAMENTALS_REFRESH_AT
+        for symbol in self.symbols:
+            age = self.cache.age("fundamentals", symbol)
+            if age is None or age > max_age:
+                await self._wait_for_budget()
+                self.counters["fundamentals_refreshed"] += len(
+                    await run_in("market", self.cache.refresh_many, "fundamentals", [symbol])
+                )
+
+        self.counters["cycles"] += 1
+        self.last_cycle_ms = round((time.perf_counter() - start) * 1000, 2)
+
+    def _sleep_time(self) -> float:
+        """Until the next symbol is due, re-checked at least every 30 s (market open/close)"""
+        now = time.time()
+        waits = [self._refreshed.get(symbol, 0) + self.interval(symbol) - now for symbol in self.symbols]
+        return min(30.0, max(1.0, min(waits, default=30.0)))
+
+    async def run(self):
+        """Refreshes the watchlist until cancelled"""
+        if not self.symbols:
+            return
+        logger.info(f"Prefetching market data for {len(self.symbols)} watchlist symbols")
+        self.running = True
+        try:
+            while True:
+                try:
+                    await self.cycle()
+                except Exception as e:
+                    self.counters["errors"] += 1
+                    logger.error(f"Market prefetch cycle failed: {e}")
+                await asyncio.sleep(self._sleep_time())
+        finally:
+            self.running = False
+
+    def lag(self) -> Dict[str, Optional[float]]:
+        """Seconds each symbol is behind its schedule (0 when on time, None before its first refresh)"""
+        now = time.time()
+        return {
+            symbol: round(max(0.0, now - self._refreshed[symbol] - self.interval(symbol)), 1)
+            if symbol in self._refreshed else None
+            for symbol in self.symbols
+        }
+
+    def stats(self) -> Dict:
+        lag = self.lag()
+        known = [value for value in lag.values() if value is not None]
+        return {
+            **{k: round(v, 1) if isinstance(v, float) else v for k, v in self.counters.items()},
+            "running": self.running,
+            "market_open": market_open(),
+            "watchlist": len(self.symbols),
+            "warm": len(known),
+            "max_lag_s": max(known, default=None),
+            "lag_s": lag,
+            "last_cycle_ms": self.last_cycle_ms,
+            "upstream": upstream_budget.stats()
+        }
+
+
+market_prefetcher = MarketPrefetcher()
@@ -0,0 +1,168 @@
+import os
+import time
+import asyncio
+from typing import Dict, List, Optional, Sequence, Union
+from loguru import logger
+from server.services.lm_engine import GroqModel, Completion, FAILED_RESPONSE, get_engine
+from server.services.output_budget import GenerationLimits
+from server.services.rate_limiter import RateLimitExceeded
+from server.services.token_budget import PromptSection, token_budgeter
+
+# A finished prompt, or its sections to be fitted to the token budget of the model that runs it
+Prompt = Union[str, Sequence[PromptSection]]
+
+# Static profile of every model, used until live stats are available
+MODEL_PROFILES = {
+    GroqModel.LLAMA3_8B:  {"quality": 1, "expected_latency_ms": 1500},
+    GroqModel.GEMMA_9B:   {"quality": 2, "expected_latency_ms": 2500},
+    GroqModel.LLAMA3_70B: {"quality": 3, "expected_latency_ms": 6000},
+}
+
+# Budget assumed when a request does not send one
+ROUTER_DEFAULT_BUDGET_MS = int(os.getenv("ROUTER_DEFAULT_BUDGET_MS", "8000"))
+# Hard deadline of the primary model before failing over
+ROUTER_DEFAULT_DEADLINE_MS = int(os.getenv("ROUTER_DEFAULT_DEADLINE_MS", "20000"))
+# Models whose rolling error rate is above this are skipped
+ROUTER_MAX_ERROR_RATE = float(os.getenv("ROUTER_MAX_ERROR_RATE", "0.5"))
+# Unhealthy models get a probe request again after this many seconds
+ROUTER_RETRY_AFTER_S = float(os.getenv("ROUTER_RETRY_AFTER_S", "60"))
+
+
+class ModelRouter:
+    """
+    Picks a Groq model per request from live EWMA latency and error rates
+    (tracked by each LMEngine), the request latency budget and the
+    is_deep_query signal, and fails over to a faster model when the
+    primary misses its deadline or errors out. Prompts given as sections
+    are fitted to the budget of the model that actually runs them, so a
+    failover to a model with a smaller budget gets a shorter prompt.
+    """
+
+    def __init__(self):
+        self.counters = {"routed": 0, "upgraded": 0, "downgraded": 0, "timeouts": 0, "failovers": 0}
+
+    def estimated_latency(self, model: GroqModel) -> float:
+        ewma = get_engine(model).ewma_latency_ms
+        return ewma if ewma is not None else MODEL_PROFILES[model]["expected_latency_ms"]
+
+    def is_healthy(self, model: GroqModel) -> bool:
+        engine = get_engine(model)
+        return (
+            engine.ewma_error_rate <= ROUTER_MAX_ERROR_RATE
+            or time.time() - engine.last_failure_at > ROUTER_RETRY_AFTER_S
+        )
+
+    def _by_speed(self, models: List[GroqModel]) -> List[GroqModel]:
+        return sorted(models, key=self.estimated_latency)
+
+    def select(
+        self,
+        preferred: Union[str, GroqModel] = GroqModel.LLAMA3_8B,
+        latency_budget_ms: Optional[int] = None,
+        deep: bool = False
+    ) -> GroqModel:
+        """
+        - Deep queries are upgraded to the best model that fits the budget
+        - Otherwise the preferred model is kept if it fits the budget
+        - If nothing fits, the fastest healthy model wins
+        """
+        preferred = GroqModel(preferred)
+        budget = latency_budget_ms or ROUTER_DEFAULT_BUDGET_MS
+        healthy = [model for model in GroqModel if self.is_healthy(model)] or list(GroqModel)
+        self.counters["routed"] += 1
+
+        if deep:
+            by_quality = sorted(healthy, key=lambda model: MODEL_PROFILES[model]["quality"], reverse=True)
+            for model in by_quality:
+                if self.estimated_latency(model) <= budget:
+                    if MODEL_PROFILES[model]["quality"] > MODEL_PROFILES[preferred]["quality"]:
+                        self.counters["upgraded"] += 1
+                    return model
+
+        if preferred in healthy and self.estimated_latency(preferred) <= budget:
+            return preferred
+
+        fastest = self._by_speed(healthy)[0]
+        if fastest != preferred:
+            self.counters["downgraded"] += 1
+            logger.info(f"Router: {preferred.value} over budget or unhealthy, using {fastest.value}")
+        return fastest
+
+    @staticmethod
+    def fit(prompt: Prompt, model: GroqModel) -> str:
+        """Prompt text for the model (sections are cut down to its token budget)"""
+        if isinstance(prompt, str):
+            return prompt
+        return token_budgeter.fit(prompt, model)
+
+    def fallback_for(self, model: GroqModel) -> Optional[GroqModel]:
+        """Fastest healthy model other than the one that failed"""
+        candidates = [other for other in GroqModel if other != model and self.is_healthy(other)]
+        if not candidates:
+            candidates = [other for other in GroqModel if other != model]
+        return self._by_speed(candidates)[0] if candidates else None
+
+    async def complete(
+        self,
+        prompt: Prompt,
+        preferred: Union[str, GroqModel] = GroqModel.LLAMA3_8B,
+        latency_budget_ms: Optional[int] = None,
+        deep: bool = False,
+        cache_scope: Optional[str] = None,
+        limits: Optional[GenerationLimits] = None
+    ) -> Completion:
+        """Generates with the selected model, failing over once on deadline or error"""
+        primary = self.select(preferred, latency_budget_ms, deep)
+        deadline_s = (latency_budget_ms or ROUTER_DEFAULT_DEADLINE_MS) / 1000
+        try:
+            return await asyncio.wait_for(
+                get_engine(primary).complete(self.fit(prompt, primary), cache_scope=cache_scope, limits=limits),
+                timeout=deadline_s
+            )
+        except asyncio.TimeoutError:
+            self.counters["timeouts"] += 1
+            logger.warning(f"Router: {primary.value} exceeded its {deadline_s:.1f}s deadline")
+        except RateLimitExceeded as e:
+            # Every model has its own Groq quota, so another one may still have room
+            logger.warning(f"Router: {primary.value} queue is full ({e.detail})")
+        except Exception as e:
+            logger.warning(f"Router: {primary.value} failed: {e}")
+
+        fallback = self.fallback_for(primary)
+        if fallback is None:
+            raise RuntimeError(f"No fallback model available for {primary.value}")
+        self.counters["failovers"] += 1
+        logger.info(f"Router: failing over from {primary.value} to {fallback.value}")
+        return await get_engine(fallback).complete(self.fit(prompt, fallback), cache_scope=cache_scope, limits=limits)
+
+    async def answer(self, prompt: Prompt, **kwargs) -> Completion:
+        """Same as complete but only raises RateLimitExceeded; failures come back as FAILED_RESPONSE"""
+        try:
+            return await self.complete(prompt, **kwargs)
+        except RateLimitExceeded:
+            raise
+        except Exception as e:
+            logger.error(f"LLM generation error: {e}")
+            return Completion(text=FAILED_RESPONSE, model=GroqModel(kwargs.get("preferred", GroqModel.LLAMA3_8B)).value)
+
+    async def ask(self, prompt: Prompt, **kwargs) -> str:
+        """Text-only answer (like LMEngine.ask)"""
+        return (await self.answer(prompt, **kwargs)).text
+
+    def stats(self) -> Dict:
+        return {
+            "counters": self.counters,
+            "models": {
+                model.value: {
+                    "estimated_latency_ms": round(self.estimated_latency(model), 1),
+                    "ewma_error_rate": round(get_engine(model).ewma_error_rate, 3),
+                    "healthy": self.is_healthy(model),
+                    "quality": MODEL_PROFILES[model]["quality"],
+                    "requests": get_engine(model).requests
+                }
+                for model in GroqModel
+            }
+        }
+
+
+model_router = ModelRouter()
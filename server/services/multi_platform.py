@@ -0,0 +1,110 @@
+import os
+import asyncio
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+from server.services.language_detector import detect_language
+from loguru import logger
+from server.services.prompt_builder import PromptBuilder
+from server.services.lm_engine import GroqModel, FAILED_RESPONSE
+from server.services.model_router import model_router
+from server.services.output_budget import limits_for
+from server.services.rate_limiter import RateLimitExceeded
+from server.services.token_budget import PromptSection
+from server.tools.yahoo_data import YahooFetcher
+from server.services.resources import resources
+
+# Hard cap for the per-request concurrency of the variant generations
+MULTI_PLATFORM_MAX_CONCURRENCY = int(os.getenv("MULTI_PLATFORM_MAX_CONCURRENCY", "4"))
+
+
+@dataclass
+class SharedContext:
+    """Work done once per fan-out request and reused by every variant"""
+    prompt: str
+    region: str
+    language: str
+    knowledge: str = ""
+    market_data: str = ""
+    sources: List[str] = field(default_factory=list)
+    ticker: Optional[str] = None
+    yahoo_link: Optional[str] = None
+
+
+class MultiPlatformEngine:
+    """
+    Renders one topic for several platform/audience targets.
+    Language detection, Chroma retrieval and the Yahoo fetch run once;
+    only prompt prefixes and LLM calls are per target.
+    """
+
+    def __init__(self, model_name: GroqModel = GroqModel.GEMMA_9B):
+        self.prompt_builder = PromptBuilder()
+        self.model_name = model_name
+        self.yahoo = YahooFetcher()
+
+    def prepare_shared(self, prompt: str, region: str, use_knowledge_base: bool, use_market_data: bool) -> SharedContext:
+        """Blocking shared stages, run it in a worker thread"""
+        language = detect_language(prompt)
+        shared = SharedContext(prompt=prompt, region=region, language=language)
+
+        if use_knowledge_base:
+            try:
+                results = resources.get("chroma_query").search(query=prompt, n_results=3, similarity_threshold=0.5)
+                if results["status"] == "success":
+                    shared.knowledge = "\n".join(
+                        f"📚 Source: {source} (Relevance: {score:.0%})\n{doc[:500]}"
+                        for doc, source, score in zip(results["documents"], results["sources"], results["scores"])
+                    )
+                    shared.sources = list(results["sources"])
+            except Exception as e:
+                logger.warning(f"Knowledge base lookup skipped: {e}")
+
+        if use_market_data:
+            tickers = self.yahoo.detect_tickers(prompt)
+            if tickers:
+                data = self.yahoo.get_financial_data(tickers[0])
+                shared.ticker = data["symbol"]
+                shared.yahoo_link = data["url"]
+                shared.market_data = self.yahoo.summarize(data)
+                shared.sources.append("Yahoo Finance")
+
+        return shared
+
+    def build_variant_prompt(self, shared: SharedContext, platform: str, audience: str) -> List[PromptSection]:
+        """Prompt sections of one variant; the router fits them to the model it runs on"""
+        sections = self.prompt_builder.build_sections(
+            user_input=shared.prompt,
+            platform=platform,
+            age_range=audience,
+            region=shared.region,
+            language=shared.language
+        )
+        sections += [
+            PromptSection("knowledge", f"CONTEXT FROM KNOWLEDGE BASE:\n{shared.knowledge}" if shared.knowledge else "", priority=1, trimmable=True),
+            PromptSection("market_data", f"MARKET DATA:\n{shared.market_data}" if shared.market_data else "", priority=2, trimmable=True),
+            PromptSection("request", f"--- User Request ---\n{shared.prompt}"),
+        ]
+        return sections
+
+    async def generate_variant(self, shared: SharedContext, platform: str, audience: str, semaphore: asyncio.Semaphore) -> Dict:
+        prompt = self.build_variant_prompt(shared, platform, audience)
+        # Each variant gets the length cap of its own platform and audience
+        limits = limits_for(platform, audience, shared.language)
+        truncated = False
+        async with semaphore:
+            try:
+                completion = await model_router.answer(
+                    prompt, preferred=self.model_name, cache_scope="multi_platform", limits=limits
+                )
+                output, truncated = completion.text, completion.truncated
+            except RateLimitExceeded as e:
+                # One throttled variant should not sink the whole fan-out
+                logger.warning(f"Variant {platform}/{audience} throttled: {e.detail}")
+                output = FAILED_RESPONSE
+        return {
+            "platform": platform,
+            "audience": audience,
+            "output": output,
+            "failed": output == FAILED_RESPONSE,
+            "truncated": truncated
+        }
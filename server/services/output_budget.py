@@ -0,0 +1,103 @@
+import os
+import re
+import math
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+from loguru import logger
+from server.services.template_store import template_registry
+from server.utils.request_context import current_context
+
+# Completion tokens per platform when its template declares no length target
+PLATFORM_OUTPUT_TOKENS = {
+    "twitter":   200,
+    "instagram": 450,
+    "linkedin":  700,
+}
+DEFAULT_OUTPUT_TOKENS = int(os.getenv("OUTPUT_TOKENS_DEFAULT", "1024"))
+# Room over a declared character target (hashtags, emojis, threads)
+OUTPUT_HEADROOM = float(os.getenv("OUTPUT_HEADROOM", "2.0"))
+# Characters per token by output language: accented Latin text splits into more
+# tokens than English, Cyrillic into far more. Unknown language: the lowest ratio
+CHARS_PER_TOKEN = {"en": 4.0, "es": 3.3, "fr": 3.2, "it": 3.3, "ru": 2.2}
+MIN_OUTPUT_TOKENS = 64
+
+# Younger audiences get shorter posts (platforms declaring a character target
+# leave the length to their template, which states it)
+AUDIENCE_OUTPUT_FACTORS = {
+    "08-11": 0.6,
+    "12-15": 0.8,
+    "16-19": 0.9,
+    "20-25": 1.0,
+    "26-85": 1.2,
+}
+
+# Stop sequences, separated by "||": LLM_STOP_SEQUENCES for every call,
+# LLM_STOP_SEQUENCES_<PLATFORM> on top of it for one platform (Groq accepts up to 4)
+STOP_SEPARATOR = "||"
+MAX_STOP_SEQUENCES = 4
+
+CHAR_TARGET_PATTERN = re.compile(r"(?:within|under|max(?:imum)?|up to)\s+(\d[\d,]*)\s+characters", re.IGNORECASE)
+
+
+@dataclass(frozen=True)
+class GenerationLimits:
+    """Output caps passed to Groq with a generation"""
+    max_tokens: Optional[int] = None
+    stop: Optional[Tuple[str, ...]] = None
+
+
+def declared_char_target(platform: str) -> Optional[int]:
+    """Character target written in prompts/platforms/<platform>.txt, if any"""
+    key = f"platforms/{platform}.txt"
+    store = template_registry.current
+
+    def parse() -> Optional[int]:
+        match = CHAR_TARGET_PATTERN.search(store.get(key))
+        return int(match.group(1).replace(",", "")) if match else None
+
+    return store.memoized(("char_target", key), [key], parse) if key in store else None
+
+
+def chars_per_token(language: Optional[str]) -> float:
+    return CHARS_PER_TOKEN.get(language, min(CHARS_PER_TOKEN.values()))
+
+
+def _platform_tokens(platform: str, audience: Optional[str], language: Optional[str]) -> int:
+    override = os.getenv(f"OUTPUT_TOKENS_{platform.upper()}")
+    if override:
+        return int(override)
+    chars = declared_char_target(platform)
+    if chars:
+        # Only a guard against runaway output: the template enforces the character limit
+        return math.ceil(chars / chars_per_token(language) * OUTPUT_HEADROOM)
+    tokens = PLATFORM_OUTPUT_TOKENS.get(platform, DEFAULT_OUTPUT_TOKENS)
+    return round(tokens * AUDIENCE_OUTPUT_FACTORS.get(audience, 1.0))
+
+
+def _stop_sequences(platform: Optional[str]) -> List[str]:
+    raw = os.getenv("LLM_STOP_SEQUENCES", "")
+    if platform:
+        raw += STOP_SEPARATOR + os.getenv(f"LLM_STOP_SEQUENCES_{platform.upper()}", "")
+    stop = [sequence for sequence in raw.split(STOP_SEPARATOR) if sequence]
+    if len(stop) > MAX_STOP_SEQUENCES:
+        logger.warning(f"Only the first {MAX_STOP_SEQUENCES} stop sequences are sent to Groq")
+    return stop[:MAX_STOP_SEQUENCES]
+
+
+def limits_for(
+    platform: Optional[str] = None,
+    audience: Optional[str] = None,
+    language: Optional[str] = None
+) -> GenerationLimits:
+    """
+    max_tokens and stop sequences for a platform/audience pair. The language
+    defaults to the one detected for the current request.
+    """
+    language = language or current_context().language
+    if platform:
+        max_tokens = _platform_tokens(platform, audience, language)
+    else:
+        max_tokens = round(DEFAULT_OUTPUT_TOKENS * AUDIENCE_OUTPUT_FACTORS.get(audience, 1.0))
+    max_tokens = max(MIN_OUTPUT_TOKENS, max_tokens)
+    stop = _stop_sequences(platform)
+    return GenerationLimits(max_tokens=max_tokens, stop=tuple(stop) or None)
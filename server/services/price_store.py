@@ -0,0 +1,224 @@
+import os
+import time
+import datetime
+import threading
+import numpy as np
+from urllib.parse import quote
+from typing import Dict, Iterable, List, Optional
+from loguru import logger
+from server.services.response_cache import CACHE_DIR
+from server.services.market_backends import (
+    OHLC_COLUMNS, MarketDataBackend, from_day, market_backend, to_day, upstream_budget
+)
+from server.utils.singleflight import get_flight
+
+PRICE_STORE_DIR = os.getenv("PRICE_STORE_DIR", os.path.join(CACHE_DIR, "prices"))
+# History downloaded the first time a symbol is seen
+PRICE_STORE_BACKFILL = os.getenv("PRICE_STORE_BACKFILL", "5y")
+# Seconds before a symbol is checked again for new bars
+PRICE_STORE_REFRESH_S = int(os.getenv("PRICE_STORE_REFRESH_S", "900"))
+
+# Calendar days back from the last bar for each named window ("ytd" is computed)
+WINDOWS = {"1mo": 30, "3mo": 91, "1y": 365, "5y": 5 * 365}
+
+DAY, OPEN, HIGH, LOW, CLOSE, VOLUME = range(len(OHLC_COLUMNS))
+
+price_flight = get_flight("price_history")
+
+
+class PriceStore:
+    """
+    Daily OHLC history per symbol in one .npy file each: a 6 x n float64
+    block whose rows are the columns (day, open, high, low, close, volume),
+    so every column is contiguous. Files are memory-mapped read-only and
+    range queries return views of the map (no copy). Updates only download
+    bars from the last stored day on and write a new version of the file
+    (SYMBOL.<version>.npy), never one that may still be mapped: Windows
+    refuses to replace or delete a mapped file. Older versions are deleted
+    once nothing maps them any more.
+    """
+
+    def __init__(self, backend: MarketDataBackend = market_backend, root: str = PRICE_STORE_DIR):
+        self.backend = backend
+        self.root = root
+        self._maps: Dict[str, np.ndarray] = {}
+        self._versions: Dict[str, int] = {}
+        self._checked: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        # Old versions still mapped when last written (Windows), per symbol
+        self._undeleted: Dict[str, int] = {}
+        self.counters = {"reads": 0, "updates": 0, "backfills": 0, "bars_appended": 0, "update_errors": 0}
+
+    def _path(self, symbol: str, version: int) -> str:
+        # Version 0 is the unversioned file of older stores
+        name = quote(symbol, safe="")
+        return os.path.join(self.root, f"{name}.{version}.npy" if version else f"{name}.npy")
+
+    def _stored_versions(self, symbol: str) -> List[int]:
+        """Versions of the symbol on disk, oldest first"""
+        prefix = f"{quote(symbol, safe='')}."
+        try:
+            names = os.listdir(self.root)
+        except FileNotFoundError:
+            return []
+        versions = []
+        for name in names:
+            if name.startswith(prefix) and name.endswith(".npy"):
+                middle = name[len(prefix):-len(".npy")]
+                if middle == "":
+                    versions.append(0)
+                elif middle.isdigit():
+                    versions.append(int(middle))
+        return sorted(versions)
+
+    def _open(self, symbol: str) -> Optional[np.ndarray]:
+        block = self._maps.get(symbol)
+        if block is None:
+            versions = self._stored_versions(symbol)
+            if not versions:
+                return None
+            path = self._path(symbol, versions[-1])
+            block = np.load(path, mmap_mode="r")
+            self._maps[symbol] = block
+            self._versions[symbol] = versions[-1]
+            # Bars on disk count as checked at the time they were written
+            self._checked.setdefault(symbol, os.path.getmtime(path))
+        return block
+
+    def _write(self, symbol: str, block: np.ndarray):
+        os.makedirs(self.root, exist_ok=True)
+        version = max(time.time_ns(), self._versions.get(symbol, 0) + 1)
+        path = self._path(symbol, version)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            np.save(f, np.ascontiguousarray(block, dtype=np.float64))
+        os.replace(tmp, path)  # A new name: no reader has it mapped
+        self._maps[symbol] = np.load(path, mmap_mode="r")
+        self._versions[symbol] = version
+        self._delete_old_versions(symbol, version)
+
+    def _delete_old_versions(self, symbol: str, current: int):
+        """
+        Readers may still hold views of an older map: POSIX unlinks the file
+        under them, Windows refuses (PermissionError) and the file is left
+        for the next write of the symbol to delete.
+        """
+        pending = 0
+        for version in self._stored_versions(symbol):
+            if version >= current:
+                continue
+            try:
+                os.remove(self._path(symbol, version))
+            except FileNotFoundError:
+                pass
+            except OSError:
+                pending += 1
+        self._undeleted[symbol] = pending
+
+    def _merge(self, symbol: str, fresh: np.ndarray) -> int:
+        """Stored bars before the first fresh day + fresh bars (the last stored bar may be partial)"""
+        stored = self._open(symbol)
+        if stored is None or not stored.shape[1]:
+            merged = fresh
+        else:
+            keep = int(np.searchsorted(stored[DAY], fresh[DAY][0], side="left"))
+            merged = np.concatenate([stored[:, :keep], fresh], axis=1)
+        added = merged.shape[1] - (0 if stored is None else stored.shape[1])
+        self._write(symbol, merged)
+        return added
+
+    def _download(self, group: List[str], start: Optional[datetime.date]) -> Dict[str, np.ndarray]:
+        upstream_budget.spend()
+        return self.backend.history(group, start, PRICE_STORE_BACKFILL)
+
+    def update(self, symbols: Iterable[str], force: bool = False) -> List[str]:
+        """
+        Brings the given symbols up to date with one bulk backend call per
+        start date; symbols checked in the last PRICE_STORE_REFRESH_S are skipped.
+        Returns the symbols that have history afterwards.
+        """
+        symbols = list(dict.fromkeys(symbols))
+        now = time.time()
+        with self._lock:
+            due: Dict[Optional[datetime.date], List[str]] = {}
+            for symbol in symbols:
+                block = self._open(symbol)
+                if not force and block is not None and now - self._checked.get(symbol, 0) < PRICE_STORE_REFRESH_S:
+                    continue
+                start = from_day(block[DAY][-1]) if block is not None and block.shape[1] else None
+                due.setdefault(start, []).append(symbol)
+
+        for start, group in due.items():
+            try:
+                fresh = price_flight.do_sync((tuple(group), start), lambda: self._download(group, start))
+            except Exception as e:
+                self.counters["update_errors"] += 1
+                logger.warning(f"Price history update failed for {group}: {e}")
+                continue
+            with self._lock:
+                for symbol in group:
+                    self._checked[symbol] = now
+                    if symbol in fresh:
+                        self.counters["bars_appended"] += self._merge(symbol, fresh[symbol])
+                self.counters["updates" if start else "backfills"] += 1
+
+        return [symbol for symbol in symbols if self._open(symbol) is not None]
+
+    def range(self, symbol: str, start: Optional[datetime.date] = None, end: Optional[datetime.date] = None) -> Optional[np.ndarray]:
+        """Bars with start <= day <= end as a zero-copy view of the memory map"""
+        block = self._open(symbol)
+        if block is None:
+            return None
+        self.counters["reads"] += 1
+        days = block[DAY]
+        i = int(np.searchsorted(days, to_day(start), side="left")) if start else 0
+        j = int(np.searchsorted(days, to_day(end), side="right")) if end else block.shape[1]
+        return block[:, i:j]
+
+    def window(self, symbol: str, name: str) -> Optional[np.ndarray]:
+        """Named window ending at the last stored bar: 1mo, 3mo, ytd, 1y, 5y"""
+        block = self._open(symbol)
+        if block is None or not block.shape[1]:
+            return None
+        last = from_day(block[DAY][-1])
+        if name == "ytd":
+            start = datetime.date(last.year, 1, 1)
+        else:
+            start = last - datetime.timedelta(days=WINDOWS[name])
+        return self.range(symbol, start)
+
+    def change_pct(self, symbol: str, name: str) -> Optional[float]:
+        bars = self.window(symbol, name)
+        if bars is None or bars.shape[1] < 2:
+            return None
+        closes = bars[CLOSE]
+        return float((closes[-1] - closes[0]) / closes[0] * 100)
+
+    def quotes(self, symbols: Iterable[str]) -> Dict[str, Dict]:
+        """Last close and performance over every window, after an incremental update"""
+        quotes = {}
+        for symbol in self.update(symbols):
+            block = self._open(symbol)
+            if not block.shape[1]:
+                continue
+            performance = {name: self.change_pct(symbol, name) for name in [*WINDOWS, "ytd"]}
+            quotes[symbol] = {
+                "current_price": float(block[CLOSE][-1]),
+                "change_pct": performance["1mo"] or 0.0,
+                "as_of": from_day(block[DAY][-1]).isoformat(),
+                "performance": {name: round(value, 2) for name, value in performance.items() if value is not None}
+            }
+        return quotes
+
+    def stats(self) -> Dict:
+        return {
+            **self.counters,
+            "symbols_mapped": len(self._maps),
+            "bars_mapped": int(sum(block.shape[1] for block in self._maps.values())),
+            "old_versions_undeleted": sum(self._undeleted.values()),
+            "backfill": PRICE_STORE_BACKFILL,
+            "refresh_s": PRICE_STORE_REFRESH_S
+        }
+
+
+price_store = PriceStore()
@@ -1,9 +1,32 @@
-import os
-from langdetect import detect
+from typing import Dict, FrozenSet, List, NamedTuple, Optional, Tuple
 from loguru import logger
+from server.utils.request_context import current_context
+from server.services.language_detector import detect_language
+from server.services.template_store import PROMPT_DIR, TemplateStore, template_registry
+from server.services.token_budget import PromptSection
+
+SUPPORTED_LANGUAGES = ["en", "es", "fr", "it", "ru"]  # One per prompts/languages file
+
+
+class PromptKey(NamedTuple):
+    """Template combination a prompt prefix depends on"""
+    language: str
+    platform: Optional[str]
+    age_range: Optional[str]
+    dialect: str
+    region: Optional[str]  # Label quoted in the response instruction when adapting
+
+    def templates(self) -> FrozenSet[str]:
+        """Template files read to build this combination"""
+        return frozenset(filter(None, [
+            "base.txt",
+            f"languages/{self.language}.txt",
+            "languages/en.txt",  # Fallback when the language file is missing
+            f"platforms/{self.platform}.txt" if self.platform else None,
+            f"age_groups/{self.age_range}.txt" if self.age_range else None,
+            f"dialects/{self.dialect}.txt",
+        ]))
 
-BASE_DIR = os.path.dirname(os.path.dirname(__file__))
-PROMPT_DIR = os.path.join(BASE_DIR, "prompts")
 
 class PromptBuilder:
     def __init__(self):
@@ -49,21 +72,36 @@ class PromptBuilder:
     def normalize_region(self, region_label: str) -> str:
         return self.region_map.get(region_label, "default")
 
-    def _load_file(self, path: str) -> str:
-        try:
-            with open(path, "r", encoding="utf-8") as f:
-                return f.read()
-        except Exception as e:
-            logger.warning(f"Failed to load prompt file: {path} | {e}")
-            return ""
+    def build_prompt(self, user_input: str, platform: str, age_range: str, region: str = None, language: str = None) -> str:
+        # Memoized per template combination: building a prompt is a lookup + one join
+        store = self._snapshot()
+        key = self._resolve(store, user_input, platform, age_range, region, language)
+        return store.memoized(
+            ("prefix", key),
+            key.templates(),
+            lambda: "\n\n".join(section.text for section in self._sections(store, key))
+        )
+
+    def build_sections(self, user_input: str, platform: str, age_range: str, region: str = None, language: str = None) -> List[PromptSection]:
+        """Same templates as build_prompt, as sections the token budgeter can trim"""
+        store = self._snapshot()
+        # A fresh list: callers append their own sections to it
+        return list(self._sections(store, self._resolve(store, user_input, platform, age_range, region, language)))
+
+    @staticmethod
+    def _snapshot() -> TemplateStore:
+        """Active template version, recorded so the response can report it"""
+        store = template_registry.current
+        current_context().template_version = store.version
+        return store
 
-    def build_prompt(self, user_input: str, platform: str, age_range: str, region: str = None) -> str:
-        # Step 1: Detect language with enhanced reliability
+    def _resolve(self, store: TemplateStore, user_input: str, platform: str, age_range: str, region: str = None, language: str = None) -> PromptKey:
+        """Reduces a request to the template combination it needs (the memo key)"""
+        # Step 1: Language of the request (detected once per request, skipped if the caller already knows it)
         try:
-            language = detect(user_input)
+            language = language or detect_language(user_input)
             # Validate against supported languages
-            supported_languages = ["en", "es", "fr"]  # Add others as needed
-            if language not in supported_languages:
+            if language not in SUPPORTED_LANGUAGES:
                 language = "en"  # Default to English for unsupported languages
         except Exception as e:
             logger.error(f"Language detection failed: {e}")
@@ -81,49 +119,64 @@ class PromptBuilder:
             region_language == language and
             language in ["en", "es", "fr"]  # Only for languages we have regional variants for
         )
-        
-        # Step 4: Build paths
-        paths = {
-            "base": os.path.join(PROMPT_DIR, "base.txt"),
-            "language": os.path.join(PROMPT_DIR, "languages", f"{language}.txt"),
-            "platform": os.path.join(PROMPT_DIR, "platforms", f"{platform}.txt"),
-            "age": os.path.join(PROMPT_DIR, "age_groups", f"{age_range}.txt"),
-            "dialect": os.path.join(PROMPT_DIR, "dialects", 
-                                f"{normalized_region}.txt" if use_regional_adaptation else "default.txt")
-        }
 
+        # Unknown platforms/audiences have no template: keep them out of the memo key
+        return PromptKey(
+            language=language,
+            platform=platform if f"platforms/{platform}.txt" in store else None,
+            age_range=age_range if f"age_groups/{age_range}.txt" in store else None,
+            dialect=normalized_region if use_regional_adaptation else "default",
+            region=region if use_regional_adaptation else None
+        )
+
+    def _sections(self, store: TemplateStore, key: PromptKey) -> Tuple[PromptSection, ...]:
+        return store.memoized(("sections", key), key.templates(), lambda: self._compile(store, key))
+
+    def _compile(self, store: TemplateStore, key: PromptKey) -> Tuple[PromptSection, ...]:
+        """Assembles the sections of one template combination (runs once per key)"""
+        language = key.language
+
+        # Step 4: Pick the templates from the in-memory store
+        language_key = f"languages/{language}.txt"
         # Ensure language file exists
-        if not os.path.exists(paths["language"]):
+        if language_key not in store:
             logger.warning(f"Language file not found for {language}, falling back to English")
-            paths["language"] = os.path.join(PROMPT_DIR, "languages", "en.txt")
+            language_key = "languages/en.txt"
 
-        # Load components
-        components = {key: self._load_file(path) for key, path in paths.items()}
+        components = {
+            "base": store.get("base.txt"),
+            "language": store.get(language_key),
+            "platform": store.get(f"platforms/{key.platform}.txt") if key.platform else "",
+            "age": store.get(f"age_groups/{key.age_range}.txt") if key.age_range else "",
+            "dialect": store.get(f"dialects/{key.dialect}.txt")
+        }
 
         # Step 5: Build response instruction
-        if use_regional_adaptation:
+        if key.region:
             response_instruction = (
-                f"\n\nRespond in {language}, adapting your response to the linguistic style of {region}. "
-                f"Maintain all regional expressions and vocabulary appropriate for {region}."
+                f"Respond in {language}, adapting your response to the linguistic style of {key.region}. "
+                f"Maintain all regional expressions and vocabulary appropriate for {key.region}."
             )
         else:
             response_instruction = (
-                f"\n\nRespond in {language}. "
+                f"Respond in {language}. "
                 f"Do not use regional adaptations as the input language doesn't match the selected region."
             )
         
         # Special case for unsupported languages
-        if language not in supported_languages:
+        if language not in SUPPORTED_LANGUAGES:
             response_instruction += (
                 "\n\nNote: The user's language isn't fully supported. "
                 "Keep the response simple and easy to understand."
             )
 
+        # Persona notes (dialect, then platform/audience) go before the evidence callers add (priority 1-2)
         return (
-            f"{components['base']}\n\n"
-            f"{components['language']}\n\n"
-            f"{components['dialect']}\n\n"
-            f"{components['platform']}\n\n"
-            f"{components['age']}\n\n"
-            f"{response_instruction}"
-        )
\ No newline at end of file
+            PromptSection("base", components["base"]),
+            PromptSection("language", components["language"]),
+            PromptSection("dialect", components["dialect"], priority=4, trimmable=True),
+            PromptSection("platform", components["platform"], priority=3, trimmable=True, min_tokens=200),
+            PromptSection("age", components["age"], priority=3, trimmable=True),
+            PromptSection("instruction", response_instruction),
+        )
+
@@ -2,62 +2,90 @@ import os
 from typing import List
 from loguru import logger
 from server.services.prompt_builder import PromptBuilder
-from server.services.lm_engine import LMEngine
+from server.services.lm_engine import Completion, TokenStream, get_engine
+from server.services.model_router import model_router
+from server.services.output_budget import limits_for
+from server.services.token_budget import PromptSection
+from server.utils.query_depth import is_deep_query
 from server.tools.pdf_fetcher import PDFRetriever
-from server.database.chroma_db import (create_or_update_vector_db,query_chroma_db)
+from server.database.chroma_db import (create_or_update_vector_db, ingestion_lock, query_chroma_db)
+from server.utils.executors import run_in
 
 
 class ContentQueryEngine:
     def __init__(self, model_name: str = "llama-3.1-8b-instant"):
         self.prompt_builder = PromptBuilder()
-        self.lm_engine = LMEngine(model_name)
+        self.model_name = model_name
         self.pdf_retriever = PDFRetriever(
             save_dir="server/database/data_pdfs",
             max_results=5,
             categories=None
         )
 
-    async def run_query(self, request) -> str:
+    async def run_query(self, request) -> Completion:
+        sections = await self.prepare_prompt(request)
+        return await model_router.answer(
+            sections,
+            preferred=self.model_name,
+            deep=is_deep_query(request.prompt),
+            cache_scope="query_rag",
+            limits=limits_for(request.platform, request.audience)
+        )
+
+    async def stream_query(self, request) -> TokenStream:
+        """Same pipeline as run_query but streams the answer tokens"""
+        sections = await self.prepare_prompt(request)
+        model = model_router.select(self.model_name, deep=is_deep_query(request.prompt))
+        return get_engine(model).astream(
+            model_router.fit(sections, model), cache_scope="query_rag", limits=limits_for(request.platform, request.audience)
+        )
+
+    def index_pdfs(self, pdf_paths: List[str]):
+        """
+        Indexes the downloaded PDFs, then deletes them. Both under the
+        ingestion lock of the directory, so a concurrent request never has
+        its run parse a file this one is removing.
+        """
+        save_dir = self.pdf_retriever.save_dir
+        with ingestion_lock(save_dir):
+            create_or_update_vector_db(save_dir)
+
+            # Eliminate PDFs to not surcharge
+            for path in pdf_paths:
+                try:
+                    os.remove(path)
+                except Exception as e:
+                    logger.error(f"Error deleting temporary PDF {path}: {e}")
+        logger.debug("Temporary PDF files cleaned up.")
+
+    async def prepare_prompt(self, request) -> List[PromptSection]:
         logger.info(f"Processing user input: {request.prompt}")
 
         # Prompt base
-        base_prompt = self.prompt_builder.build_prompt(
+        sections = self.prompt_builder.build_sections(
             user_input=request.prompt,
             platform=request.platform,
             age_range=request.audience,
             region=request.region
         )
 
-        # Download PDFs 
-        pdf_paths: List[str] = self.pdf_retriever.retrieve(request.prompt)
+        # Download PDFs (translation and arXiv on the io pool, keywords on the nlp pool)
+        pdf_paths: List[str] = await self.pdf_retriever.aretrieve(request.prompt)
         doc_text = ""
 
         if pdf_paths:
             # Indexa ChromaDB
-            create_or_update_vector_db(self.pdf_retriever.save_dir)
+            await run_in("io", self.index_pdfs, pdf_paths)
 
             # 5) Recuperar chunks relevantes
-            chunks = query_chroma_db(request.prompt, k=5)
+            chunks = await run_in("io", query_chroma_db, request.prompt, 5)
+            # Chunks come ranked, so trimming the tail drops the least relevant first
             doc_text = " | ".join([c.page_content[:500] for c in chunks])
             logger.debug("PDF-based content enrichment added.")
 
-            # Eliminate PDFs to not surcharge
-            for path in pdf_paths:
-                try:
-                    os.remove(path)
-                except Exception as e:
-                    logger.error(f"Error deleting temporary PDF {path}: {e}")
-            logger.debug("Temporary PDF files cleaned up.")
-
-        # Make final prompt
-        enriched_prompt = f"""
-{base_prompt}
-
---- Supporting Knowledge ---
-{doc_text}
-
---- User Request ---
-{request.prompt}
-"""
+        # Final prompt sections, cut down to the token budget of the model the router picks
+        if doc_text:
+            sections.append(PromptSection("knowledge", f"--- Supporting Knowledge ---\n{doc_text}", priority=1, trimmable=True))
+        sections.append(PromptSection("request", f"--- User Request ---\n{request.prompt}"))
         logger.info("Final prompt composed. Sending to LLM.")
-        return await self.lm_engine.ask(enriched_prompt)
+        return sections
@@ -0,0 +1,203 @@
+import os
+import math
+import time
+import heapq
+import asyncio
+import itertools
+from enum import IntEnum
+from typing import Dict, List, Optional, Tuple
+from fastapi import HTTPException
+from loguru import logger
+from server.services.token_budget import token_budgeter
+
+# Groq free-tier limits per model, override with GROQ_RPM_<MODEL> / GROQ_TPM_<MODEL>
+# (<MODEL> is the GroqModel member name, e.g. GROQ_TPM_LLAMA3_70B)
+GROQ_RATE_LIMITS = {
+    "llama-3.1-8b-instant":    {"key": "LLAMA3_8B",  "rpm": 30, "tpm": 6000},
+    "llama-3.3-70b-versatile": {"key": "LLAMA3_70B", "rpm": 30, "tpm": 12000},
+    "gemma2-9b-it":            {"key": "GEMMA_9B",   "rpm": 30, "tpm": 15000},
+}
+# Waiting callers per model before new ones get a 429
+GROQ_MAX_QUEUE_DEPTH = int(os.getenv("GROQ_MAX_QUEUE_DEPTH", "50"))
+# Seconds a caller waits in the queue before getting a 429 too
+GROQ_MAX_WAIT_S = float(os.getenv("GROQ_MAX_WAIT_S", "30"))
+# Completion tokens reserved up front, settled with the real usage afterwards
+GROQ_EXPECTED_OUTPUT_TOKENS = int(os.getenv("GROQ_EXPECTED_OUTPUT_TOKENS", "512"))
+
+
+class Priority(IntEnum):
+    """Lower value is served first"""
+    INTERACTIVE = 0
+    BATCH = 1
+
+    @classmethod
+    def from_name(cls, name: str) -> "Priority":
+        return cls.__members__.get(name.upper(), cls.BATCH)
+
+
+class RateLimitExceeded(HTTPException):
+    """Raised when the wait queue of a model is full or a caller waited too long (HTTP 429 + Retry-After)"""
+
+    def __init__(self, model: str, retry_after: int, reason: str = "Too many queued requests"):
+        super().__init__(
+            status_code=429,
+            detail=f"{reason} for {model}, retry in {retry_after}s",
+            headers={"Retry-After": str(retry_after)}
+        )
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Continuously refilled bucket; the level may go negative to record debt"""
+
+    def __init__(self, capacity: float, per_seconds: float = 60.0):
+        self.capacity = capacity
+        self.rate = capacity / per_seconds
+        self.level = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` can be taken (0 when available now)"""
+        self._refill()
+        missing = min(amount, self.capacity) - self.level
+        return max(0.0, missing / self.rate)
+
+    def take(self, amount: float):
+        self._refill()
+        self.level -= amount
+
+
+class ModelRateLimiter:
+    """
+    Requests/min and tokens/min buckets of one Groq model with a priority
+    queue in front: when the buckets are empty callers wait in line, and
+    interactive callers are always granted before batch ones.
+    """
+
+    def __init__(
+        self,
+        model: str,
+        rpm: int,
+        tpm: int,
+        max_queue_depth: int = GROQ_MAX_QUEUE_DEPTH,
+        max_wait_s: float = GROQ_MAX_WAIT_S
+    ):
+        self.model = model
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.max_queue_depth = max_queue_depth
+        self.max_wait_s = max_wait_s
+        self._waiters: List[Tuple[int, int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._dispatcher: Optional[asyncio.Task] = None
+        self.counters = {"granted": 0, "queued": 0, "rejected": 0, "timed_out": 0, "wait_ms": 0.0}
+
+    def _wait_time(self, tokens: int) -> float:
+        return max(self.requests.wait_time(1), self.tokens.wait_time(tokens))
+
+    def _grant(self, tokens: int):
+        self.requests.take(1)
+        self.tokens.take(tokens)
+        self.counters["granted"] += 1
+
+    def retry_after(self, tokens: int = 0) -> int:
+        """Seconds until the buckets refill enough for the callers in line plus one more of `tokens`"""
+        waiting = [queued for _, _, queued, future in self._waiters if not future.done()]
+        self.requests._refill()
+        self.tokens._refill()
+        wait = max(
+            (len(waiting) + 1 - self.requests.level) / self.requests.rate,
+            (sum(waiting) + tokens - self.tokens.level) / self.tokens.rate
+        )
+        return max(1, math.ceil(wait))
+
+    async def acquire(self, tokens: int, priority: Priority = Priority.BATCH):
+        """Waits for a slot, raising RateLimitExceeded when the queue is full or the wait exceeds max_wait_s"""
+        if not self._waiters and self._wait_time(tokens) == 0:
+            self._grant(tokens)
+            return
+
+        if len(self._waiters) >= self.max_queue_depth:
+            self.counters["rejected"] += 1
+            retry_after = self.retry_after(tokens)
+            logger.warning(f"Rate limiter: queue full for {self.model}, rejecting (Retry-After {retry_after}s)")
+            raise RateLimitExceeded(self.model, retry_after)
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (int(priority), next(self._seq), tokens, future))
+        self.counters["queued"] += 1
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+
+        start = time.perf_counter()
+        try:
+            # On timeout the future is cancelled and the dispatcher skips it
+            await asyncio.wait_for(future, self.max_wait_s)
+        except asyncio.TimeoutError:
+            self.counters["timed_out"] += 1
+            retry_after = self.retry_after(tokens)
+            logger.warning(f"Rate limiter: waited {self.max_wait_s:.0f}s for {self.model} (Retry-After {retry_after}s)")
+            raise RateLimitExceeded(self.model, retry_after, "Rate limit wait timed out") from None
+        finally:
+            self.counters["wait_ms"] += (time.perf_counter() - start) * 1000
+
+    async def _dispatch(self):
+        """Grants queued callers in priority order as the buckets refill"""
+        while self._waiters:
+            _, _, tokens, future = self._waiters[0]
+            if future.done():  # Caller went away while waiting
+                heapq.heappop(self._waiters)
+                continue
+            wait = self._wait_time(tokens)
+            if wait > 0:
+                # Re-check the head afterwards: an interactive caller may have arrived
+                await asyncio.sleep(wait)
+                continue
+            heapq.heappop(self._waiters)
+            self._grant(tokens)
+            future.set_result(None)
+
+    def settle(self, reserved: int, used: int):
+        """Corrects the token bucket with the real usage reported by Groq"""
+        self.tokens.take(used - reserved)
+
+    def stats(self) -> Dict:
+        self.requests._refill()
+        self.tokens._refill()
+        return {
+            **{k: round(v, 1) if isinstance(v, float) else v for k, v in self.counters.items()},
+            "queue_depth": len(self._waiters),
+            "requests_available": round(self.requests.level, 1),
+            "tokens_available": round(self.tokens.level),
+            "rpm": self.requests.capacity,
+            "tpm": self.tokens.capacity
+        }
+
+
+def _limit(model: str, kind: str) -> int:
+    config = GROQ_RATE_LIMITS[model]
+    return int(os.getenv(f"GROQ_{kind.upper()}_{config['key']}", config[kind]))
+
+
+_limiters: Dict[str, ModelRateLimiter] = {}
+
+
+def get_rate_limiter(model: str) -> ModelRateLimiter:
+    """Process-wide limiter of a Groq model"""
+    if model not in _limiters:
+        _limiters[model] = ModelRateLimiter(model, _limit(model, "rpm"), _limit(model, "tpm"))
+    return _limiters[model]
+
+
+def estimate_tokens(prompt: str, max_tokens: Optional[int] = None) -> int:
+    """Prompt + completion estimate used for the reservation"""
+    return token_budgeter.count(prompt) + min(max_tokens or GROQ_EXPECTED_OUTPUT_TOKENS, GROQ_EXPECTED_OUTPUT_TOKENS)
+
+
+def rate_limit_stats() -> Dict[str, Dict]:
+    return {model: limiter.stats() for model, limiter in _limiters.items()}
@@ -0,0 +1,163 @@
+import os
+import time
+import asyncio
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Optional
+from loguru import logger
+from server.utils.executors import run_in
+
+RESOURCES_WARM_UP = os.getenv("RESOURCES_WARM_UP", "true").lower() in {"1", "true", "yes", "on"}
+CHROMA_PATH = os.getenv("CHROMA_PATH", "data/chroma_db")
+# Seconds a failed build is remembered before get() tries the factory again
+RESOURCES_RETRY_S = float(os.getenv("RESOURCES_RETRY_S", "30"))
+
+
+class ResourceUnavailable(RuntimeError):
+    """The last build failed and the retry interval has not elapsed"""
+
+
+@dataclass
+class Resource:
+    name: str
+    factory: Callable[[], Any]
+    warm: bool  # Built at startup
+    required: bool  # /ready waits for it (optional ones degrade their endpoints only)
+    value: Any = None
+    state: str = "pending"  # pending -> loading -> ready | failed
+    load_ms: Optional[float] = None
+    error: Optional[str] = None
+    retry_at: float = 0.0  # time.monotonic() of the next build attempt after a failure
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+
+class ResourceRegistry:
+    """
+    Heavy process-wide objects (NLP models, embedding function, Chroma
+    client...) built once and shared by every request. The app lifespan
+    warms them in the background; a request arriving earlier waits for the
+    build in progress instead of starting its own. A failed build is
+    remembered for RESOURCES_RETRY_S: get() raises ResourceUnavailable
+    right away until then, instead of re-running the factory every time.
+    """
+
+    def __init__(self, retry_s: float = RESOURCES_RETRY_S):
+        self.retry_s = retry_s
+        self._resources: Dict[str, Resource] = {}
+
+    def register(self, name: str, factory: Callable[[], Any], warm: bool = True, required: bool = True):
+        self._resources[name] = Resource(name, factory, warm, required)
+
+    def get(self, name: str) -> Any:
+        resource = self._resources[name]
+        if resource.state == "ready":
+            return resource.value
+        with resource.lock:
+            if resource.state == "failed" and time.monotonic() < resource.retry_at:
+                raise ResourceUnavailable(
+                    f"Resource '{name}' failed to load ({resource.error}), "
+                    f"next attempt in {resource.retry_at - time.monotonic():.0f}s"
+                )
+            if resource.state != "ready":
+                self._build(resource)
+        return resource.value
+
+    def _build(self, resource: Resource):
+        resource.state = "loading"
+        start = time.perf_counter()
+        try:
+            resource.value = resource.factory()
+        except Exception as e:
+            resource.state, resource.error = "failed", str(e)
+            resource.retry_at = time.monotonic() + self.retry_s
+            logger.error(f"Resource '{resource.name}' failed to load, retrying in {self.retry_s:.0f}s: {e}")
+            raise
+        resource.load_ms = round((time.perf_counter() - start) * 1000, 2)
+        resource.state, resource.error = "ready", None
+        logger.info(f"Resource '{resource.name}' ready in {resource.load_ms} ms")
+
+    def _warm(self, name: str):
+        try:
+            self.get(name)
+        except Exception:
+            pass  # Logged by _build, reported by stats()
+
+    async def warm_up(self):
+        """Builds every warm resource concurrently (resources depending on each other wait on their locks)"""
+        names = [name for name, resource in self._resources.items() if resource.warm]
+        await asyncio.gather(*(run_in("io", self._warm, name) for name in names))
+        logger.info(f"Resources warm: {self.ready()}")
+
+    def ready(self) -> bool:
+        """Every required warm resource is built"""
+        return all(
+            resource.state == "ready" for resource in self._resources.values() if resource.warm and resource.required
+        )
+
+    def stats(self) -> Dict:
+        return {
+            "ready": self.ready(),
+            "resources": {
+                name: {
+                    "state": resource.state, "warm": resource.warm, "required": resource.required,
+                    "load_ms": resource.load_ms, "error": resource.error
+                }
+                for name, resource in self._resources.items()
+            }
+        }
+
+
+def _keybert():
+    from keybert import KeyBERT
+    return KeyBERT()
+
+
+def _spacy_en():
+    import spacy
+    return spacy.load("en_core_web_sm")
+
+
+def _tokenizer():
+    from server.services.token_budget import token_budgeter
+    return token_budgeter.load()
+
+
+def _chroma_embedding():
+    from server.services.embedding_cache import cached_default_embedding_function
+    return cached_default_embedding_function()
+
+
+def _chroma_client():
+    import chromadb
+    return chromadb.PersistentClient(path=CHROMA_PATH)
+
+
+def _chroma_query():
+    from server.tools.query_chroma import ChromaQuery
+    return ChromaQuery()
+
+
+def _vector_store():
+    from server.database.chroma_db import vector_store
+    vector_store.get()  # Opens the collection used by query_chroma_db
+    return vector_store
+
+
+def _embedding_space():
+    from server.database.chroma_db import reconcile_embedding_space
+    return reconcile_embedding_space()
+
+
+resources = ResourceRegistry()
+resources.register("keybert", _keybert)
+resources.register("spacy_en", _spacy_en)
+# Prompts are counted by length until the encoding is downloaded, so it does not hold up /ready
+resources.register("tokenizer", _tokenizer, required=False)
+resources.register("chroma_embedding", _chroma_embedding)
+resources.register("chroma_client", _chroma_client)
+# Knowledge-base search: when Chroma or Ollama is down only the RAG features degrade,
+# the instance still takes traffic
+resources.register("chroma_query", _chroma_query, required=False)
+resources.register("vector_store", _vector_store, required=False)
+# Re-indexes (or drops) chunks embedded in another vector space before they are mixed with queries
+resources.register("embedding_space", _embedding_space, required=False)
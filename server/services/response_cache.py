@@ -0,0 +1,227 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Sequence, Tuple
+from loguru import logger
+from server.utils.executors import run_in
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+CACHE_DIR = os.getenv("CACHE_DIR", os.path.join(ROOT_DIR, "data", "cache"))
+RESPONSE_CACHE_PATH = os.getenv("RESPONSE_CACHE_PATH", os.path.join(CACHE_DIR, "llm_responses.sqlite3"))
+RESPONSE_CACHE_MEMORY_ENTRIES = int(os.getenv("RESPONSE_CACHE_MEMORY_ENTRIES", "512"))
+# Expired rows are deleted from disk once every this many writes
+RESPONSE_CACHE_PURGE_EVERY = int(os.getenv("RESPONSE_CACHE_PURGE_EVERY", "200"))
+
+# TTL (seconds) per endpoint scope, override with RESPONSE_CACHE_TTL_<SCOPE>
+CACHE_TTLS = {
+    "basic":      7 * 24 * 3600,  # Evergreen educational posts
+    "chroma_rag": 24 * 3600,
+    "query_rag":  6 * 3600,
+    "agent":      3600,
+    "yahoo":      300,            # Market data goes stale quickly
+    "multi_platform": 3600,
+    "default":    3600,
+}
+
+
+def ttl_for(scope: Optional[str]) -> int:
+    scope = scope or "default"
+    default = CACHE_TTLS.get(scope, CACHE_TTLS["default"])
+    return int(os.getenv(f"RESPONSE_CACHE_TTL_{scope.upper()}", default))
+
+
+class ResponseCache:
+    """
+    Exact-match cache of LLM responses with two tiers:
+    - In-memory LRU for the hottest entries
+    - SQLite on disk so answers survive restarts
+    Keys are built from model, temperature, output limits and the fully
+    built prompt. The finish reason is kept so truncation is still reported
+    on hits. Async callers use aget / aset, which only go to the io pool
+    for the disk tier.
+    """
+
+    def __init__(
+        self,
+        path: str = RESPONSE_CACHE_PATH,
+        max_memory_entries: int = RESPONSE_CACHE_MEMORY_ENTRIES,
+        purge_every: int = RESPONSE_CACHE_PURGE_EVERY
+    ):
+        self.path = path
+        self.max_memory_entries = max_memory_entries
+        self.purge_every = purge_every
+        self._memory: "OrderedDict[str, Tuple[float, str, Optional[str]]]" = OrderedDict()
+        self._lock = threading.Lock()  # Memory tier and counters
+        self._db_lock = threading.Lock()  # SQLite connection: memory lookups never wait on disk
+        self._db = None
+        self._writes_since_purge = 0
+        self.counters = {
+            "memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "evictions": 0, "expired": 0, "purged": 0
+        }
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, model TEXT, scope TEXT, response TEXT, "
+                "created_at REAL, expires_at REAL)"
+            )
+            try:
+                self._db.execute("ALTER TABLE responses ADD COLUMN finish_reason TEXT")
+            except sqlite3.OperationalError:
+                pass  # Column already there
+            self._db.execute("CREATE INDEX IF NOT EXISTS responses_expires_at ON responses (expires_at)")
+            self._db.commit()
+            self._purge(time.time())
+        return self._db
+
+    def _purge(self, now: float):
+        """Deletes expired rows (an index range scan on expires_at); caller holds _db_lock"""
+        deleted = self._db.execute("DELETE FROM responses WHERE expires_at <= ?", (now,)).rowcount
+        self._db.commit()
+        self._writes_since_purge = 0
+        with self._lock:
+            self.counters["purged"] += max(deleted, 0)
+
+    @staticmethod
+    def make_key(
+        model: str,
+        prompt: str,
+        temperature: float,
+        max_tokens: Optional[int] = None,
+        stop: Optional[Sequence[str]] = None
+    ) -> str:
+        raw = f"{model}\x1f{temperature}\x1f{max_tokens}\x1f{list(stop or [])}\x1f{prompt}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _from_memory(self, key: str, now: float) -> Optional[Tuple[str, Optional[str]]]:
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                return None
+            expires_at, response, finish_reason = entry
+            if expires_at > now:
+                self._memory.move_to_end(key)
+                self.counters["memory_hits"] += 1
+                return response, finish_reason
+            del self._memory[key]
+            self.counters["expired"] += 1
+            return None
+
+    def _from_disk(self, key: str, now: float) -> Optional[Tuple[str, Optional[str]]]:
+        try:
+            with self._db_lock:
+                row = self._connect().execute(
+                    "SELECT response, expires_at, finish_reason FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"Response cache read failed: {e}")
+            row = None
+
+        with self._lock:
+            if row is not None and row[1] > now:
+                self._remember(key, row[1], row[0], row[2])
+                self.counters["disk_hits"] += 1
+                return row[0], row[2]
+            if row is not None:
+                self.counters["expired"] += 1
+            self.counters["misses"] += 1
+            return None
+
+    def get(self, key: str) -> Optional[Tuple[str, Optional[str]]]:
+        """(response, finish_reason) of a live entry"""
+        now = time.time()
+        found = self._from_memory(key, now)
+        return found if found is not None else self._from_disk(key, now)
+
+    async def aget(self, key: str) -> Optional[Tuple[str, Optional[str]]]:
+        """get for async callers: the memory tier inline, the disk tier on the io pool"""
+        now = time.time()
+        found = self._from_memory(key, now)
+        return found if found is not None else await run_in("io", self._from_disk, key, now)
+
+    def _to_disk(self, row: Tuple):
+        now = row[4]
+        try:
+            with self._db_lock:
+                db = self._connect()
+                db.execute(
+                    "INSERT OR REPLACE INTO responses "
+                    "(key, model, scope, response, created_at, expires_at, finish_reason) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    row
+                )
+                db.commit()
+                self._writes_since_purge += 1
+                if self._writes_since_purge >= self.purge_every:
+                    self._purge(now)
+        except sqlite3.Error as e:
+            logger.warning(f"Response cache write failed: {e}")
+
+    def _store(
+        self,
+        key: str,
+        response: str,
+        ttl: int,
+        model: str,
+        scope: str,
+        finish_reason: Optional[str]
+    ) -> Tuple:
+        """Memory tier; returns the row for the disk tier"""
+        now = time.time()
+        expires_at = now + ttl
+        with self._lock:
+            self._remember(key, expires_at, response, finish_reason)
+            self.counters["stores"] += 1
+        return key, model, scope, response, now, expires_at, finish_reason
+
+    def set(
+        self,
+        key: str,
+        response: str,
+        ttl: int,
+        model: str = "",
+        scope: str = "default",
+        finish_reason: Optional[str] = None
+    ):
+        self._to_disk(self._store(key, response, ttl, model, scope, finish_reason))
+
+    async def aset(
+        self,
+        key: str,
+        response: str,
+        ttl: int,
+        model: str = "",
+        scope: str = "default",
+        finish_reason: Optional[str] = None
+    ):
+        """set for async callers: the SQLite write runs on the io pool"""
+        await run_in("io", self._to_disk, self._store(key, response, ttl, model, scope, finish_reason))
+
+    def _remember(self, key: str, expires_at: float, response: str, finish_reason: Optional[str] = None):
+        """Caller holds _lock"""
+        self._memory[key] = (expires_at, response, finish_reason)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+            self.counters["evictions"] += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            hits = self.counters["memory_hits"] + self.counters["disk_hits"]
+            lookups = hits + self.counters["misses"]
+            return {
+                **self.counters,
+                "hits": hits,
+                "hit_rate": round(hits / lookups, 3) if lookups else None,
+                "memory_entries": len(self._memory),
+                "ttls": {scope: ttl_for(scope) for scope in CACHE_TTLS}
+            }
+
+
+response_cache = ResponseCache()
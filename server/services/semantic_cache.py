@@ -0,0 +1,158 @@
+import os
+import re
+import time
+import threading
+import numpy as np
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+from loguru import logger
+from server.services.response_cache import ttl_for
+from server.utils.request_context import current_context
+from server.utils.executors import run_in
+from server.services.resources import resources
+
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "2000"))
+# Time-sensitive prompts ("today", "2024", "precio actual"...) expire sooner
+SEMANTIC_CACHE_VOLATILE_TTL = int(os.getenv("SEMANTIC_CACHE_VOLATILE_TTL", "3600"))
+
+VOLATILE_PATTERN = re.compile(
+    r"\b(today|now|latest|current|this (week|month|year)|hoy|ahora|actual(es)?|[úu]ltim[oa]s?|"
+    r"esta semana|este (mes|año)|aujourd'hui|maintenant|actuel(le)?s?|derni[eè]re?s?|oggi|adesso|"
+    r"сегодня|сейчас|(19|20)\d\d)\b",
+    re.IGNORECASE
+)
+
+
+@dataclass
+class SemanticEntry:
+    prompt: str
+    embedding: np.ndarray
+    payload: Dict
+    expires_at: float
+    last_used: float = field(default_factory=time.time)
+    hits: int = 0
+
+
+class SemanticCache:
+    """
+    Answers near-duplicate prompts (paraphrases) from previous responses.
+
+    Prompts are embedded with the same embedding function as ChromaQuery and
+    compared by cosine similarity inside a partition (endpoint scope plus
+    platform, audience, region...). Entries expire with the TTL of their scope,
+    shortened for time-sensitive prompts, and the least recently used ones are
+    evicted past SEMANTIC_CACHE_MAX_ENTRIES.
+    """
+
+    def __init__(self, threshold: float = SEMANTIC_CACHE_THRESHOLD, max_entries: int = SEMANTIC_CACHE_MAX_ENTRIES):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self._partitions: Dict[Tuple, List[SemanticEntry]] = {}
+        # Stacked normalized embeddings per partition, rebuilt lazily
+        self._matrices: Dict[Tuple, np.ndarray] = {}
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "expired": 0}
+        self._hit_similarity_total = 0.0
+
+    def _embed_sync(self, text: str) -> np.ndarray:
+        vector = np.asarray(resources.get("chroma_embedding")([text])[0], dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    async def embed(self, text: str) -> Optional[np.ndarray]:
+        """Normalized embedding of a prompt (computed off the event loop)"""
+        try:
+            return await run_in("nlp", self._embed_sync, text)
+        except Exception as e:
+            logger.warning(f"Semantic cache embedding failed: {e}")
+            return None
+
+    def lookup(self, embedding: Optional[np.ndarray], partition: Tuple) -> Optional[Dict]:
+        """Returns the payload of the closest fresh entry above the threshold"""
+        if embedding is None or current_context().bypass_cache:
+            return None
+
+        now = time.time()
+        with self._lock:
+            self._drop_expired(partition, now)
+            entries = self._partitions.get(partition)
+            if not entries:
+                self.counters["misses"] += 1
+                return None
+
+            matrix = self._matrices.get(partition)
+            if matrix is None:
+                matrix = np.stack([entry.embedding for entry in entries])
+                self._matrices[partition] = matrix
+
+            similarities = matrix @ embedding
+            best = int(np.argmax(similarities))
+            similarity = float(similarities[best])
+            if similarity < self.threshold:
+                self.counters["misses"] += 1
+                return None
+
+            entry = entries[best]
+            entry.hits += 1
+            entry.last_used = now
+            self.counters["hits"] += 1
+            self._hit_similarity_total += similarity
+            logger.info(f"Semantic cache hit ({similarity:.3f}) for '{entry.prompt[:50]}'")
+            return entry.payload
+
+    def store(self, prompt: str, embedding: Optional[np.ndarray], partition: Tuple, payload: Dict, scope: str):
+        if embedding is None:
+            return
+
+        ttl = ttl_for(scope)
+        if VOLATILE_PATTERN.search(prompt):
+            ttl = min(ttl, SEMANTIC_CACHE_VOLATILE_TTL)
+
+        with self._lock:
+            self._partitions.setdefault(partition, []).append(
+                SemanticEntry(prompt=prompt, embedding=embedding, payload=payload, expires_at=time.time() + ttl)
+            )
+            self._matrices.pop(partition, None)
+            self.counters["stores"] += 1
+            self._evict()
+
+    def _drop_expired(self, partition: Tuple, now: float):
+        entries = self._partitions.get(partition, [])
+        fresh = [entry for entry in entries if entry.expires_at > now]
+        if len(fresh) != len(entries):
+            self.counters["expired"] += len(entries) - len(fresh)
+            self._partitions[partition] = fresh
+            self._matrices.pop(partition, None)
+
+    def _evict(self):
+        total = sum(len(entries) for entries in self._partitions.values())
+        if total <= self.max_entries:
+            return
+        # Least recently used entries go first
+        ranked = sorted(
+            ((entry.last_used, partition, id(entry)) for partition, entries in self._partitions.items() for entry in entries),
+            key=lambda item: item[0]
+        )
+        doomed = {(partition, entry_id) for _, partition, entry_id in ranked[:total - self.max_entries]}
+        for partition in {partition for partition, _ in doomed}:
+            self._partitions[partition] = [
+                entry for entry in self._partitions[partition] if (partition, id(entry)) not in doomed
+            ]
+            self._matrices.pop(partition, None)
+        self.counters["evictions"] += len(doomed)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.counters["hits"] + self.counters["misses"]
+            return {
+                **self.counters,
+                "hit_rate": round(self.counters["hits"] / lookups, 3) if lookups else None,
+                "avg_hit_similarity": round(self._hit_similarity_total / self.counters["hits"], 3) if self.counters["hits"] else None,
+                "entries": sum(len(entries) for entries in self._partitions.values()),
+                "partitions": len(self._partitions),
+                "threshold": self.threshold
+            }
+
+
+semantic_cache = SemanticCache()
@@ -0,0 +1,179 @@
+import os
+import hashlib
+import threading
+from types import MappingProxyType
+from typing import Any, Callable, Dict, FrozenSet, Hashable, Iterable, Mapping, Optional, Set, Tuple, TypeVar
+from loguru import logger
+from server.utils.executors import run_in
+
+BASE_DIR = os.path.dirname(os.path.dirname(__file__))
+PROMPT_DIR = os.path.join(BASE_DIR, "prompts")
+# Watch server/prompts and swap in edited templates without a restart
+TEMPLATE_HOT_RELOAD = os.getenv("TEMPLATE_HOT_RELOAD", "true").lower() in {"1", "true", "yes", "on"}
+
+T = TypeVar("T")
+
+
+def _read(path: str) -> Optional[str]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning(f"Failed to load prompt file: {path} | {e}")
+        return None
+
+
+def _fingerprint(templates: Mapping[str, str]) -> str:
+    digest = hashlib.sha256()
+    for key in sorted(templates):
+        digest.update(key.encode("utf-8") + b"\x00" + templates[key].encode("utf-8") + b"\x00")
+    return digest.hexdigest()[:12]
+
+
+class TemplateStore:
+    """
+    Immutable in-memory snapshot of every template under server/prompts,
+    keyed by path relative to the prompts folder ("platforms/twitter.txt").
+    Each snapshot has a content-derived version and its own memo of values
+    built from its templates (assembled prompt prefixes...).
+    """
+
+    def __init__(
+        self,
+        templates: Mapping[str, str],
+        root: str = PROMPT_DIR,
+        memo: Optional[Dict[Hashable, Tuple[FrozenSet[str], Any]]] = None
+    ):
+        self.root = root
+        self._templates = MappingProxyType(dict(templates))
+        self._memo: Dict[Hashable, Tuple[FrozenSet[str], Any]] = memo if memo is not None else {}
+        self.version = _fingerprint(self._templates)
+
+    @classmethod
+    def load(cls, root: str = PROMPT_DIR) -> "TemplateStore":
+        templates: Dict[str, str] = {}
+        for folder, _, files in os.walk(root):
+            for name in files:
+                if not name.endswith(".txt"):
+                    continue
+                path = os.path.join(folder, name)
+                content = _read(path)
+                if content is not None:
+                    templates[os.path.relpath(path, root).replace(os.sep, "/")] = content
+        logger.info(f"Loaded {len(templates)} prompt templates from {root}")
+        return cls(templates, root)
+
+    def get(self, key: str, default: str = "") -> str:
+        return self._templates.get(key, default)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._templates
+
+    def __len__(self) -> int:
+        return len(self._templates)
+
+    def memoized(self, key: Hashable, depends_on: Iterable[str], build: Callable[[], T]) -> T:
+        """Value built once per snapshot; depends_on lists the templates it reads"""
+        entry = self._memo.get(key)
+        if entry is None:
+            entry = (frozenset(depends_on), build())
+            self._memo[key] = entry
+        return entry[1]
+
+    def with_changes(self, changes: Mapping[str, Optional[str]]) -> "TemplateStore":
+        """
+        New snapshot with the given templates replaced (None removes one).
+        Memoized values that did not read a changed template are carried over.
+        """
+        templates = dict(self._templates)
+        for key, content in changes.items():
+            if content is None:
+                templates.pop(key, None)
+            else:
+                templates[key] = content
+        changed = set(changes)
+        memo = {key: entry for key, entry in list(self._memo.items()) if not entry[0] & changed}
+        return TemplateStore(templates, self.root, memo)
+
+    def memo_size(self) -> int:
+        return len(self._memo)
+
+
+class TemplateRegistry:
+    """
+    Holds the active TemplateStore snapshot and swaps in a new version when
+    files under server/prompts change. Readers grab `current` once per prompt,
+    so a request never mixes two versions.
+    """
+
+    def __init__(self, root: str = PROMPT_DIR):
+        self.root = root
+        self._current = TemplateStore.load(root)
+        self._lock = threading.Lock()
+        self.reloads = 0
+        self.history = [self._current.version]
+
+    @property
+    def current(self) -> TemplateStore:
+        return self._current
+
+    def _key(self, path: str) -> str:
+        return os.path.relpath(os.path.abspath(path), self.root).replace(os.sep, "/")
+
+    def reload(self, paths: Optional[Iterable[str]] = None) -> TemplateStore:
+        """Re-reads the given files (all of them when None) and swaps the snapshot"""
+        with self._lock:
+            previous = self._current
+            if paths is None:
+                fresh = TemplateStore.load(self.root)
+                keys: Set[str] = set(fresh._templates) | set(previous._templates)
+                changes = {key: fresh._templates.get(key) for key in keys}
+            else:
+                changes = {
+                    self._key(path): _read(path)
+                    for path in paths
+                    if path.endswith(".txt")
+                }
+            changes = {key: content for key, content in changes.items() if previous._templates.get(key) != content}
+            if not changes:
+                return previous
+
+            self._current = previous.with_changes(changes)  # Atomic reference swap
+            self.reloads += 1
+            self.history = (self.history + [self._current.version])[-10:]
+            logger.info(
+                f"Prompt templates {previous.version} -> {self._current.version}: "
+                f"{sorted(changes)} ({previous.memo_size() - self._current.memo_size()} memoized prompts invalidated)"
+            )
+            return self._current
+
+    async def watch(self):
+        """Reloads edited templates until cancelled (started from the app lifespan)"""
+        try:
+            from watchfiles import awatch
+        except ImportError:
+            logger.warning("watchfiles not installed, prompt hot-reload disabled")
+            return
+
+        logger.info(f"Watching {self.root} for prompt template changes")
+        async for changes in awatch(self.root):
+            paths = [path for _, path in changes]
+            try:
+                await run_in("io", self.reload, paths)
+            except Exception as e:
+                logger.error(f"Prompt template reload failed: {e}")
+
+    def stats(self) -> Dict:
+        return {
+            "version": self._current.version,
+            "templates": len(self._current),
+            "memoized_prompts": self._current.memo_size(),
+            "reloads": self.reloads,
+            "recent_versions": self.history,
+            "hot_reload": TEMPLATE_HOT_RELOAD
+        }
+
+
+template_registry = TemplateRegistry()
@@ -0,0 +1,175 @@
+import os
+import time
+import threading
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Union
+from loguru import logger
+from server.utils.executors import get_executor
+
+# tiktoken encoding used to count prompt tokens (close enough for Llama/Gemma)
+TOKENIZER_ENCODING = os.getenv("TOKENIZER_ENCODING", "cl100k_base")
+# Characters per token assumed when the encoding cannot be loaded (offline)
+FALLBACK_CHARS_PER_TOKEN = 4
+# Seconds before retrying a failed encoding load, doubled on each failure up to the max
+TOKENIZER_RETRY_S = float(os.getenv("TOKENIZER_RETRY_S", "30"))
+TOKENIZER_RETRY_MAX_S = float(os.getenv("TOKENIZER_RETRY_MAX_S", "600"))
+
+# Prompt token budget per model, override with PROMPT_BUDGET_<MODEL>
+PROMPT_TOKEN_BUDGETS = {
+    "llama-3.1-8b-instant":    {"key": "LLAMA3_8B",  "tokens": 3000},
+    "llama-3.3-70b-versatile": {"key": "LLAMA3_70B", "tokens": 6000},
+    "gemma2-9b-it":            {"key": "GEMMA_9B",   "tokens": 4000},
+}
+DEFAULT_PROMPT_BUDGET = int(os.getenv("PROMPT_BUDGET_DEFAULT", "3000"))
+
+TRUNCATION_MARK = " [...]"
+
+
+@dataclass(frozen=True)
+class PromptSection:
+    """
+    One block of a prompt.
+    - priority 0 is required and never touched; higher values are cut first
+    - trimmable sections lose their tail before being dropped entirely
+    """
+    name: str
+    text: str
+    priority: int = 0
+    trimmable: bool = False
+    min_tokens: int = 32
+
+
+class TokenBudgeter:
+    """
+    Counts prompt sections with a tokenizer and trims or drops the
+    low-priority ones until the whole prompt fits the model budget.
+    """
+
+    def __init__(self, encoding_name: str = TOKENIZER_ENCODING):
+        self.encoding_name = encoding_name
+        self._encoding = None
+        self._loading = False
+        self._failures = 0
+        self._retry_at = 0.0  # time.monotonic() of the next load attempt after a failure
+        self._lock = threading.Lock()
+        self._state_lock = threading.Lock()
+        self.counters = {"prompts": 0, "trimmed_prompts": 0, "tokens_in": 0, "tokens_saved": 0}
+
+    def load(self):
+        """Loads the encoding (tiktoken downloads it on first use): never call it on the event loop"""
+        with self._lock:
+            if self._encoding is None:
+                try:
+                    import tiktoken
+                    self._encoding = tiktoken.get_encoding(self.encoding_name)
+                except Exception as e:
+                    self._failures += 1
+                    delay = min(TOKENIZER_RETRY_S * 2 ** (self._failures - 1), TOKENIZER_RETRY_MAX_S)
+                    self._retry_at = time.monotonic() + delay
+                    logger.warning(
+                        f"Tokenizer {self.encoding_name} unavailable, estimating tokens from length "
+                        f"(retry in {delay:.0f}s): {e}"
+                    )
+                    raise
+                self._failures = 0
+        return self._encoding
+
+    def _load_in_background(self):
+        try:
+            self.load()
+        except Exception:
+            pass  # Logged by load, retried after the backoff
+        finally:
+            self._loading = False
+
+    def _get_encoding(self):
+        """The encoding if loaded; otherwise None (length estimate) while it loads on the io pool"""
+        if self._encoding is None and not self._loading and time.monotonic() >= self._retry_at:
+            with self._state_lock:
+                if self._loading:
+                    return self._encoding
+                self._loading = True
+            get_executor("io").submit(self._load_in_background)
+        return self._encoding
+
+    def count(self, text: str) -> int:
+        encoding = self._get_encoding()
+        if encoding is None:
+            return -(-len(text) // FALLBACK_CHARS_PER_TOKEN)
+        return len(encoding.encode(text, disallowed_special=()))
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Keeps the first max_tokens tokens of the text"""
+        encoding = self._get_encoding()
+        if encoding is None:
+            return text[:max_tokens * FALLBACK_CHARS_PER_TOKEN] + TRUNCATION_MARK
+        return encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens]) + TRUNCATION_MARK
+
+    def fit(
+        self,
+        sections: Sequence[PromptSection],
+        model: Union[str, None] = None,
+        budget: Optional[int] = None,
+        separator: str = "\n\n"
+    ) -> str:
+        """Joins the sections, in order, after cutting them down to the budget"""
+        model = getattr(model, "value", model)
+        budget = budget or budget_for(model)
+        sections = [section for section in sections if section.text]
+        counts = [self.count(section.text) for section in sections]
+        texts = [section.text for section in sections]
+        total = before = sum(counts)
+        dropped, trimmed = [], []
+
+        # Lowest priority first; among equals, later sections go first
+        order = sorted(
+            (i for i, section in enumerate(sections) if section.priority > 0),
+            key=lambda i: (sections[i].priority, i),
+            reverse=True
+        )
+        for i in order:
+            if total <= budget:
+                break
+            section = sections[i]
+            keep = counts[i] - (total - budget)
+            if section.trimmable and keep >= section.min_tokens:
+                texts[i] = self.truncate(section.text, keep)
+                total -= counts[i] - keep
+                trimmed.append(section.name)
+            else:
+                texts[i] = ""
+                total -= counts[i]
+                dropped.append(section.name)
+
+        self.counters["prompts"] += 1
+        self.counters["tokens_in"] += before
+        if before > total:
+            self.counters["trimmed_prompts"] += 1
+            self.counters["tokens_saved"] += before - total
+            logger.info(
+                f"Prompt budget {budget} ({model or 'default'}): {before} -> {total} tokens, "
+                f"saved {before - total} (trimmed {trimmed or '-'}, dropped {dropped or '-'})"
+            )
+        if total > budget:
+            logger.warning(f"Prompt still over budget after trimming: {total} > {budget} tokens")
+
+        return separator.join(text for text in texts if text)
+
+    def stats(self) -> Dict:
+        return {
+            **self.counters,
+            "tokenizer": self.encoding_name if self._encoding is not None else f"~{FALLBACK_CHARS_PER_TOKEN} chars/token",
+            "tokenizer_failures": self._failures,
+            "budgets": {model: budget_for(model) for model in PROMPT_TOKEN_BUDGETS}
+        }
+
+
+def budget_for(model: Union[str, None]) -> int:
+    model = getattr(model, "value", model)
+    config = PROMPT_TOKEN_BUDGETS.get(model)
+    if config is None:
+        return DEFAULT_PROMPT_BUDGET
+    return int(os.getenv(f"PROMPT_BUDGET_{config['key']}", config["tokens"]))
+
+
+token_budgeter = TokenBudgeter()
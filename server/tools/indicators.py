@@ -0,0 +1,169 @@
+import os
+import threading
+import numpy as np
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+from loguru import logger
+from server.services.price_store import CLOSE, DAY, PriceStore, price_store
+
+# Index the relative performance is measured against
+INDICATOR_BENCHMARK = os.getenv("INDICATOR_BENCHMARK", "^GSPC")
+INDICATOR_MEMO_SIZE = int(os.getenv("INDICATOR_MEMO_SIZE", "2048"))
+TRADING_DAYS = 252
+# Bars kept per symbol for one pass: a trading year (also covers SMA200 twenty bars back)
+LOOKBACK = TRADING_DAYS
+
+# Template fields (prompt_yahoo.txt) when a ticker has no usable history
+EMPTY_INDICATORS = {
+    "volatility_30d": "N/A",
+    "sma_50": "N/A",
+    "sma_200": "N/A",
+    "trend_signal": "N/A",
+    "macd_signal": "N/A",
+    "rsi_14": "N/A",
+    "max_drawdown_1y": "N/A",
+    "relative_1y": "N/A",
+}
+
+
+def _matrix(blocks: List[np.ndarray], length: int) -> np.ndarray:
+    """Last `length` closes of every symbol as rows, short histories padded on the left with their first close"""
+    rows = np.empty((len(blocks), length), dtype=np.float64)
+    for i, block in enumerate(blocks):
+        closes = block[CLOSE, -length:]
+        rows[i, length - len(closes):] = closes
+        rows[i, :length - len(closes)] = closes[0]
+    return rows
+
+
+def _sma(closes: np.ndarray, window: int, back: int = 0) -> np.ndarray:
+    """Simple moving average ending `back` bars before the last one"""
+    end = closes.shape[1] - back
+    return closes[:, end - window:end].mean(axis=1)
+
+
+def _ema_and_rsi(closes: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    EMA12/EMA26 of the last and previous bar plus Wilder's RSI14: the recursion
+    runs along time once, each step vectorized across all symbols.
+    """
+    fast, slow = 2 / 13, 2 / 27
+    ema12 = ema26 = closes[:, 0].copy()
+    prev12 = prev26 = ema12
+    deltas = np.diff(closes, axis=1)
+    gains, losses = np.clip(deltas, 0, None), np.clip(-deltas, 0, None)
+    avg_gain, avg_loss = gains[:, :14].mean(axis=1), losses[:, :14].mean(axis=1)
+
+    for t in range(1, closes.shape[1]):
+        prev12, prev26 = ema12, ema26
+        ema12 = ema12 + fast * (closes[:, t] - ema12)
+        ema26 = ema26 + slow * (closes[:, t] - ema26)
+        if t > 14:
+            avg_gain = (avg_gain * 13 + gains[:, t - 1]) / 14
+            avg_loss = (avg_loss * 13 + losses[:, t - 1]) / 14
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rsi = np.where(avg_loss > 0, 100 - 100 / (1 + avg_gain / avg_loss), 100.0)
+    return ema12 - ema26, prev12 - prev26, rsi, deltas
+
+
+class IndicatorEngine:
+    """
+    Technical indicators over the local price history, computed for many
+    tickers in one NumPy pass (one row per ticker) and memoized per
+    (symbol, last bar, benchmark last bar).
+    """
+
+    def __init__(self, prices: PriceStore = price_store, benchmark: str = INDICATOR_BENCHMARK):
+        self.prices = prices
+        self.benchmark = benchmark
+        self._memo: "OrderedDict[Tuple, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.counters = {"memo_hits": 0, "computed": 0, "batches": 0}
+
+    def _key(self, symbol: str, bench_day: Optional[float]) -> Optional[Tuple]:
+        block = self.prices.range(symbol)
+        if block is None or block.shape[1] < 2:
+            return None
+        return symbol, float(block[DAY, -1]), bench_day
+
+    def compute_many(self, symbols: Iterable[str]) -> Dict[str, Dict]:
+        """Indicator fields per symbol (EMPTY_INDICATORS values when there is no history)"""
+        symbols = list(dict.fromkeys(symbols))
+        self.prices.update([*symbols, self.benchmark])
+        bench = self.prices.range(self.benchmark)
+        bench_day = float(bench[DAY, -1]) if bench is not None and bench.shape[1] else None
+
+        results, pending = {}, []
+        with self._lock:
+            for symbol in symbols:
+                key = self._key(symbol, bench_day)
+                if key is None:
+                    results[symbol] = dict(EMPTY_INDICATORS)
+                elif key in self._memo:
+                    self._memo.move_to_end(key)
+                    self.counters["memo_hits"] += 1
+                    results[symbol] = self._memo[key]
+                else:
+                    pending.append((symbol, key))
+
+        if pending:
+            computed = self._compute([symbol for symbol, _ in pending])
+            with self._lock:
+                for symbol, key in pending:
+                    self._memo[key] = results[symbol] = computed[symbol]
+                while len(self._memo) > INDICATOR_MEMO_SIZE:
+                    self._memo.popitem(last=False)
+
+        return {symbol: results[symbol] for symbol in symbols}
+
+    def _compute(self, symbols: List[str]) -> Dict[str, Dict]:
+        """One vectorized pass over every symbol"""
+        self.counters["batches"] += 1
+        self.counters["computed"] += len(symbols)
+        closes = _matrix([self.prices.range(symbol) for symbol in symbols], LOOKBACK)
+
+        macd, prev_macd, rsi, deltas = _ema_and_rsi(closes)
+        returns = deltas[:, -30:] / closes[:, -31:-1]
+        volatility = returns.std(axis=1, ddof=1) * np.sqrt(TRADING_DAYS) * 100
+
+        sma50, sma200 = _sma(closes, 50), _sma(closes, 200)
+        sma50_then, sma200_then = _sma(closes, 50, back=20), _sma(closes, 200, back=20)
+
+        year = closes[:, -TRADING_DAYS:]
+        drawdown = (year / np.maximum.accumulate(year, axis=1) - 1).min(axis=1) * 100
+
+        bench_change = self.prices.change_pct(self.benchmark, "1y")
+        results = {}
+        for i, symbol in enumerate(symbols):
+            change = self.prices.change_pct(symbol, "1y")
+            above, was_above = sma50[i] > sma200[i], sma50_then[i] > sma200_then[i]
+            if above != was_above:
+                trend = "golden cross (SMA50 crossed above SMA200)" if above else "death cross (SMA50 crossed below SMA200)"
+            else:
+                trend = "SMA50 above SMA200" if above else "SMA50 below SMA200"
+            if (macd[i] > 0) != (prev_macd[i] > 0):
+                macd_signal = "EMA12 just crossed above EMA26" if macd[i] > 0 else "EMA12 just crossed below EMA26"
+            else:
+                macd_signal = "EMA12 above EMA26" if macd[i] > 0 else "EMA12 below EMA26"
+            results[symbol] = {
+                "volatility_30d": f"{volatility[i]:.1f}%",
+                "sma_50": round(float(sma50[i]), 2),
+                "sma_200": round(float(sma200[i]), 2),
+                "trend_signal": trend,
+                "macd_signal": macd_signal,
+                "rsi_14": round(float(rsi[i]), 1),
+                "max_drawdown_1y": f"{drawdown[i]:.1f}%",
+                "relative_1y": (
+                    f"{change - bench_change:+.1f} pts vs {self.benchmark}"
+                    if change is not None and bench_change is not None and symbol != self.benchmark else "N/A"
+                )
+            }
+        logger.debug(f"Indicators computed for {len(symbols)} tickers in one pass")
+        return results
+
+    def stats(self) -> Dict:
+        return {**self.counters, "memoized": len(self._memo), "benchmark": self.benchmark}
+
+
+indicator_engine = IndicatorEngine()
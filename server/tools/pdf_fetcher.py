@@ -1,22 +1,22 @@
 import os
-from typing import List
-from keybert import KeyBERT
+from typing import List, Tuple
+import threading
 from rake_nltk import Rake
-import spacy
 import arxiv  
 from arxiv import Client, SortCriterion
 from loguru import logger
 from deep_translator import GoogleTranslator
-import langdetect
+from server.services.language_detector import detect_language
+from server.utils.executors import run_in
+from server.services.resources import resources
 
-# Inicializa modelos
-kw_model = KeyBERT()
+# KeyBERT y spaCy se comparten con ChromaQuery (server/services/resources.py)
 rake = Rake()
-nlp = spacy.load("en_core_web_sm")
+rake_lock = threading.Lock()  # RAKE guarda estado entre llamadas
 
 
 def extract_with_keybert(text: str, top_n: int = 5) -> List[str]:
-    kws = kw_model.extract_keywords(
+    kws = resources.get("keybert").extract_keywords(
         text,
         keyphrase_ngram_range=(1, 2),
         stop_words="english"
@@ -25,18 +25,19 @@ def extract_with_keybert(text: str, top_n: int = 5) -> List[str]:
 
 
 def extract_with_rake(text: str, top_n: int = 5) -> List[str]:
-    rake.extract_keywords_from_text(text)
-    return rake.get_ranked_phrases()[:top_n]
+    with rake_lock:
+        rake.extract_keywords_from_text(text)
+        return rake.get_ranked_phrases()[:top_n]
 
 
 def extract_named_entities(text: str) -> List[str]:
-    doc = nlp(text)
+    doc = resources.get("spacy_en")(text)
     return list({ent.text for ent in doc.ents})
 
 
 def translate_if_needed(text: str, target_lang="en") -> str:
     try:
-        src = langdetect.detect(text)
+        src = detect_language(text)
         if src != target_lang:
             return GoogleTranslator(source=src, target=target_lang).translate(text)
     except Exception:
@@ -103,19 +104,34 @@ class PDFRetriever:
         self.categories = categories
 
     def retrieve(self, query: str) -> List[str]:
+        translated, clean = self.keywords(query)
+        return self.download(translated, clean)
+
+    async def aretrieve(self, query: str) -> List[str]:
+        """retrieve() for async callers: translation and arXiv on the io pool, model inference on the nlp pool"""
+        translated = await run_in("io", translate_if_needed, query)
+        clean = await run_in("nlp", self.extract_keywords, translated)
+        return await run_in("io", self.download, translated, clean)
+
+    def keywords(self, query: str) -> Tuple[str, List[str]]:
         # 1) Traducción + extracción de keywords
         translated = translate_if_needed(query)
+        return translated, self.extract_keywords(translated)
+
+    @staticmethod
+    def extract_keywords(translated: str) -> List[str]:
         kb = extract_with_keybert(translated)
         rk = extract_with_rake(translated)
         ne = extract_named_entities(translated)
         combined = set(kb + rk + ne)
-        clean = [
+        return [
             kw for kw in combined
             if len(kw.split()) > 1
             and len(kw) > 4
             and not any(ch.isdigit() for ch in kw)
         ]
 
+    def download(self, translated: str, clean: List[str]) -> List[str]:
         # 2) Construir query y descargar
         primary_q = build_arxiv_query(clean, translated, self.categories)
         logger.info(f"🔎 arXiv query: {primary_q}")
@@ -1,27 +1,30 @@
-import chromadb
-from chromadb.utils import embedding_functions
+import threading
 from typing import List, Dict, Optional
 from loguru import logger
 import os
-from langdetect import detect, LangDetectException
-from keybert import KeyBERT
 from rake_nltk import Rake
-import spacy
-from langdetect import detect
+from server.services.language_detector import detect_language
+from server.services.resources import resources
 from collections import OrderedDict
+from server.utils.singleflight import get_flight
+
+# Identical concurrent searches share one keyword extraction + query
+search_flight = get_flight("chroma_search")
 
 class ChromaQuery:
+    """Una sola instancia por proceso: se obtiene con resources.get("chroma_query")"""
+
     def __init__(self):
         """Inicializador robusto con manejo de colección"""
         try:
-            # Configuración de ChromaDB
-            self.client = chromadb.PersistentClient(path="data/chroma_db")
-            self.embed_func = embedding_functions.DefaultEmbeddingFunction()
-            
-            # Cargar modelos NLP
-            self.kw_model = KeyBERT()
+            # Cliente, embeddings y modelos NLP compartidos (server/services/resources.py)
+            self.client = resources.get("chroma_client")
+            self.embed_func = resources.get("chroma_embedding")
+            self.kw_model = resources.get("keybert")
+            self.nlp = resources.get("spacy_en")
+            # RAKE guarda estado entre extract y get_ranked_phrases: un hilo a la vez
             self.rake = Rake()
-            self.nlp = spacy.load("en_core_web_sm")
+            self._rake_lock = threading.Lock()
             
             # Crear colección si no existe
             self.collection_name = "main_collection"
@@ -44,8 +47,9 @@ class ChromaQuery:
 
     def extract_keywords(self, text: str, top_n: int = 5) -> List[str]:
         # RAKE
-        self.rake.extract_keywords_from_text(text)
-        rake_keywords = self.rake.get_ranked_phrases()[:top_n]
+        with self._rake_lock:
+            self.rake.extract_keywords_from_text(text)
+            rake_keywords = self.rake.get_ranked_phrases()[:top_n]
 
         # SpaCy
         doc = self.nlp(text)
@@ -69,12 +73,15 @@ class ChromaQuery:
 
     def search(self, query: str, n_results: int = 3, similarity_threshold: float = 0.7) -> Dict:
         """Búsqueda segura con manejo de errores"""
+        return search_flight.do_sync(
+            (query, n_results, similarity_threshold),
+            lambda: self._search(query, n_results, similarity_threshold)
+        )
+
+    def _search(self, query: str, n_results: int, similarity_threshold: float) -> Dict:
         try:
             # 1. Detección de idioma
-            try:
-                lang = detect(query)
-            except LangDetectException:
-                lang = "en"
+            lang = detect_language(query)
             
             logger.info(f"Searching for: '{query[:50]}...' in {lang}")
 
@@ -0,0 +1,217 @@
+import os
+import time
+import threading
+import unicodedata
+from collections import deque
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from loguru import logger
+
+BASE_DIR = os.path.dirname(os.path.dirname(__file__))
+# symbol<TAB>name<TAB>alias|alias... ; lines starting with # are comments
+TICKER_LISTINGS_PATH = os.getenv("TICKER_LISTINGS_PATH", os.path.join(BASE_DIR, "database", "listings.tsv"))
+# Symbols this short are everyday words/letters ("T", "GE", "MA"): only $cashtags match them
+MIN_BARE_SYMBOL_LENGTH = 3
+# Listing names/aliases marked with this prefix are everyday words ("apple pie",
+# "amazon rainforest", "dow"): they need one of the words below (or another ticker) in the text
+AMBIGUOUS_PREFIX = "~"
+FINANCE_CONTEXT_WORDS = {
+    # en
+    "stock", "stocks", "share", "shares", "shareholder", "shareholders", "earnings", "price", "prices", "market",
+    "markets", "invest", "investing", "investment", "investor", "investors", "dividend", "dividends", "ipo",
+    "revenue", "revenues", "profit", "profits", "valuation", "ticker", "trading", "trade", "traders", "equity",
+    "nasdaq", "nyse", "index", "points", "rally", "selloff", "quarter", "quarterly", "results", "guidance",
+    "forecast", "analyst", "analysts", "bull", "bullish", "bear", "bearish", "crypto", "cryptocurrency", "coin",
+    "token", "portfolio", "buy", "sell", "valued", "cap", "capitalization", "company", "companies", "ceo",
+    "inc", "corp", "etf", "futures", "fund", "sp500",
+    # es
+    "accion", "acciones", "accionistas", "bolsa", "precio", "precios", "mercado", "mercados", "ganancias",
+    "resultados", "invertir", "inversion", "inversiones", "inversores", "cotizacion", "dividendo", "dividendos",
+    "indice", "empresa", "empresas", "trimestre", "beneficios", "criptomoneda", "comprar", "vender",
+    # fr
+    "action", "actions", "actionnaires", "bourse", "cours", "prix", "marche", "marches", "resultats", "benefices",
+    "investir", "investissement", "investisseurs", "dividende", "entreprise", "entreprises", "trimestre",
+    "cryptomonnaie", "acheter", "vendre",
+}
+
+
+def _fold_char(ch: str) -> str:
+    """Lower-case, accent-free form of one character (always one character long)"""
+    base = unicodedata.normalize("NFKD", ch.lower()[:1] or ch)[:1]
+    return base or ch
+
+
+def fold(text: str) -> str:
+    """Same length as the input, so match offsets map back to the original text"""
+    return "".join(_fold_char(ch) for ch in text)
+
+
+def _is_word_char(ch: str) -> bool:
+    return ch.isalnum()
+
+
+class Pattern(NamedTuple):
+    ticker: str
+    symbol: bool  # The listing symbol itself: checked case-sensitively in the original text
+    ambiguous: bool = False  # An everyday word: only counts in a finance context
+
+
+class AhoCorasick:
+    """Multi-pattern matcher: one pass over the text whatever the number of patterns"""
+
+    def __init__(self):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[Tuple[int, int]]] = [[]]  # (pattern id, length) ending at each node
+
+    def add(self, word: str, pattern_id: int):
+        node = 0
+        for ch in word:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            node = nxt
+        self._out[node].append((pattern_id, len(word)))
+
+    def build(self):
+        """Computes the failure links breadth first"""
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail][ch] if node and ch in self._goto[fail] else 0
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+
+    def iter(self, text: str):
+        """(start, end, pattern id) of every occurrence"""
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(ch, 0)
+            for pattern_id, length in self._out[node]:
+                yield i - length + 1, i + 1, pattern_id
+
+    def __len__(self) -> int:
+        return len(self._goto)
+
+
+class TickerIndex:
+    """
+    Symbols, company names and en/es/fr aliases from the local listings file
+    compiled into one Aho-Corasick automaton. Matches must sit on word
+    boundaries ("eth" does not match inside "method") and overlapping ones
+    resolve to the longest ("dow jones" over "dow"). Names that are
+    everyday words only count in a finance context ("apple stock", not
+    "apple pie"). Loaded on first use.
+    """
+
+    def __init__(self, path: str = TICKER_LISTINGS_PATH):
+        self.path = path
+        self._automaton: Optional[AhoCorasick] = None
+        self._patterns: List[Pattern] = []
+        self._lock = threading.Lock()
+        self.tickers = 0
+        self.load_ms = None
+        self.counters = {"lookups": 0, "matches": 0}
+
+    def _load(self) -> AhoCorasick:
+        if self._automaton is not None:
+            return self._automaton
+        with self._lock:
+            if self._automaton is not None:
+                return self._automaton
+            start = time.perf_counter()
+            automaton, patterns, seen = AhoCorasick(), [], set()
+
+            def add(word: str, pattern: Pattern):
+                key = (word, pattern)
+                if word and key not in seen:
+                    seen.add(key)
+                    automaton.add(word, len(patterns))
+                    patterns.append(pattern)
+
+            tickers = set()
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    for line in f:
+                        if not line.strip() or line.startswith("#"):
+                            continue
+                        symbol, name, aliases = (line.rstrip("\n").split("\t") + ["", ""])[:3]
+                        tickers.add(symbol)
+                        add(fold(f"${symbol}"), Pattern(symbol, symbol=True))
+                        if len(symbol) >= MIN_BARE_SYMBOL_LENGTH:
+                            add(fold(symbol), Pattern(symbol, symbol=True))
+                        for alias in [name, *aliases.split("|")]:
+                            alias = alias.strip()
+                            ambiguous = alias.startswith(AMBIGUOUS_PREFIX)
+                            add(fold(alias.lstrip(AMBIGUOUS_PREFIX)), Pattern(symbol, symbol=False, ambiguous=ambiguous))
+            except OSError as e:
+                logger.error(f"Ticker listings not available ({self.path}): {e}")
+
+            automaton.build()
+            self._patterns = patterns
+            self.tickers = len(tickers)
+            self.load_ms = round((time.perf_counter() - start) * 1000, 2)
+            logger.info(f"Ticker index: {self.tickers} tickers, {len(patterns)} patterns, {len(automaton)} states in {self.load_ms} ms")
+            self._automaton = automaton
+            return automaton
+
+    def find(self, text: str) -> List[str]:
+        """Tickers mentioned in the text, in order of appearance, without duplicates"""
+        automaton = self._load()
+        self.counters["lookups"] += 1
+        text = unicodedata.normalize("NFC", text)
+        folded = fold(text)
+
+        candidates = []
+        for start, end, pattern_id in automaton.iter(folded):
+            pattern = self._patterns[pattern_id]
+            if pattern.symbol:
+                # Symbols are indexed folded; they only count when written in capitals
+                if text[start:end] != pattern.ticker and text[start:end] != f"${pattern.ticker}":
+                    continue
+            if start > 0 and _is_word_char(folded[start - 1]):
+                continue
+            if end < len(folded) and _is_word_char(folded[end]) and _is_word_char(folded[end - 1]):
+                continue
+            candidates.append((start, end, pattern.ambiguous, pattern.ticker))
+
+        # Leftmost-longest, non overlapping (an unambiguous pattern wins a tie)
+        matches, taken_until = [], 0
+        for start, end, ambiguous, ticker in sorted(candidates, key=lambda c: (c[0], -c[1], c[2])):
+            if start >= taken_until:
+                matches.append((ambiguous, ticker))
+                taken_until = end
+        if any(ambiguous for ambiguous, _ in matches) and not self._finance_context(folded, matches):
+            matches = [(ambiguous, ticker) for ambiguous, ticker in matches if not ambiguous]
+        found = [ticker for _, ticker in matches]
+        self.counters["matches"] += len(found)
+        return list(dict.fromkeys(found))
+
+    @staticmethod
+    def _finance_context(folded: str, matches: List[Tuple[bool, str]]) -> bool:
+        """A finance word in the text, a ticker matched without ambiguity, or nothing but the name ("amazon")"""
+        if any(not ambiguous for ambiguous, _ in matches):
+            return True
+        words = "".join(ch if _is_word_char(ch) else " " for ch in folded).split()
+        return len(words) == 1 or any(word in FINANCE_CONTEXT_WORDS for word in words)
+
+    def stats(self) -> Dict:
+        return {
+            **self.counters,
+            "loaded": self._automaton is not None,
+            "tickers": self.tickers,
+            "patterns": len(self._patterns),
+            "load_ms": self.load_ms
+        }
+
+
+ticker_index = TickerIndex()
@@ -1,84 +1,95 @@
-import os
-import yfinance as yf
-from langdetect import detect
+from server.services.language_detector import detect_language
 from loguru import logger
 from typing import Dict, List, Optional
-from deep_translator import GoogleTranslator
+from server.services.market_cache import MarketDataCache, market_cache
+from server.tools.ticker_index import ticker_index
+from server.tools.indicators import EMPTY_INDICATORS, indicator_engine
+from server.services.template_store import template_registry
+from server.utils.request_context import current_context
 
 class YahooFetcher:
-    def __init__(self):
-        self.ticker_map = {
-            # Correcciones comunes
-            "appl": "AAPL", "aapl": "AAPL", "apple": "AAPL",
-            "msft": "MSFT", "micro": "MSFT", "microsoft": "MSFT",
-            "amzn": "AMZN", "amz": "AMZN", "amazon": "AMZN",
-            "googl": "GOOGL", "google": "GOOGL",
-            "tsla": "TSLA", "tesla": "TSLA",
-            "meta": "META", "facebook": "META",
-            "nvda": "NVDA", "nvidia": "NVDA",
-            
-            # Índices
-            "sp500": "^GSPC", "s&p500": "^GSPC",
-            "dow": "^DJI", "dow jones": "^DJI",
-            "nasdaq": "^IXIC",
-            
-            # Cripto
-            "btc": "BTC-USD", "bitcoin": "BTC-USD",
-            "eth": "ETH-USD", "ethereum": "ETH-USD"
-        }
+    def __init__(self, cache: Optional[MarketDataCache] = None):
+        # Quotes and fundamentals come from the shared TTL cache (yfinance behind it)
+        self.cache = cache or market_cache
 
     def detect_tickers(self, text: str) -> List[str]:
-        """Detección de tickers con soporte multilingüe"""
+        """Detección de tickers en una pasada (símbolos, nombres y alias en/es/fr, sin traducir)"""
         try:
-            # Detección de idioma y traducción si es necesario
-            lang = detect(text)
-            if lang != 'en':
-                text = GoogleTranslator(source='auto', target='en').translate(text)
-
-            clean_text = text.lower().strip()
-            found = []
-            
-            # Búsqueda exacta
-            for word in clean_text.split():
-                if word in self.ticker_map:
-                    found.append(self.ticker_map[word])
-            
-            # Búsqueda por substrings
-            for name, ticker in self.ticker_map.items():
-                if name in clean_text and ticker not in found:
-                    found.append(ticker)
-            
-            return list(set(found))
-            
+            # El primero en aparecer es el principal
+            return ticker_index.find(text)
         except Exception as e:
             logger.error(f"Ticker detection error: {e}")
             return []
 
     def get_financial_data(self, ticker: str) -> Dict:
         """Obtiene datos con estructura garantizada"""
+        return self.get_financial_data_many([ticker])[ticker]
+
+    def get_financial_data_many(self, tickers: List[str]) -> Dict[str, Dict]:
+        """
+        Datos de varios tickers en lote: un único download de precios y las
+        fundamentales en paralelo (pool acotado). Mantiene el orden de entrada.
+        """
+        tickers = list(dict.fromkeys(tickers))
+        quotes = self.cache.get_many("quote", tickers)
+        fundamentals = self.cache.get_many("fundamentals", tickers)
+        data = {
+            ticker: self._build_financial_data(ticker, quotes.get(ticker), fundamentals.get(ticker))
+            for ticker in tickers
+        }
+
+        # Indicadores técnicos de todos los tickers en una sola pasada sobre el histórico local
         try:
-            stock = yf.Ticker(ticker)
-            info = stock.info
-            hist = stock.history(period="1mo")
-            
+            indicators = indicator_engine.compute_many(tickers)
+        except Exception as e:
+            logger.warning(f"Indicators not available for {tickers}: {e}")
+            indicators = {}
+        for ticker, item in data.items():
+            item.update(indicators.get(ticker, EMPTY_INDICATORS))
+        return data
+
+    def fetch(self, text: str) -> str:
+        """Resumen de mercado de los tickers mencionados en el texto (para el agente)"""
+        tickers = self.detect_tickers(text)
+        if not tickers:
+            return "No financial instruments identified"
+        data = self.get_financial_data_many(tickers)
+        return "\n".join(self.summarize(item) for item in data.values())
+
+    def summarize(self, data: Dict) -> str:
+        """Una línea compacta por ticker"""
+        return (
+            f"{data['name']} ({data['symbol']}): {data['current_price']} {data['currency']}, "
+            f"change {data['change_pct']:.2f}%, sector {data['sector']}, country {data['country']}, "
+            f"market cap {data['market_cap']}, P/E {data['pe_ratio']}"
+        )
+
+    def _build_financial_data(self, ticker: str, quote: Optional[Dict], fundamentals: Optional[Dict]) -> Dict:
+        try:
+            if quote is None and fundamentals is None:
+                raise ValueError("no market data returned")
+            quote, fundamentals = quote or {}, fundamentals or {}
+
             # Datos base obligatorios
             data = {
                 "symbol": ticker,
-                "name": info.get("longName", ticker),
-                "country": info.get("country", "N/A"),
-                "current_price": info.get("currentPrice", 0),
-                "currency": info.get("currency", "USD"),
-                "change_pct": self._calculate_change(hist),
-                "sector": info.get("sector", "N/A"),
-                "summary": info.get("longBusinessSummary", "No summary available"),
+                "name": fundamentals.get("name", ticker),
+                "country": fundamentals.get("country", "N/A"),
+                "current_price": quote.get("current_price", 0),
+                "currency": fundamentals.get("currency", "USD"),
+                "change_pct": quote.get("change_pct", 0.0),
+                # Cambio % por ventana (1mo, 3mo, ytd, 1y, 5y) desde el histórico local
+                "performance": quote.get("performance", {}),
+                "sector": fundamentals.get("sector", "N/A"),
+                "summary": fundamentals.get("summary", "No summary available"),
                 "url": self.format_yahoo_url(ticker)
             }
             
             # Métricas con valores por defecto robustos
             metrics = {
-                "pe_ratio": info.get("trailingPE", "N/A"),
-                "market_cap": self._format_market_cap(info.get("marketCap")),
-                "fifty_two_week_high": info.get("fiftyTwoWeekHigh", "N/A")
+                "pe_ratio": fundamentals.get("pe_ratio", "N/A"),
+                "market_cap": self._format_market_cap(fundamentals.get("market_cap")),
+                "fifty_two_week_high": fundamentals.get("fifty_two_week_high", "N/A")
             }
             
             # Dos formatos de acceso para máxima compatibilidad
@@ -108,6 +119,7 @@ class YahooFetcher:
                 "pe_ratio": "N/A",
                 "market_cap": "N/A",
                 "fifty_two_week_high": "N/A",
+                "performance": {},
                 "key_metrics": {
                     "pe_ratio": "N/A",
                     "market_cap": "N/A",
@@ -122,15 +134,13 @@ class YahooFetcher:
             return f"https://finance.yahoo.com/quote/%5E{ticker[1:]}/"
         return f"https://finance.yahoo.com/quote/{ticker}/"
 
-    def load_yahoo_prompt(self) -> str:
-        """Carga la plantilla específica para Yahoo"""
-        try:
-            prompt_path = os.path.join(os.path.dirname(__file__), "..", "prompts", "prompt_yahoo.txt")
-            with open(prompt_path, "r", encoding="utf-8") as f:
-                return f.read()
-        except Exception as e:
-            logger.error(f"Failed to load yahoo prompt: {e}")
-            return ""
+    def load_yahoo_prompt(self, name: str = "prompt_yahoo.txt") -> str:
+        """Carga la plantilla específica para Yahoo (versión activa en memoria)"""
+        store = template_registry.current
+        current_context().template_version = store.version
+        if name not in store:
+            logger.error(f"Failed to load yahoo prompt: {name} not found")
+        return store.get(name)
         
 
     def prepare_prompt_data(self, financial_data: Dict, request: Dict) -> Dict:
@@ -139,7 +149,7 @@ class YahooFetcher:
         data.update({
             "style": "technical" if request.get("detail_level") == "advanced" else "simple",
             "detail_level": request.get("detail_level", "simple"),
-            "input_language": detect(request.get("prompt", ""))
+            "input_language": detect_language(request.get("prompt", ""))
         })
         
         # Flatten key_metrics para el formateo
@@ -151,12 +161,6 @@ class YahooFetcher:
         return data
 
 
-    def _calculate_change(self, history) -> float:
-        """Cálculo de cambio porcentual"""
-        if len(history) < 2:
-            return 0.0
-        return ((history['Close'][-1] - history['Close'][0]) / history['Close'][0]) * 100
-
     def _format_market_cap(self, value: float) -> str:
         """Formatea la capitalización de mercado"""
         if not value:
@@ -0,0 +1,181 @@
+import os
+import time
+import asyncio
+import threading
+import contextvars
+import multiprocessing
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, TypeVar
+from loguru import logger
+
+T = TypeVar("T")
+
+# Named pools, override the size with EXECUTOR_<NAME>_WORKERS
+# - io:     network and disk (yfinance, arXiv, Stability, Chroma, Ollama...)
+# - nlp:    in-process model inference (KeyBERT, spaCy, embeddings); few
+#           workers since each one competes for the same cores
+# - market: Yahoo batch fetches and background cache refreshes, kept apart
+#           from io because io callers wait on them
+# - cpu:    pure-Python CPU work (PDF parsing) in separate processes so it
+#           does not hold the GIL of the server; arguments must be picklable
+EXECUTOR_POOLS = {
+    "io":     {"kind": "thread",  "workers": 32},
+    "nlp":    {"kind": "thread",  "workers": 4},
+    "market": {"kind": "thread",  "workers": 8},
+    "cpu":    {"kind": "process", "workers": max(1, (os.cpu_count() or 2) - 1)},
+}
+
+
+def _workers(name: str) -> int:
+    return int(os.getenv(f"EXECUTOR_{name.upper()}_WORKERS", EXECUTOR_POOLS[name]["workers"]))
+
+
+class NamedExecutor:
+    """
+    Size-bounded thread or process pool with queue-depth and saturation
+    counters. Thread tasks run in a copy of the caller's contextvars, so
+    the request context is visible inside them. Process pools report no
+    wait time (avg_wait_ms is None) and a run time from submit to result.
+    """
+
+    def __init__(self, name: str, kind: str, max_workers: int):
+        self.name = name
+        self.kind = kind
+        self.max_workers = max_workers
+        self._pool: Executor = None
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.running = 0
+        self.counters = {"submitted": 0, "completed": 0, "errors": 0, "peak_queue": 0, "wait_ms": 0.0, "run_ms": 0.0}
+
+    def _get_pool(self) -> Executor:
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    if self.kind == "process":
+                        # spawn: forking a process that runs threads and model weights is unsafe
+                        self._pool = ProcessPoolExecutor(self.max_workers, mp_context=multiprocessing.get_context("spawn"))
+                    else:
+                        self._pool = ThreadPoolExecutor(self.max_workers, thread_name_prefix=f"{self.name}-pool")
+                    logger.info(f"Executor '{self.name}' started ({self.kind}, {self.max_workers} workers)")
+        return self._pool
+
+    def _started(self, queued_at: float):
+        with self._lock:
+            self.queued -= 1
+            self.running += 1
+            self.counters["wait_ms"] += (time.perf_counter() - queued_at) * 1000
+
+    def _finished(self, started_at: float, failed: bool):
+        with self._lock:
+            self.running -= 1
+            self.counters["completed"] += 1
+            self.counters["errors"] += failed
+            self.counters["run_ms"] += (time.perf_counter() - started_at) * 1000
+
+    def _process_done(self, queued_at: float, future: Future):
+        with self._lock:
+            self.queued -= 1
+            self.counters["completed"] += 1
+            self.counters["errors"] += future.cancelled() or future.exception() is not None
+            self.counters["run_ms"] += (time.perf_counter() - queued_at) * 1000
+
+    def _in_progress(self) -> int:
+        if self.kind == "process":  # Queued counts every unfinished task
+            return min(self.queued, self.max_workers)
+        return self.running
+
+    def _queue_depth(self) -> int:
+        if self.kind == "process":
+            return self.queued - self._in_progress()
+        return self.queued
+
+    def _track(self, fn: Callable[..., T], queued_at: float) -> Callable[..., T]:
+        def tracked(*args, **kwargs) -> T:
+            self._started(queued_at)
+            started_at, failed = time.perf_counter(), True
+            try:
+                result = fn(*args, **kwargs)
+                failed = False
+                return result
+            finally:
+                self._finished(started_at, failed)
+        return tracked
+
+    def submit(self, fn: Callable[..., T], *args, **kwargs) -> Future:
+        """Schedules fn(*args, **kwargs) and returns a concurrent Future"""
+        pool = self._get_pool()
+        with self._lock:
+            self.counters["submitted"] += 1
+            self.queued += 1
+            self.counters["peak_queue"] = max(self.counters["peak_queue"], self._queue_depth())
+        queued_at = time.perf_counter()
+
+        if self.kind == "process":
+            # The function runs in another process: only submit -> done is visible here
+            future = pool.submit(fn, *args, **kwargs)
+            future.add_done_callback(lambda f: self._process_done(queued_at, f))
+            return future
+
+        context = contextvars.copy_context()
+        return pool.submit(context.run, self._track(fn, queued_at), *args, **kwargs)
+
+    async def run(self, fn: Callable[..., T], *args, **kwargs) -> T:
+        """Awaitable flavour of submit, for async handlers"""
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    def map(self, fn: Callable[..., T], *iterables) -> list:
+        """Blocking map preserving order (for callers already off the event loop)"""
+        futures = [self.submit(fn, *args) for args in zip(*iterables)]
+        return [future.result() for future in futures]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            completed = self.counters["completed"]
+            return {
+                "kind": self.kind,
+                "max_workers": self.max_workers,
+                "running": self._in_progress(),
+                "queue_depth": self._queue_depth(),
+                "saturation": round(self._in_progress() / self.max_workers, 3),
+                "submitted": self.counters["submitted"],
+                "completed": completed,
+                "errors": self.counters["errors"],
+                "peak_queue": self.counters["peak_queue"],
+                # Process pools only see submit -> done: the queue wait is not measurable
+                # there, and run time includes it
+                "avg_wait_ms": round(self.counters["wait_ms"] / completed, 2) if completed and self.kind == "thread" else None,
+                "avg_run_ms": round(self.counters["run_ms"] / completed, 2) if completed else None,
+                "started": self._pool is not None
+            }
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+_executors: Dict[str, NamedExecutor] = {}
+_executors_lock = threading.Lock()
+
+
+def get_executor(name: str) -> NamedExecutor:
+    """Process-wide pool by name (io, nlp, market, cpu); created on first use"""
+    with _executors_lock:
+        if name not in _executors:
+            config = EXECUTOR_POOLS[name]
+            _executors[name] = NamedExecutor(name, config["kind"], _workers(name))
+        return _executors[name]
+
+
+async def run_in(name: str, fn: Callable[..., T], *args, **kwargs) -> T:
+    """Runs a blocking call on a named pool without blocking the event loop"""
+    return await get_executor(name).run(fn, *args, **kwargs)
+
+
+def executor_stats() -> Dict[str, Dict[str, Any]]:
+    return {name: executor.stats() for name, executor in _executors.items()}
+
+
+def shutdown_executors():
+    for executor in _executors.values():
+        executor.shutdown()
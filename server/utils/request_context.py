@@ -0,0 +1,55 @@
+import os
+from contextvars import ContextVar, Token
+from dataclasses import dataclass
+from typing import Mapping, Optional
+
+TRUE_VALUES = {"1", "true", "yes", "on"}
+PRIORITIES = {"interactive", "batch"}
+# Priority of callers that do not send X-Request-Priority
+DEFAULT_REQUEST_PRIORITY = os.getenv("DEFAULT_REQUEST_PRIORITY", "batch")
+
+
+@dataclass
+class RequestContext:
+    """Per-request state shared by every component handling one HTTP request"""
+    bypass_cache: bool = False
+    priority: str = DEFAULT_REQUEST_PRIORITY
+    template_version: Optional[str] = None  # Prompt template snapshot used to answer
+    language: Optional[str] = None  # Detected once per request (see language_detector)
+    language_key: Optional[bytes] = None  # Hash of the text it was detected on
+
+
+_request_context: ContextVar[Optional[RequestContext]] = ContextVar("request_context", default=None)
+
+
+def current_context() -> RequestContext:
+    """Context of the running request (a default one outside of requests)"""
+    ctx = _request_context.get()
+    if ctx is None:
+        ctx = RequestContext()
+        _request_context.set(ctx)
+    return ctx
+
+
+def bind_context(ctx: RequestContext) -> Token:
+    return _request_context.set(ctx)
+
+
+def reset_context(token: Token):
+    _request_context.reset(token)
+
+
+def context_from_headers(headers: Mapping[str, str]) -> RequestContext:
+    """
+    Builds the request context from HTTP headers:
+    - X-Cache-Bypass: 1 or Cache-Control: no-cache skip the response caches
+    - X-Request-Priority: interactive | batch orders the Groq rate-limit queue
+    """
+    bypass = (
+        headers.get("x-cache-bypass", "").strip().lower() in TRUE_VALUES
+        or "no-cache" in headers.get("cache-control", "").lower()
+    )
+    priority = headers.get("x-request-priority", "").strip().lower()
+    if priority not in PRIORITIES:
+        priority = DEFAULT_REQUEST_PRIORITY
+    return RequestContext(bypass_cache=bypass, priority=priority)
@@ -0,0 +1,110 @@
+import asyncio
+import threading
+import concurrent.futures
+from typing import Any, Awaitable, Callable, Dict, Hashable, TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """
+    Collapses concurrent calls that share a key into a single execution:
+    the first caller (leader) runs the work, the others await its result.
+    Results are shared between callers, so treat them as read-only.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._async_calls: Dict[Hashable, asyncio.Future] = {}
+        self._sync_calls: Dict[Hashable, concurrent.futures.Future] = {}
+        self._lock = threading.Lock()
+        self.counters = {"calls": 0, "executions": 0, "coalesced": 0, "errors": 0}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        """Coroutine flavour, for callers living on the event loop"""
+        self.counters["calls"] += 1
+        future = self._async_calls.get(key)
+        if future is not None:
+            self.counters["coalesced"] += 1
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                # The leader was cancelled (client went away): run it ourselves
+                if future.cancelled():
+                    self.counters["coalesced"] -= 1
+                    self.counters["calls"] -= 1
+                    return await self.do(key, fn)
+                raise
+
+        future = asyncio.get_running_loop().create_future()
+        self._async_calls[key] = future
+        self.counters["executions"] += 1
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            self.counters["errors"] += 1
+            future.set_exception(e)
+            future.exception()  # Mark as retrieved when nobody else was waiting
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            self._async_calls.pop(key, None)
+
+    def do_sync(self, key: Hashable, fn: Callable[[], T]) -> T:
+        """Blocking flavour, for functions running in worker threads"""
+        with self._lock:
+            self.counters["calls"] += 1
+            future = self._sync_calls.get(key)
+            leader = future is None
+            if leader:
+                future = concurrent.futures.Future()
+                self._sync_calls[key] = future
+                self.counters["executions"] += 1
+            else:
+                self.counters["coalesced"] += 1
+
+        if not leader:
+            return future.result()
+
+        try:
+            result = fn()
+        except BaseException as e:
+            with self._lock:
+                self.counters["errors"] += 1
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._sync_calls.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        calls = self.counters["calls"]
+        return {
+            **self.counters,
+            "in_flight": len(self._async_calls) + len(self._sync_calls),
+            "coalesced_ratio": round(self.counters["coalesced"] / calls, 3) if calls else None
+        }
+
+
+_groups: Dict[str, SingleFlight] = {}
+_groups_lock = threading.Lock()
+
+
+def get_flight(name: str) -> SingleFlight:
+    """Named single-flight group shared by the whole process"""
+    with _groups_lock:
+        if name not in _groups:
+            _groups[name] = SingleFlight(name)
+        return _groups[name]
+
+
+def singleflight_stats() -> Dict[str, Dict[str, Any]]:
+    return {name: group.stats() for name, group in _groups.items()}
@@ -0,0 +1,69 @@
+import json
+import time
+import inspect
+from typing import Any, AsyncIterator, Callable, Dict, Optional
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+from loguru import logger
+
+
+def format_sse(event: str, data: Dict) -> str:
+    """Formats one Server-Sent Event with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+async def iter_text(text: str) -> AsyncIterator[str]:
+    """Wraps an already available text as a one-token stream"""
+    yield text
+
+
+async def stream_tokens(
+    tokens: AsyncIterator[str],
+    finalize: Optional[Callable[[str], Any]] = None
+) -> AsyncIterator[str]:
+    """
+    Relays LLM tokens as `token` events and closes with a `done` event.
+
+    `finalize` receives the full generated text and returns the metadata of
+    the final event (usually the same fields as the non-streaming response).
+    It may be a coroutine function.
+    """
+    start = time.perf_counter()
+    first_token_ms = None
+    parts = []
+
+    try:
+        async for token in tokens:
+            if first_token_ms is None:
+                first_token_ms = (time.perf_counter() - start) * 1000
+                logger.info(f"Time to first token: {first_token_ms:.0f} ms")
+            parts.append(token)
+            yield format_sse("token", {"token": token})
+
+        metadata = finalize("".join(parts)) if finalize else {}
+        if inspect.isawaitable(metadata):
+            metadata = await metadata
+    except HTTPException as e:
+        # Headers are already sent, so status codes such as 429 travel in the event
+        logger.warning(f"Streaming rejected: {e.detail}")
+        yield format_sse("error", {"detail": e.detail, "status_code": e.status_code, **(e.headers or {})})
+        return
+    except Exception as e:
+        logger.error(f"Streaming failed: {e}")
+        yield format_sse("error", {"detail": "Failed to generate response."})
+        return
+
+    yield format_sse("done", {
+        **metadata,
+        "time_to_first_token_ms": round(first_token_ms, 1) if first_token_ms is not None else None,
+        "total_time_ms": round((time.perf_counter() - start) * 1000, 1)
+    })
+
+
+def sse_response(events: AsyncIterator[str]) -> StreamingResponse:
+    """Wraps an SSE event iterator into an unbuffered streaming response"""
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
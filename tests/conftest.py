@@ -0,0 +1,10 @@
+"""
+Run from the repository root:
+
+    python -m pytest -q tests
+"""
+import os
+import sys
+
+# `server` is imported as a namespace package from the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,130 @@
+import pytest
+from server.database import ingestion_pipeline
+from server.database.chroma_db import (
+    EMBEDDING_SPACE, OLLAMA_EMBEDDING_MODEL, PooledOllamaEmbeddings, ingestion_lock, plan_ingestion,
+    reconcile_embedding_space
+)
+from server.database.ingestion_manifest import IngestionManifest, file_hash
+
+
+class FakeResponse:
+    status_code = 200
+    text = ""
+
+    def __init__(self, payload):
+        self.payload = payload
+
+    def json(self):
+        return self.payload
+
+
+class FakeSession:
+    def __init__(self, embeddings=None):
+        self.embeddings = embeddings
+        self.posts = []
+
+    def post(self, url, headers, json, timeout):
+        self.posts.append((url, json))
+        embeddings = self.embeddings if self.embeddings is not None else [[float(i), 1.0] for i in range(len(json["input"]))]
+        return FakeResponse({"embeddings": embeddings})
+
+
+def embeddings_over(session):
+    embeddings = PooledOllamaEmbeddings(model="nomic-embed-text", base_url="http://ollama:11434")
+    embeddings._session = session
+    return embeddings
+
+
+def test_a_batch_of_texts_is_one_embed_request():
+    session = FakeSession()
+    vectors = embeddings_over(session).embed_documents([f"chunk {i}" for i in range(64)])
+    assert len(vectors) == 64 and vectors[3] == [3.0, 1.0]
+    (url, payload), = session.posts
+    assert url == "http://ollama:11434/api/embed"
+    assert payload["model"] == "nomic-embed-text" and len(payload["input"]) == 64
+
+
+def test_query_goes_through_embed_too():
+    session = FakeSession()
+    assert embeddings_over(session).embed_query("inflation") == [0.0, 1.0]
+    assert len(session.posts[0][1]["input"]) == 1
+
+
+def test_missing_embeddings_are_an_error():
+    with pytest.raises(ValueError):
+        embeddings_over(FakeSession(embeddings=[[1.0]])).embed_documents(["a", "b"])
+
+
+def test_one_ingestion_lock_per_directory(tmp_path):
+    assert ingestion_lock(str(tmp_path)) is ingestion_lock(str(tmp_path / "."))
+    assert ingestion_lock(str(tmp_path)) is not ingestion_lock(str(tmp_path / "other"))
+
+
+class FakeStore:
+    """Chunk IDs per source, as the collection metadata would give them"""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.deleted = []
+
+    def get_all(self):
+        return {"metadatas": [{"source": source} for source, ids in self.chunks.items() for _ in ids]}
+
+    def ids_for_source(self, source):
+        return list(self.chunks.get(source, []))
+
+    def delete(self, ids):
+        self.deleted.extend(ids)
+
+
+class FakePipeline:
+    runs = []
+
+    def __init__(self, store, manifest):
+        pass
+
+    def run(self, sources):
+        FakePipeline.runs.append(sources)
+        return {}
+
+
+@pytest.fixture
+def pdfs(tmp_path):
+    paths = {}
+    for name in ("current", "raw", "adopted"):
+        path = tmp_path / f"{name}.pdf"
+        path.write_bytes(name.encode())
+        paths[name] = str(path)
+    return paths
+
+
+@pytest.fixture
+def manifest(tmp_path, pdfs):
+    manifest = IngestionManifest(str(tmp_path / "manifest" / "manifest.db"))
+    manifest.record(pdfs["current"], file_hash(pdfs["current"]), ["c-0"], EMBEDDING_SPACE)
+    manifest.record(pdfs["raw"], file_hash(pdfs["raw"]), ["r-0"], OLLAMA_EMBEDDING_MODEL)
+    return manifest
+
+
+def test_sources_stored_before_the_manifest_are_reindexed_in_the_same_run(pdfs, manifest):
+    store = FakeStore({pdfs["current"]: ["c-0"], pdfs["raw"]: ["r-0"], pdfs["adopted"]: ["a-0", "a-1"]})
+    plan = plan_ingestion(list(pdfs.values()), manifest, store)
+    assert plan["unchanged"] == [pdfs["current"]]
+    assert sorted(plan["changed"]) == sorted([
+        (pdfs["raw"], file_hash(pdfs["raw"]), ["r-0"]),
+        (pdfs["adopted"], file_hash(pdfs["adopted"]), ["a-0", "a-1"]),
+    ])
+
+
+def test_startup_reindexes_or_drops_chunks_of_another_vector_space(monkeypatch, tmp_path, pdfs, manifest):
+    gone = str(tmp_path / "deleted.pdf")
+    manifest.record(gone, "h", ["g-0"], OLLAMA_EMBEDDING_MODEL)
+    store = FakeStore({pdfs["current"]: ["c-0"], pdfs["raw"]: ["r-0"], pdfs["adopted"]: ["a-0"], gone: ["g-0"]})
+    monkeypatch.setattr(ingestion_pipeline, "IngestionPipeline", FakePipeline)
+    FakePipeline.runs = []
+
+    assert reconcile_embedding_space(manifest, store) == {"reindexed": 2, "removed": 1}
+    (run,) = FakePipeline.runs
+    assert sorted(source for source, _, _ in run) == sorted([pdfs["raw"], pdfs["adopted"]])
+    assert store.deleted == ["g-0"]
+    assert manifest.get(gone) is None
@@ -0,0 +1,22 @@
+import time
+from server.utils.executors import NamedExecutor
+
+
+def test_thread_pool_reports_wait_and_run_time():
+    executor = NamedExecutor("test-io", "thread", 2)
+    assert executor.map(abs, [-1, -2, -3]) == [1, 2, 3]
+    stats = executor.stats()
+    assert stats["completed"] == 3 and stats["avg_wait_ms"] is not None
+    executor.shutdown()
+
+
+def test_process_pool_does_not_report_a_wait_time():
+    executor = NamedExecutor("test-cpu", "process", 1)
+    assert executor.map(abs, [-1, -2]) == [1, 2]
+    deadline = time.monotonic() + 5
+    while executor.stats()["completed"] < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)  # Done callbacks may run just after result() returns
+    stats = executor.stats()
+    assert stats["completed"] == 2
+    assert stats["avg_wait_ms"] is None and stats["avg_run_ms"] is not None
+    executor.shutdown()
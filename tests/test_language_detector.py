@@ -0,0 +1,47 @@
+import pytest
+from server.services.language_detector import DEFAULT_LANGUAGE, LanguageDetector
+
+
+@pytest.fixture
+def detector():
+    return LanguageDetector()
+
+
+@pytest.mark.parametrize("text", [
+    "Federal Reserve policy",
+    "GDP growth in Argentina",
+    "Crypto regulation news",
+    "inflation",
+    "NVDA",
+    "$TSLA",
+    "AAPL MSFT 2024",
+    "Compare TSLA and AAPL",
+    "Explain compound interest for teenagers",
+    "",
+])
+def test_english_tickers_and_short_topics_fall_back_to_default(detector, text):
+    assert detector.detect(text) == DEFAULT_LANGUAGE == "en"
+
+
+@pytest.mark.parametrize("text, language", [
+    ("ciao", "it"),
+    ("Che cos'è l'inflazione?", "it"),
+    ("prezzo delle azioni tesla", "it"),
+    ("hola", "es"),
+    ("¿Qué es la inflación?", "es"),
+    ("explica la inflación a los jóvenes", "es"),
+    ("precio del bitcoin hoy", "es"),
+    ("bonjour", "fr"),
+    ("Qu'est-ce que l'inflation ?", "fr"),
+    ("la bourse de Paris", "fr"),
+    ("Что такое инфляция?", "ru"),
+    ("NVDA что это", "ru"),
+])
+def test_detects_supported_languages(detector, text, language):
+    assert detector.detect(text) == language
+
+
+def test_results_are_memoized(detector):
+    detector.detect("¿Qué es la inflación?")
+    detector.detect("¿Qué es la inflación?")
+    assert detector.stats()["cache_hits"] == 1
@@ -0,0 +1,165 @@
+import datetime
+from concurrent.futures import Future
+import pytest
+from server.services import market_cache as market_cache_module
+from server.services.market_backends import OfflineMarketBackend
+from server.services.market_cache import MarketDataCache, _ttl
+from server.services.price_store import PriceStore
+
+TODAY = datetime.date(2024, 6, 14)
+
+
+class FakeClock:
+    def __init__(self, now: float = 1_700_000_000.0):
+        self.now = now
+
+    def time(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+
+class InlinePool:
+    """Runs background refreshes right away, so tests can look at their effect"""
+
+    def __init__(self):
+        self.submitted = 0
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        self.submitted += 1
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(market_cache_module, "time", clock)
+    return clock
+
+
+def make_cache(tmp_path, backend=None):
+    backend = backend or OfflineMarketBackend(today=TODAY)
+    cache = MarketDataCache(
+        backend=backend,
+        prices=PriceStore(backend=backend, root=str(tmp_path / "prices")),
+        path=str(tmp_path / "market_data.sqlite3")
+    )
+    cache._pool = InlinePool()
+    return cache
+
+
+def fundamentals(name: str):
+    return {"name": name, "sector": "Technology"}
+
+
+def unavailable(ticker: str):
+    raise ConnectionError("Yahoo is down")
+
+
+def test_fresh_entries_do_not_call_the_backend(tmp_path, clock):
+    cache = make_cache(tmp_path, OfflineMarketBackend({"AAPL": fundamentals("Apple")}, today=TODAY))
+    assert cache.get("fundamentals", "AAPL")["name"] == "Apple"
+    clock.advance(_ttl("fundamentals", "ttl") - 1)
+    assert cache.get("fundamentals", "AAPL")["name"] == "Apple"
+    assert cache.backend.calls["fundamentals"] == 1
+    assert cache.counters["fresh_hits"] == 1 and cache.counters["misses"] == 1
+
+
+def test_stale_entry_is_served_then_refreshed(tmp_path, clock):
+    backend = OfflineMarketBackend({"AAPL": fundamentals("Apple")}, today=TODAY)
+    cache = make_cache(tmp_path, backend)
+    cache.get("fundamentals", "AAPL")
+    backend._fundamentals["AAPL"] = fundamentals("Apple Inc.")
+
+    clock.advance(_ttl("fundamentals", "ttl") + 1)
+    assert cache.get("fundamentals", "AAPL")["name"] == "Apple"  # Stale, served right away
+    assert cache._pool.submitted == 1 and cache.counters["refreshes"] == 1
+    assert cache.get("fundamentals", "AAPL")["name"] == "Apple Inc."  # Refreshed in the background
+    assert cache.counters["stale_hits"] == 1 and cache.counters["fresh_hits"] == 1
+    assert cache.age("fundamentals", "AAPL") == 0
+
+
+def test_failed_refresh_keeps_the_stale_entry(tmp_path, clock):
+    backend = OfflineMarketBackend({"AAPL": fundamentals("Apple")}, today=TODAY)
+    cache = make_cache(tmp_path, backend)
+    cache.get("fundamentals", "AAPL")
+    backend.fundamentals = unavailable
+
+    clock.advance(_ttl("fundamentals", "ttl") + 1)
+    assert cache.get("fundamentals", "AAPL")["name"] == "Apple"
+    assert cache.counters["refresh_errors"] == 1
+    assert not cache._refreshing
+
+
+def test_entry_past_max_stale_is_fetched_synchronously(tmp_path, clock):
+    backend = OfflineMarketBackend({"AAPL": fundamentals("Apple")}, today=TODAY)
+    cache = make_cache(tmp_path, backend)
+    cache.get("fundamentals", "AAPL")
+    backend._fundamentals["AAPL"] = fundamentals("Apple Inc.")
+
+    clock.advance(_ttl("fundamentals", "max_stale") + 1)
+    assert cache.get("fundamentals", "AAPL")["name"] == "Apple Inc."
+    assert cache._pool.submitted == 0
+    assert cache.counters["misses"] == 2 and cache.counters["stale_hits"] == 0
+
+
+def test_expired_entry_is_served_when_the_backend_is_down(tmp_path, clock):
+    backend = OfflineMarketBackend({"AAPL": fundamentals("Apple")}, today=TODAY)
+    cache = make_cache(tmp_path, backend)
+    cache.get("fundamentals", "AAPL")
+    backend.fundamentals = unavailable
+
+    clock.advance(_ttl("fundamentals", "max_stale") + 1)
+    assert cache.get("fundamentals", "AAPL")["name"] == "Apple"
+
+
+def test_restart_is_served_from_sqlite(tmp_path, clock):
+    first = make_cache(tmp_path, OfflineMarketBackend({"AAPL": fundamentals("Apple")}, today=TODAY))
+    first.get("fundamentals", "AAPL")
+    first.get("fundamentals", "MSFT")
+    clock.advance(60)
+
+    restarted = make_cache(tmp_path)
+    assert restarted.get("fundamentals", "AAPL")["name"] == "Apple"
+    assert restarted.backend.calls["fundamentals"] == 0
+    assert restarted.counters["fresh_hits"] == 1
+    assert restarted.age("fundamentals", "MSFT") == 60
+
+
+def test_restart_skips_entries_past_max_stale(tmp_path, clock):
+    make_cache(tmp_path).get("fundamentals", "AAPL")
+    clock.advance(_ttl("fundamentals", "max_stale") + 1)
+
+    restarted = make_cache(tmp_path)
+    assert restarted.age("fundamentals", "AAPL") is None
+    restarted.get("fundamentals", "AAPL")
+    assert restarted.backend.calls["fundamentals"] == 1
+
+
+def test_get_many_fetches_missing_quotes_in_one_download(tmp_path, clock):
+    cache = make_cache(tmp_path)
+    quotes = cache.get_many("quote", ["AAPL", "MSFT", "NVDA", "AAPL"])
+    assert list(quotes) == ["AAPL", "MSFT", "NVDA"]
+    assert all(quote["as_of"] == TODAY.isoformat() for quote in quotes.values())
+    assert cache.backend.calls["history"] == 1
+    assert cache.counters["batch_fetches"] == 1 and cache.counters["misses"] == 3
+
+    # Cached ones are not fetched again, only the new one
+    cache.get_many("quote", ["AAPL", "MSFT", "TSLA"])
+    assert cache.backend.calls["history"] == 2
+    assert cache.counters["fresh_hits"] == 2 and cache.counters["misses"] == 4
+
+
+def test_get_many_fundamentals_fetches_each_miss_once(tmp_path, clock):
+    cache = make_cache(tmp_path)
+    found = cache.get_many("fundamentals", ["AAPL", "MSFT"])
+    assert list(found) == ["AAPL", "MSFT"]
+    assert cache.backend.calls["fundamentals"] == 2
+    cache.get_many("fundamentals", ["AAPL", "MSFT"])
+    assert cache.backend.calls["fundamentals"] == 2
@@ -0,0 +1,63 @@
+import asyncio
+import pytest
+from server.services import model_router as router_module
+from server.services.lm_engine import Completion, GroqModel
+from server.services.model_router import ModelRouter
+from server.services.token_budget import PromptSection, budget_for, token_budgeter
+
+
+class FakeEngine:
+    """Records the prompts it gets; fails when asked to"""
+
+    def __init__(self, model: GroqModel, fail: bool = False):
+        self.model = model
+        self.fail = fail
+        self.prompts = []
+        self.ewma_latency_ms = None
+        self.ewma_error_rate = 0.0
+        self.last_failure_at = 0.0
+        self.requests = 0
+
+    async def complete(self, prompt, cache_scope=None, limits=None):
+        self.prompts.append(prompt)
+        if self.fail:
+            raise RuntimeError("boom")
+        return Completion(text="ok", model=self.model.value)
+
+
+@pytest.fixture
+def engines(monkeypatch):
+    engines = {model: FakeEngine(model) for model in GroqModel}
+    monkeypatch.setattr(router_module, "get_engine", lambda model: engines[GroqModel(model)])
+    return engines
+
+
+def long_sections():
+    return [
+        PromptSection("rules", "Answer briefly."),
+        PromptSection("knowledge", "market context " * 3000, priority=1, trimmable=True),
+        PromptSection("request", "What moved the market today?"),
+    ]
+
+
+def test_sections_are_fitted_to_the_model_that_runs_them(engines):
+    completion = asyncio.run(ModelRouter().complete(long_sections(), preferred=GroqModel.LLAMA3_70B, latency_budget_ms=60000))
+    assert completion.model == GroqModel.LLAMA3_70B.value
+    prompt, = engines[GroqModel.LLAMA3_70B].prompts
+    assert prompt == token_budgeter.fit(long_sections(), GroqModel.LLAMA3_70B)
+    assert token_budgeter.count(prompt) > budget_for(GroqModel.LLAMA3_8B)
+
+
+def test_failover_refits_to_the_smaller_budget(engines):
+    engines[GroqModel.LLAMA3_70B].fail = True
+    completion = asyncio.run(ModelRouter().complete(long_sections(), preferred=GroqModel.LLAMA3_70B, latency_budget_ms=60000))
+    assert completion.model == GroqModel.LLAMA3_8B.value  # Fastest fallback
+    prompt, = engines[GroqModel.LLAMA3_8B].prompts
+    assert prompt == token_budgeter.fit(long_sections(), GroqModel.LLAMA3_8B)
+    assert len(prompt) < len(engines[GroqModel.LLAMA3_70B].prompts[0])
+    assert prompt.endswith("What moved the market today?")
+
+
+def test_text_prompts_are_sent_as_is(engines):
+    asyncio.run(ModelRouter().complete("hello", preferred=GroqModel.LLAMA3_8B))
+    assert engines[GroqModel.LLAMA3_8B].prompts == ["hello"]
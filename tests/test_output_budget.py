@@ -0,0 +1,30 @@
+import pytest
+from server.services.output_budget import (
+    AUDIENCE_OUTPUT_FACTORS, CHARS_PER_TOKEN, MIN_OUTPUT_TOKENS, PLATFORM_OUTPUT_TOKENS, limits_for
+)
+from server.services.token_budget import FALLBACK_CHARS_PER_TOKEN
+
+TWEET_CHARS = 280
+
+
+@pytest.mark.parametrize("language", ["en", "es", "fr", "it", "ru"])
+@pytest.mark.parametrize("audience", list(AUDIENCE_OUTPUT_FACTORS))
+def test_a_full_tweet_fits_in_every_language_and_audience(language, audience):
+    max_tokens = limits_for("twitter", audience, language).max_tokens
+    assert max_tokens >= TWEET_CHARS / CHARS_PER_TOKEN[language]
+    assert max_tokens >= TWEET_CHARS / FALLBACK_CHARS_PER_TOKEN
+
+
+def test_tweets_for_children_are_not_cut_shorter():
+    assert limits_for("twitter", "08-11", "es") == limits_for("twitter", "26-85", "es")
+    assert limits_for("twitter", "08-11", "es").max_tokens > limits_for("twitter", "08-11", "en").max_tokens
+
+
+def test_unknown_language_gets_the_most_room():
+    assert limits_for("twitter", "20-25").max_tokens == limits_for("twitter", "20-25", "ru").max_tokens
+
+
+def test_platforms_without_a_character_target_scale_with_the_audience():
+    assert limits_for("linkedin", "08-11", "en").max_tokens == round(PLATFORM_OUTPUT_TOKENS["linkedin"] * 0.6)
+    assert limits_for("linkedin", "26-85", "en").max_tokens == round(PLATFORM_OUTPUT_TOKENS["linkedin"] * 1.2)
+    assert limits_for(None, "08-11").max_tokens >= MIN_OUTPUT_TOKENS
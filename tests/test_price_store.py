@@ -0,0 +1,63 @@
+import datetime
+import os
+import numpy as np
+from server.services.market_backends import OfflineMarketBackend
+from server.services.price_store import CLOSE, DAY, PriceStore
+
+TODAY = datetime.date(2024, 6, 14)
+
+
+def store(root, today=TODAY) -> PriceStore:
+    return PriceStore(OfflineMarketBackend(today=today), root=str(root))
+
+
+def test_update_writes_a_new_version_and_keeps_old_views_valid(tmp_path):
+    prices = store(tmp_path)
+    prices.update(["AAPL"])
+    view = prices.range("AAPL")
+    last_close = float(view[CLOSE][-1])
+
+    prices.backend.today = TODAY + datetime.timedelta(days=3)
+    prices.update(["AAPL"], force=True)
+    assert float(view[CLOSE][-1]) == last_close  # Old map still readable
+    assert prices.range("AAPL")[DAY][-1] > view[DAY][-1]
+    assert len([name for name in os.listdir(tmp_path) if name.endswith(".npy")]) == 1
+
+
+def test_reopen_maps_the_latest_version(tmp_path):
+    prices = store(tmp_path)
+    prices.update(["BRK.B", "BRK"])
+    prices.backend.today = TODAY + datetime.timedelta(days=3)
+    prices.update(["BRK.B"], force=True)
+
+    reopened = store(tmp_path)
+    assert reopened.range("BRK.B")[DAY][-1] == prices.range("BRK.B")[DAY][-1]
+    assert reopened.range("BRK")[DAY][-1] < reopened.range("BRK.B")[DAY][-1]
+
+
+def test_unversioned_files_are_still_read(tmp_path):
+    block = store(tmp_path / "tmp").backend.history(["MSFT"], None, "1mo")["MSFT"]
+    np.save(tmp_path / "MSFT.npy", block)
+    prices = store(tmp_path)
+    assert prices.range("MSFT").shape == block.shape
+
+    prices.update(["MSFT"], force=True)
+    assert not (tmp_path / "MSFT.npy").exists()
+
+
+def test_old_versions_that_cannot_be_deleted_are_retried(tmp_path, monkeypatch):
+    prices = store(tmp_path)
+    prices.update(["AAPL"])
+    real_remove = os.remove
+
+    def locked(path):  # What Windows does with a mapped file
+        raise PermissionError(path)
+
+    monkeypatch.setattr(os, "remove", locked)
+    prices.update(["AAPL"], force=True)
+    assert prices.stats()["old_versions_undeleted"] == 1
+
+    monkeypatch.setattr(os, "remove", real_remove)
+    prices.update(["AAPL"], force=True)
+    assert prices.stats()["old_versions_undeleted"] == 0
+    assert len([name for name in os.listdir(tmp_path) if name.endswith(".npy")]) == 1
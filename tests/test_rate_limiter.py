@@ -0,0 +1,122 @@
+import asyncio
+import pytest
+from server.services import rate_limiter as limiter_module
+from server.services.rate_limiter import ModelRateLimiter, Priority, RateLimitExceeded, TokenBucket
+
+real_sleep = asyncio.sleep
+
+
+class FakeClock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def perf_counter(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+    async def sleep(self, seconds: float):
+        """The dispatcher's wait for a refill, without the wait"""
+        self.advance(seconds)
+        await real_sleep(0)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(limiter_module, "time", clock)
+    return clock
+
+
+def test_bucket_refills_at_its_rate_up_to_capacity(clock):
+    bucket = TokenBucket(60)
+    bucket.take(60)
+    assert bucket.wait_time(30) == 30.0
+    clock.advance(15)
+    assert bucket.wait_time(30) == 15.0
+    clock.advance(3600)
+    bucket._refill()
+    assert bucket.level == 60
+
+
+def test_debt_is_paid_back_before_new_takes(clock):
+    bucket = TokenBucket(60)
+    bucket.take(90)
+    assert bucket.wait_time(10) == 40.0
+
+
+def test_interactive_callers_are_served_before_batch_ones(clock, monkeypatch):
+    monkeypatch.setattr(asyncio, "sleep", clock.sleep)
+    limiter = ModelRateLimiter("model", rpm=1, tpm=100_000)
+    served = []
+
+    async def call(name, priority):
+        await limiter.acquire(10, priority)
+        served.append(name)
+
+    async def main():
+        await limiter.acquire(10)  # Empties the request bucket
+        await asyncio.gather(
+            call("batch", Priority.BATCH),
+            call("batch 2", Priority.BATCH),
+            call("interactive", Priority.INTERACTIVE),
+        )
+
+    asyncio.run(main())
+    assert served == ["interactive", "batch", "batch 2"]
+    assert limiter.counters["granted"] == 4 and limiter.counters["queued"] == 3
+
+
+def test_a_wait_past_the_timeout_is_a_429_with_retry_after(clock):
+    limiter = ModelRateLimiter("model", rpm=1, tpm=100_000, max_wait_s=0.01)
+
+    async def main():
+        await limiter.acquire(10)
+        with pytest.raises(RateLimitExceeded) as error:
+            await limiter.acquire(10)
+        return error.value
+
+    error = asyncio.run(main())
+    assert error.status_code == 429
+    # One request per minute was just spent: the next slot is a minute away
+    assert error.headers["Retry-After"] == "60"
+    assert limiter.counters["timed_out"] == 1
+
+
+def test_a_full_queue_counts_the_callers_ahead_in_retry_after(clock):
+    limiter = ModelRateLimiter("model", rpm=1, tpm=100_000, max_queue_depth=1)
+
+    async def main():
+        await limiter.acquire(10)
+        waiting = asyncio.ensure_future(limiter.acquire(10))
+        await real_sleep(0)
+        with pytest.raises(RateLimitExceeded) as error:
+            await limiter.acquire(10)
+        waiting.cancel()
+        return error.value
+
+    error = asyncio.run(main())
+    assert error.headers["Retry-After"] == "120"
+    assert limiter.counters["rejected"] == 1
+
+
+def test_retry_after_follows_the_token_bucket_too(clock):
+    limiter = ModelRateLimiter("model", rpm=30, tpm=6000)
+    limiter.tokens.take(6000)
+    assert limiter.retry_after(3000) == 30
+
+
+def test_settle_refunds_over_estimated_tokens(clock):
+    limiter = ModelRateLimiter("model", rpm=30, tpm=6000)
+    asyncio.run(limiter.acquire(1000))
+    assert limiter.tokens.level == 5000
+
+    limiter.settle(reserved=1000, used=300)
+    assert limiter.tokens.level == 5700
+
+    limiter.settle(reserved=100, used=400)
+    assert limiter.tokens.level == 5400
@@ -0,0 +1,70 @@
+import pytest
+from server.services import resources as resources_module
+from server.services.resources import ResourceRegistry, ResourceUnavailable
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def perf_counter(self) -> float:
+        return self.now
+
+
+class Flaky:
+    def __init__(self, failures: int):
+        self.failures = failures
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise ConnectionError("Ollama is down")
+        return "store"
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(resources_module, "time", clock)
+    return clock
+
+
+def test_failed_build_is_cached_until_the_retry_interval(clock):
+    registry = ResourceRegistry(retry_s=30)
+    factory = Flaky(failures=1)
+    registry.register("vector_store", factory, required=False)
+
+    with pytest.raises(ConnectionError):
+        registry.get("vector_store")
+    for _ in range(3):
+        with pytest.raises(ResourceUnavailable):
+            registry.get("vector_store")
+    assert factory.calls == 1
+
+    clock.now += 31
+    assert registry.get("vector_store") == "store"
+    assert factory.calls == 2
+
+
+def test_optional_resources_do_not_block_readiness(clock):
+    registry = ResourceRegistry()
+    registry.register("keybert", lambda: "model")
+    registry.register("vector_store", Flaky(failures=10), required=False)
+    assert not registry.ready()
+
+    registry._warm("keybert")
+    registry._warm("vector_store")
+    assert registry.ready()
+    stats = registry.stats()["resources"]
+    assert stats["vector_store"]["state"] == "failed" and not stats["vector_store"]["required"]
+
+
+def test_required_failure_keeps_the_instance_unready(clock):
+    registry = ResourceRegistry()
+    registry.register("spacy_en", Flaky(failures=1))
+    registry._warm("spacy_en")
+    assert not registry.ready()
@@ -0,0 +1,63 @@
+import asyncio
+import pytest
+from server.services import response_cache as response_cache_module
+from server.services.response_cache import ResponseCache
+
+
+class FakeClock:
+    def __init__(self, now: float = 1_700_000_000.0):
+        self.now = now
+
+    def time(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(response_cache_module, "time", clock)
+    return clock
+
+
+def rows(cache: ResponseCache) -> int:
+    return cache._connect().execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+
+def test_async_tiers(tmp_path, clock):
+    path = str(tmp_path / "responses.sqlite3")
+    cache = ResponseCache(path)
+    asyncio.run(cache.aset("k", "answer", ttl=60, model="m", scope="basic", finish_reason="length"))
+    assert asyncio.run(cache.aget("k")) == ("answer", "length")
+    assert cache.counters["memory_hits"] == 1
+
+    restarted = ResponseCache(path)
+    assert asyncio.run(restarted.aget("k")) == ("answer", "length")
+    assert asyncio.run(restarted.aget("k")) == ("answer", "length")
+    assert restarted.counters["disk_hits"] == 1 and restarted.counters["memory_hits"] == 1
+    assert asyncio.run(restarted.aget("other")) is None
+    assert restarted.counters["misses"] == 1
+
+
+def test_expired_entries_are_misses(tmp_path, clock):
+    cache = ResponseCache(str(tmp_path / "responses.sqlite3"))
+    cache.set("k", "answer", ttl=60)
+    clock.now += 61
+    assert cache.get("k") is None
+    assert cache.counters["expired"] == 2  # Memory and disk
+    assert cache.counters["misses"] == 1
+
+
+def test_expired_rows_are_purged_every_n_writes(tmp_path, clock):
+    cache = ResponseCache(str(tmp_path / "responses.sqlite3"), purge_every=3)
+    cache.set("old", "answer", ttl=10)
+    clock.now += 11
+    cache.set("a", "answer", ttl=60)
+    assert rows(cache) == 2  # Not purged on every write
+    cache.set("b", "answer", ttl=60)
+    assert rows(cache) == 2 and cache.counters["purged"] == 1
+
+
+def test_expires_at_is_indexed(tmp_path, clock):
+    cache = ResponseCache(str(tmp_path / "responses.sqlite3"))
+    plan = cache._connect().execute("EXPLAIN QUERY PLAN DELETE FROM responses WHERE expires_at <= 0").fetchall()
+    assert any("responses_expires_at" in row[-1] for row in plan)
@@ -0,0 +1,49 @@
+import pytest
+from server.tools.ticker_index import TickerIndex
+
+
+@pytest.fixture(scope="module")
+def index():
+    return TickerIndex()
+
+
+@pytest.mark.parametrize("text, tickers", [
+    # Aliases of the former ticker_map
+    ("meta earnings", ["META"]),
+    ("appl", ["AAPL"]),
+    ("apple", ["AAPL"]),
+    ("micro stock", ["MSFT"]),
+    ("amazon", ["AMZN"]),
+    ("amz shares", ["AMZN"]),
+    ("google", ["GOOGL"]),
+    ("tesla", ["TSLA"]),
+    ("facebook", ["META"]),
+    ("nvidia", ["NVDA"]),
+    ("sp500", ["^GSPC"]),
+    ("s&p500", ["^GSPC"]),
+    ("dow jones", ["^DJI"]),
+    ("nasdaq", ["^IXIC"]),
+    ("btc", ["BTC-USD"]),
+    ("ethereum", ["ETH-USD"]),
+    # Everyday words next to a finance word or another ticker
+    ("Apple stock price", ["AAPL"]),
+    ("How did the dow close in the market today?", ["^DJI"]),
+    ("acciones de amazon", ["AMZN"]),
+    ("le cours d'apple en bourse", ["AAPL"]),
+    ("Compare apple and MSFT", ["AAPL", "MSFT"]),
+    ("Compare Apple and Microsoft", ["AAPL", "MSFT"]),
+])
+def test_resolves(index, text, tickers):
+    assert index.find(text) == tickers
+
+
+@pytest.mark.parametrize("text", [
+    "apple pie",
+    "amazon rainforest",
+    "dow of tao",
+    "Ford Coppola films",
+    "a method to learn",
+    "What is inflation?",
+])
+def test_everyday_words_without_finance_context(index, text):
+    assert index.find(text) == []
@@ -0,0 +1,110 @@
+import sys
+import types
+from concurrent.futures import Future
+from server.services import token_budget as budget_module
+from server.services.prompt_builder import PromptBuilder
+from server.services.token_budget import PromptSection, TokenBudgeter, budget_for, token_budgeter
+
+
+class FakeClock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+
+class InlinePool:
+    """Runs background loads right away and counts them"""
+
+    def __init__(self):
+        self.submitted = 0
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        self.submitted += 1
+        future = Future()
+        future.set_result(fn(*args, **kwargs))
+        return future
+
+
+class FakeEncoding:
+    def encode(self, text, disallowed_special=()):
+        return text.split()
+
+    def decode(self, tokens):
+        return " ".join(tokens)
+
+
+def fake_tiktoken(monkeypatch, fail: bool):
+    def get_encoding(name):
+        if fail:
+            raise OSError("offline")
+        return FakeEncoding()
+    monkeypatch.setitem(sys.modules, "tiktoken", types.SimpleNamespace(get_encoding=get_encoding))
+
+
+def persona_sections():
+    return PromptBuilder().build_sections(
+        "How did the stock market do today?", platform="twitter", age_range="26-85", region="us", language="en"
+    )
+
+
+def test_knowledge_outlives_persona_sections_on_the_8b_budget():
+    sections = persona_sections()
+    persona = {section.name: section.text for section in sections if section.name in ("dialect", "platform", "age")}
+    knowledge = "Index closed 1.2% higher on strong earnings. " * 90
+    sections += [
+        PromptSection("knowledge", f"CONTEXT FROM KNOWLEDGE BASE:\n{knowledge}", priority=1, trimmable=True),
+        PromptSection("request", "USER REQUEST:\nHow did the stock market do today?"),
+    ]
+    assert sum(token_budgeter.count(section.text) for section in sections) > budget_for("llama-3.1-8b-instant")
+
+    prompt = token_budgeter.fit(sections, "llama-3.1-8b-instant")
+
+    assert knowledge in prompt
+    assert persona["dialect"] not in prompt
+    assert persona["platform"] not in prompt
+
+
+def test_market_data_goes_before_documents():
+    sections = [
+        PromptSection("rules", "Be balanced."),
+        PromptSection("market_data", "AAPL 190.1 " * 200, priority=2, trimmable=True),
+        PromptSection("documents", "Filing excerpt. " * 200, priority=1, trimmable=True),
+        PromptSection("question", "Question: Is AAPL overvalued?"),
+    ]
+
+    prompt = token_budgeter.fit(sections, budget=token_budgeter.count(sections[2].text) + 20)
+
+    assert "Filing excerpt. " * 200 in prompt
+    assert "AAPL 190.1" not in prompt
+
+
+def test_encoding_loads_off_the_caller_and_retries_with_backoff(monkeypatch):
+    clock, pool = FakeClock(), InlinePool()
+    monkeypatch.setattr(budget_module, "time", clock)
+    monkeypatch.setattr(budget_module, "get_executor", lambda name: pool)
+    budgeter = TokenBudgeter()
+    fake_tiktoken(monkeypatch, fail=True)
+
+    assert budgeter.count("one two three four") == 5  # Length estimate while the load fails
+    assert pool.submitted == 1
+    budgeter.count("again")
+    assert pool.submitted == 1  # Backing off
+
+    clock.advance(budget_module.TOKENIZER_RETRY_S)
+    budgeter.count("again")
+    assert pool.submitted == 2
+    clock.advance(budget_module.TOKENIZER_RETRY_S)
+    budgeter.count("again")
+    assert pool.submitted == 2  # The second failure doubled the wait
+
+    fake_tiktoken(monkeypatch, fail=False)
+    clock.advance(budget_module.TOKENIZER_RETRY_S)
+    budgeter.count("again")
+    assert pool.submitted == 3
+    assert budgeter.count("one two three four") == 4
+    assert budgeter.stats()["tokenizer_failures"] == 0